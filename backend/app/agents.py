@@ -1,12 +1,12 @@
 import json
-from typing import Any, Dict, List
+from typing import Any, Dict, List, Tuple
 from sqlalchemy.orm import Session
 from .config import settings
-from .llm_router import call_with_fallbacks, models_from_csv
-from .persian import normalize_persian_spacing, strip_speaker_ids
+from .llm_router import call_with_fallbacks, models_from_csv, model_map_from_csv, is_json, parse_json, TruncatedOutput
+from .langs import lang_name, clean_translation
 
 def strategist(db: Session, job_id: str, risk_level: str, text: str) -> dict:
-    sys = "You are Strategist Agent for EN→FA subtitles. Be precise and structured."
+    sys = "You are Strategist Agent for translating English subtitles. Be precise and structured."
     usr = f'''
 Output STRICT JSON:
 {{
@@ -32,19 +32,20 @@ Transcript:
     content = call_with_fallbacks(
         db, job_id, None, "strategist", primary, fallbacks,
         [{"role":"system","content":sys},{"role":"user","content":usr}],
-        temperature=0.1, max_tokens=800, meta={"risk_level": risk_level}
+        temperature=0.1, max_tokens=800, meta={"risk_level": risk_level},
+        validate=is_json,
     )
-    return json.loads(content.strip())
+    return parse_json(content)
 
-def terminologist(db: Session, job_id: str, difficulty: int, transcript: str) -> dict:
-    sys = "You are Terminologist Agent for EN→FA subtitles. Build a strict bilingual glossary."
+def terminologist(db: Session, job_id: str, difficulty: int, transcript: str, lang: str = "fa") -> dict:
+    sys = f"You are Terminologist Agent for EN→{lang.upper()} subtitles. Build a strict bilingual glossary."
     usr = f'''
-Extract specialized terms and output STRICT JSON:
+Extract specialized terms with their {lang_name(lang)} equivalents and output STRICT JSON:
 {{
   "terms": [
     {{
       "en_term": "...",
-      "fa_term": "...",
+      "target_term": "...",
       "term_type": "jargon|product|acronym|name|other",
       "mandatory": true,
       "confidence": 0-100,
@@ -61,81 +62,154 @@ Transcript:
     content = call_with_fallbacks(
         db, job_id, None, "terminologist", primary, fallbacks,
         [{"role":"system","content":sys},{"role":"user","content":usr}],
-        temperature=0.1, max_tokens=1400, meta={"difficulty": difficulty}
+        temperature=0.1, max_tokens=1400, meta={"difficulty": difficulty, "lang": lang},
+        validate=is_json,
     )
-    return json.loads(content.strip())
+    return parse_json(content)
 
-def translator(db: Session, job_id: str, difficulty: int, glossary: List[Dict[str, Any]], cues: List[Dict[str, Any]]) -> Dict[str, str]:
-    sys = "You are Translator Agent for EN→FA subtitles. Follow glossary strictly. No speaker IDs."
-    glossary_text = "\n".join([f"- {t['en_term']} => {t['fa_term']}" for t in glossary]) if glossary else "(none)"
+TRANSLATOR_SYS = "You are Translator Agent for EN→{lang} subtitles. Follow glossary strictly. No speaker IDs."
+
+def estimate_tokens(text: str) -> int:
+    # ~4 chars/token for English and JSON; good enough for packing, no tokenizer dependency.
+    return max(1, (len(text or "") + 3) // 4)
+
+def glossary_block(glossary: List[Dict[str, Any]]) -> str:
+    return "\n".join([f"- {t['en_term']} => {t['fa_term']}" for t in glossary]) if glossary else "(none)"
+
+def translator_models(difficulty: int) -> Tuple[str, List[str]]:
+    if difficulty <= 3:
+        return settings.model_translator_easy, ["google/gemini-3-flash", "deepseek/deepseek-v3.2"]
+    if difficulty <= 7:
+        return settings.model_translator_mid, models_from_csv(settings.fallback_translator_mid)
+    return settings.model_translator_hard, models_from_csv(settings.fallback_translator_hard)
+
+def translator_output_budget(difficulty: int) -> int:
+    # The smallest limit along the fallback chain, so any model can finish a packed batch.
+    primary, fallbacks = translator_models(difficulty)
+    limits = model_map_from_csv(settings.translator_model_max_output_tokens)
+    return min(int(limits.get(m, settings.translator_max_output_tokens)) for m in [primary] + fallbacks)
+
+def pack_translation_batches(difficulty: int, glossary: List[Dict[str, Any]], cues: List[Dict[str, Any]]) -> List[List[Dict[str, Any]]]:
+    max_out = int(translator_output_budget(difficulty) * 0.85)
+    max_in = int(settings.translator_max_input_tokens) - estimate_tokens(TRANSLATOR_SYS + glossary_block(glossary)) - 100
+    max_cues = max(1, int(settings.translation_batch_max_cues))
+    batches: List[List[Dict[str, Any]]] = []
+    cur: List[Dict[str, Any]] = []
+    cur_in = cur_out = 0
+    for c in cues:
+        c_in = estimate_tokens(json.dumps(c, ensure_ascii=False))
+        c_out = int(estimate_tokens(c["en_text"]) * settings.translator_output_token_ratio) + estimate_tokens(json.dumps(c["cue_id"])) + 4
+        if cur and (len(cur) >= max_cues or cur_in + c_in > max_in or cur_out + c_out > max_out):
+            batches.append(cur)
+            cur, cur_in, cur_out = [], 0, 0
+        cur.append(c)
+        cur_in += c_in
+        cur_out += c_out
+    if cur:
+        batches.append(cur)
+    return batches
+
+def translator(db: Session, job_id: str, difficulty: int, glossary: List[Dict[str, Any]], cues: List[Dict[str, Any]], lang: str = "fa") -> Dict[str, str]:
+    name = lang_name(lang)
     usr = f'''
-Translate cues to Persian. Output STRICT JSON mapping cue_id -> Persian text. No markdown.
+Translate cues to {name}. Output STRICT JSON mapping cue_id -> {name} text. No markdown.
 
 Glossary (MANDATORY):
-{glossary_text}
+{glossary_block(glossary)}
 
 Cues JSON:
 {json.dumps(cues, ensure_ascii=False)}
 '''
-    if difficulty <= 3:
-        primary = settings.model_translator_easy
-        fallbacks = ["google/gemini-3-flash", "deepseek/deepseek-v3.2"]
-    elif difficulty <= 7:
-        primary = settings.model_translator_mid
-        fallbacks = models_from_csv(settings.fallback_translator_mid)
-    else:
-        primary = settings.model_translator_hard
-        fallbacks = models_from_csv(settings.fallback_translator_hard)
-
+    primary, fallbacks = translator_models(difficulty)
     content = call_with_fallbacks(
         db, job_id, None, "translator", primary, fallbacks,
-        [{"role":"system","content":sys},{"role":"user","content":usr}],
-        temperature=0.2, max_tokens=2600, meta={"difficulty": difficulty, "batch_size": len(cues)}
+        [{"role":"system","content":TRANSLATOR_SYS.format(lang=lang.upper())},{"role":"user","content":usr}],
+        temperature=0.2, max_tokens=translator_output_budget(difficulty), meta={"difficulty": difficulty, "batch_size": len(cues), "lang": lang},
+        validate=is_json,
     )
-    obj = json.loads(content.strip())
-    out = {}
-    for k,v in obj.items():
-        s = normalize_persian_spacing(strip_speaker_ids(str(v)))
-        out[str(k)] = s
+    # call_with_fallbacks raises TruncatedOutput for cut-off JSON and moves on to the next model for anything
+    # else that is not JSON, so the content parses here.
+    obj = parse_json(content)
+    return {str(k): clean_translation(v, lang) for k, v in obj.items()}
+
+def translate_adaptive(db: Session, job_id: str, difficulty: int, glossary: List[Dict[str, Any]], cues: List[Dict[str, Any]], lang: str = "fa") -> Dict[str, str]:
+    # Splits a batch in half when its output comes back truncated; re-asks only for cues left out.
+    try:
+        out = translator(db, job_id, difficulty, glossary, cues, lang)
+    except TruncatedOutput:
+        if len(cues) <= 1:
+            raise
+        mid = len(cues) // 2
+        return {
+            **translate_adaptive(db, job_id, difficulty, glossary, cues[:mid], lang),
+            **translate_adaptive(db, job_id, difficulty, glossary, cues[mid:], lang),
+        }
+    missing = [c for c in cues if c["cue_id"] not in out]
+    if missing and len(missing) < len(cues):
+        out.update(translate_adaptive(db, job_id, difficulty, glossary, missing, lang))
     return out
 
-def qa_polisher(db: Session, job_id: str, difficulty: int, glossary: List[Dict[str, Any]], cues: List[Dict[str, Any]], translations: Dict[str, str]) -> dict:
-    sys = "You are QA & Polisher Agent for EN→FA subtitles. Fix meaning, glossary compliance, punctuation, subtitle readability."
-    glossary_text = "\n".join([f"- {t['en_term']} => {t['fa_term']}" for t in glossary]) if glossary else "(none)"
+def qa_models(difficulty: int) -> Tuple[str, List[str]]:
+    if difficulty <= 3:
+        return settings.model_qa_easy, ["anthropic/claude-haiku-4.5"]
+    return settings.model_qa_hard, models_from_csv(settings.fallback_qa_hard)
+
+def qa_output_budget(cues: List[Dict[str, Any]]) -> int:
+    # Per owned cue: the polished text plus a score and an issues entry, each keyed by cue_id; 25% headroom.
+    est = 40
+    for c in cues:
+        if c.get("context_only"):
+            continue
+        key = estimate_tokens(json.dumps(c["cue_id"])) + 4
+        est += 3 * key + int(estimate_tokens(c["en_text"]) * settings.translator_output_token_ratio) + 12
+    return min(int(est * 1.25), int(settings.qa_max_output_tokens))
+
+def qa_polisher(db: Session, job_id: str, difficulty: int, glossary: List[Dict[str, Any]], cues: List[Dict[str, Any]], translations: Dict[str, str], lang: str = "fa") -> dict:
+    sys = f"You are QA & Polisher Agent for EN→{lang.upper()} subtitles. Fix meaning, glossary compliance, punctuation, subtitle readability."
     payload = {"cues": cues, "translations": translations}
     usr = f'''
-Output STRICT JSON:
+Output STRICT JSON ({lang_name(lang)} text in "polished"):
 {{
-  "polished": {{ "cue_id": "fa_text" }},
+  "polished": {{ "cue_id": "text" }},
   "qa_scores": {{ "cue_id": 0-100 }},
   "issues": {{ "cue_id": ["..."] }}
 }}
+Cues with "context_only": true are neighbouring lines shown for context. Do NOT include them in the output.
 
 Glossary (MANDATORY):
-{glossary_text}
+{glossary_block(glossary)}
 
 Input JSON:
 {json.dumps(payload, ensure_ascii=False)}
 '''
-    if difficulty <= 3:
-        primary = settings.model_qa_easy
-        fallbacks = ["anthropic/claude-haiku-4.5"]
-    else:
-        primary = settings.model_qa_hard
-        fallbacks = models_from_csv(settings.fallback_qa_hard)
-
+    primary, fallbacks = qa_models(difficulty)
     content = call_with_fallbacks(
         db, job_id, None, "qa_polisher", primary, fallbacks,
         [{"role":"system","content":sys},{"role":"user","content":usr}],
-        temperature=0.1, max_tokens=2600, meta={"difficulty": difficulty}
+        temperature=0.1, max_tokens=qa_output_budget(cues), meta={"difficulty": difficulty, "shard_size": sum(1 for c in cues if not c.get("context_only")), "lang": lang},
+        validate=is_json,
     )
-    obj = json.loads(content.strip())
-    polished = {}
-    for k,v in obj.get("polished", {}).items():
-        polished[str(k)] = normalize_persian_spacing(strip_speaker_ids(str(v)))
-    obj["polished"] = polished
+    obj = parse_json(content)
+    obj["polished"] = {str(k): clean_translation(v, lang) for k, v in obj.get("polished", {}).items()}
     return obj
 
+def qa_adaptive(db: Session, job_id: str, difficulty: int, glossary: List[Dict[str, Any]], cues: List[Dict[str, Any]], translations: Dict[str, str], lang: str = "fa") -> dict:
+    # Like translate_adaptive: a truncated shard is split in half; each half keeps the other as context.
+    try:
+        return qa_polisher(db, job_id, difficulty, glossary, cues, translations, lang)
+    except TruncatedOutput:
+        core = [c["cue_id"] for c in cues if not c.get("context_only")]
+        if len(core) <= 1:
+            raise
+        out: Dict[str, Dict[str, Any]] = {"polished": {}, "qa_scores": {}, "issues": {}}
+        mid = len(core) // 2
+        for half in (set(core[:mid]), set(core[mid:])):
+            part = [{**c, "context_only": True} if c["cue_id"] not in half else c for c in cues]
+            res = qa_adaptive(db, job_id, difficulty, glossary, part, translations, lang)
+            for k in out:
+                out[k].update(res.get(k) or {})
+        return out
+
 def librarian_should_store(qa_score, issues) -> bool:
     if qa_score is None or float(qa_score) < 85:
         return False
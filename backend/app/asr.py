@@ -1,19 +1,125 @@
+import re, shutil, subprocess, wave
+from abc import ABC, abstractmethod
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
 import assemblyai as aai
 from .config import settings
+from .concurrency import run_bounded
 
-def transcribe_with_assemblyai(audio_path: str) -> dict:
-    aai.settings.api_key = settings.assemblyai_api_key
-    config = aai.TranscriptionConfig(
-        punctuate=True,
-        format_text=True,
-        speaker_labels=False,
-        language_code="en_us",
+class ASRBackend(ABC):
+    name = "base"
+
+    @abstractmethod
+    def transcribe(self, audio_path: str) -> dict:
+        # -> {"text": str, "words": [{"text", "start", "end"} in ms]}
+        ...
+
+class AssemblyAIBackend(ASRBackend):
+    name = "assemblyai"
+
+    def transcribe(self, audio_path: str) -> dict:
+        aai.settings.api_key = settings.assemblyai_api_key
+        config = aai.TranscriptionConfig(
+            punctuate=True,
+            format_text=True,
+            speaker_labels=False,
+            language_code="en_us",
+        )
+        t = aai.Transcriber().transcribe(audio_path, config=config)
+        if t.status == aai.TranscriptStatus.error:
+            raise RuntimeError(t.error)
+        out = {"text": t.text or "", "words": []}
+        if getattr(t, "words", None):
+            for w in t.words:
+                out["words"].append({"text": w.text, "start": w.start, "end": w.end})
+        return out
+
+_BACKENDS: Dict[str, Callable[[], ASRBackend]] = {"assemblyai": AssemblyAIBackend}
+
+def register_backend(name: str, factory: Callable[[], ASRBackend]):
+    _BACKENDS[name] = factory
+
+def get_backend(name: Optional[str] = None) -> ASRBackend:
+    name = name or settings.asr_backend
+    if name not in _BACKENDS:
+        raise ValueError(f"Unknown ASR backend {name!r}; known: {sorted(_BACKENDS)}")
+    return _BACKENDS[name]()
+
+def wav_duration_s(path: str) -> float:
+    with wave.open(path, "rb") as w:
+        return w.getnframes() / float(w.getframerate())
+
+def detect_silences(path: str, noise_db: int = -35, min_silence_s: float = 0.4) -> List[Tuple[float, float]]:
+    r = subprocess.run(
+        ["ffmpeg", "-hide_banner", "-nostats", "-i", path, "-af", f"silencedetect=noise={noise_db}dB:d={min_silence_s}", "-f", "null", "-"],
+        capture_output=True, text=True, check=True,
     )
-    t = aai.Transcriber().transcribe(audio_path, config=config)
-    if t.status == aai.TranscriptStatus.error:
-        raise RuntimeError(t.error)
-    out = {"text": t.text or "", "words": []}
-    if getattr(t, "words", None):
-        for w in t.words:
-            out["words"].append({"text": w.text, "start": w.start, "end": w.end})
-    return out
+    starts = [float(x) for x in re.findall(r"silence_start: ([\d.]+)", r.stderr)]
+    ends = [float(x) for x in re.findall(r"silence_end: ([\d.]+)", r.stderr)]
+    return list(zip(starts, ends))
+
+def plan_cuts(duration_s: float, silences: List[Tuple[float, float]], target_s: float, search_s: float) -> List[float]:
+    # Cut points near every target_s, moved to the middle of the closest silence within search_s.
+    mids = [(a + b) / 2 for a, b in silences]
+    cuts: List[float] = []
+    pos = target_s
+    while pos < duration_s - target_s / 4:
+        near = [m for m in mids if abs(m - pos) <= search_s and (not cuts or m > cuts[-1] + target_s / 4)]
+        cut = min(near, key=lambda m: abs(m - pos)) if near else pos
+        cuts.append(cut)
+        pos = cut + target_s
+    return cuts
+
+def write_chunk(src: str, dst: Path, start_s: float, end_s: float):
+    with wave.open(src, "rb") as r:
+        rate = r.getframerate()
+        r.setpos(int(start_s * rate))
+        frames = r.readframes(int((end_s - start_s) * rate))
+        with wave.open(str(dst), "wb") as w:
+            w.setparams(r.getparams())
+            w.writeframes(frames)
+
+def stitch(chunks: List[Tuple[float, float, float, dict]]) -> dict:
+    # chunks: (offset_s, keep_from_s, keep_to_s, transcript). Every chunk overlaps its
+    # neighbours; a word belongs to the chunk whose keep window contains its midpoint.
+    words: List[dict] = []
+    for offset, keep_from, keep_to, tr in chunks:
+        for w in tr.get("words") or []:
+            start = int(w["start"] + offset * 1000)
+            end = int(w["end"] + offset * 1000)
+            mid = (start + end) / 2000
+            if keep_from <= mid < keep_to:
+                words.append({"text": w["text"], "start": start, "end": end})
+    words.sort(key=lambda w: w["start"])
+    return {"text": " ".join(w["text"] for w in words), "words": words}
+
+def transcribe(audio_path: str, backend: Optional[ASRBackend] = None) -> dict:
+    backend = backend or get_backend()
+    duration = wav_duration_s(audio_path)
+    if settings.asr_chunk_s <= 0 or duration < settings.asr_chunk_min_s:
+        return backend.transcribe(audio_path)
+
+    cuts = plan_cuts(duration, detect_silences(audio_path), settings.asr_chunk_s, settings.asr_chunk_search_s)
+    bounds = [0.0] + cuts + [duration]
+    ov = float(settings.asr_chunk_overlap_s)
+    chunk_dir = Path(audio_path).parent / "asr_chunks"
+    chunk_dir.mkdir(exist_ok=True)
+    plan = []
+    for i, (a, b) in enumerate(zip(bounds, bounds[1:])):
+        lo, hi = max(0.0, a - ov), min(duration, b + ov)
+        path = chunk_dir / f"chunk_{i:04d}.wav"
+        write_chunk(audio_path, path, lo, hi)
+        plan.append({"path": str(path), "offset": lo, "keep": (a, b if i < len(bounds) - 2 else float("inf"))})
+
+    results = {}
+    try:
+        for item, tr, err in run_bounded(lambda it: backend.transcribe(it["path"]), plan, settings.asr_max_in_flight, retries=1):
+            if err is not None:
+                raise RuntimeError(f"ASR failed for {item['path']}: {err}") from err
+            results[item["path"]] = tr
+    finally:
+        shutil.rmtree(chunk_dir, ignore_errors=True)
+    return stitch([(it["offset"], it["keep"][0], it["keep"][1], results[it["path"]]) for it in plan])
+
+def transcribe_with_assemblyai(audio_path: str) -> dict:
+    return AssemblyAIBackend().transcribe(audio_path)
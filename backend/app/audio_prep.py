@@ -1,19 +1,24 @@
-import subprocess
-from .storage import job_workdir
+import hashlib, os, subprocess
+from .storage import job_workdir, link_or_copy
 from .config import settings
 
 def ffmpeg_normalize(input_path: str, job_id: str) -> str:
     wd = job_workdir(job_id)
     out = wd / "normalized.wav"
+    if settings.audio_prep_passthrough:
+        return link_or_copy(input_path, out)
+    # Written beside and renamed over normalized.wav, which may be a hard link into the content store.
+    tmp = wd / "normalized.part.wav"
     cmd = [
         "ffmpeg-normalize", input_path,
-        "-o", str(out),
+        "-o", str(tmp),
         "-f",
         "-nt", "ebu",
         "-ar", "16000",
         "-c:a", "pcm_s16le",
     ]
     subprocess.check_call(cmd)
+    os.replace(tmp, out)
     return str(out)
 
 def cobra_vad_optional(input_wav: str, job_id: str) -> str:
@@ -22,3 +27,15 @@ def cobra_vad_optional(input_wav: str, job_id: str) -> str:
         return input_wav
     # If you install pv-cobra, implement trimming here.
     return input_wav
+
+def decoded_audio_sha256(input_path: str) -> str:
+    # Hash of the decoded mono 16 kHz PCM stream: identical for the same audio in another container.
+    cmd = ["ffmpeg", "-hide_banner", "-nostats", "-loglevel", "error", "-i", input_path,
+           "-vn", "-ac", "1", "-ar", "16000", "-f", "s16le", "-"]
+    h = hashlib.sha256()
+    with subprocess.Popen(cmd, stdout=subprocess.PIPE) as p:
+        while chunk := p.stdout.read(1 << 20):
+            h.update(chunk)
+    if p.returncode:
+        raise subprocess.CalledProcessError(p.returncode, cmd)
+    return h.hexdigest()
@@ -0,0 +1,229 @@
+import argparse, itertools, json, os, random, resource, shutil, subprocess, sys, tempfile, time, wave
+from pathlib import Path
+from typing import Any, Dict, List
+from urllib.request import Request, urlopen
+from uuid import uuid4
+from sqlalchemy import event, func, select, text
+from . import fake_openrouter
+from .asr import ASRBackend, register_backend
+from .config import settings
+from .db import SessionLocal, engine, init_db
+from .langs import parse_langs
+from .models import Job, JobCue
+from .pipeline import run_pipeline
+from .run_log import recorder
+from .storage import ensure_dirs, job_workdir
+from .telemetry import job_profile
+
+# Offline benchmark: runs run_pipeline end to end on generated episodes against app.fake_openrouter and a replayed
+# ASR transcript (no ffmpeg, no API keys). Each episode runs in its own process, so peak RSS is per episode.
+
+VOCAB = """the a we you they it this that and but so because when then now here there just really very
+about into over under after before with without from for of to in on at by is are was were be been have has
+had do does did can could will would should make take look see know think want need use build run start stop
+keep move turn show find give tell work call try ask data model system server user table query index cache
+queue worker job file page image video audio speech word line time day week year team plan step part point
+case rule test result change error value number list set map key type class method""".split()
+TERMS = ["Kubernetes", "Postgres", "Terraform", "Prometheus", "Grafana", "Redis", "Docker", "OAuth", "Celery", "FastAPI"]
+
+def synthetic_words(n_cues: int, seed: int = 0, repeat: float = 0.1, word_ms: int = 320, gap_ms: int = 800) -> List[Dict[str, Any]]:
+    # One short sentence per cue, separated by pauses the segmenter cuts at; `repeat` of them reuse an earlier one.
+    rng = random.Random(seed)
+    words: List[Dict[str, Any]] = []
+    said: List[List[str]] = []
+    t = 0
+    for _ in range(n_cues):
+        if said and rng.random() < repeat:
+            sent = rng.choice(said)
+        else:
+            sent = [rng.choice(VOCAB) for _ in range(rng.randint(4, 9))]
+            if rng.random() < 0.3:
+                sent.insert(rng.randrange(len(sent)), rng.choice(TERMS))
+            sent[0] = sent[0][:1].upper() + sent[0][1:]
+            said.append(sent)
+        for i, w in enumerate(sent):
+            words.append({"text": w + ("." if i == len(sent) - 1 else ""), "start": t, "end": t + word_ms - 40})
+            t += word_ms
+        t += gap_ms
+    return words
+
+def write_silence_wav(path: Path, seconds: float = 1.0):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(16000)
+        w.writeframes(b"\0\0" * int(16000 * seconds))
+
+class ReplayASR(ASRBackend):
+    # Stands in for AssemblyAI: returns a fixed word list after an optional delay.
+    name = "bench"
+
+    def __init__(self, words: List[Dict[str, Any]], delay_s: float = 0.0):
+        self.words, self.delay_s = words, delay_s
+
+    def transcribe(self, audio_path: str) -> dict:
+        time.sleep(self.delay_s)
+        return {"text": " ".join(w["text"] for w in self.words), "words": list(self.words)}
+
+def fake_stats(path: str = "stats") -> Dict[str, Any]:
+    url = f"{settings.openrouter_base_url.rstrip('/')}/{path}"
+    try:
+        with urlopen(Request(url, data=b"{}" if path == "reset" else None), timeout=5) as r:
+            return json.loads(r.read())
+    except OSError:
+        return {}  # not the fake server: HTTP counts are simply not reported
+
+def peak_rss_mb() -> float:
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024  # KiB on Linux
+
+def run_episode(n_cues: int, langs: List[str], seed: int, repeat: float, asr_delay_s: float, keep_tm: bool) -> Dict[str, Any]:
+    init_db()
+    ensure_dirs()
+    if not keep_tm:
+        # Start every episode from an empty TM so runs stay comparable.
+        with engine.begin() as conn:
+            conn.execute(text("TRUNCATE tm_entries, embedding_cache CASCADE"))
+    words = synthetic_words(n_cues, seed, repeat)
+    register_backend("bench", lambda: ReplayASR(words, asr_delay_s))
+    job_id = str(uuid4())
+    audio = job_workdir(job_id) / "input.wav"
+    write_silence_wav(audio)
+    with SessionLocal() as s:
+        s.add(Job(job_id=job_id, input_type="upload", input_uri=str(audio), target_lang=langs[0], target_langs=langs))
+        s.commit()
+
+    statements = itertools.count()
+    event.listen(engine, "after_cursor_execute", lambda *a: next(statements))
+    fake_stats("reset")
+    rss0 = peak_rss_mb()
+    t0 = time.perf_counter()
+    error = None
+    with SessionLocal() as s:
+        try:
+            run_pipeline(s, job_id)
+        except Exception as e:
+            error = f"{type(e).__name__}: {e}"
+    wall = time.perf_counter() - t0
+    db_statements = next(statements)
+    recorder.flush()
+    http = fake_stats()
+
+    with SessionLocal() as s:
+        prof = job_profile(s, job_id)
+        cues = s.execute(select(func.count()).where(JobCue.job_id == job_id, JobCue.target_lang == langs[0])).scalar_one()
+    llm = prof["llm"]
+    return {
+        "job_id": job_id, "requested_cues": n_cues, "cues": cues, "langs": langs, "error": error,
+        "wall_s": round(wall, 3), "cues_per_s": round(cues * len(langs) / wall, 2) if wall else None,
+        "db_statements": db_statements, "db_statements_in_stages": sum(st["db_queries"] for st in prof["stages"]),
+        "llm_calls": sum(r["calls"] for r in llm), "llm_errors": sum(r["errors"] for r in llm),
+        "prompt_tokens": sum(r["prompt_tokens"] for r in llm), "completion_tokens": sum(r["completion_tokens"] for r in llm),
+        "cost_usd": round(prof["cost_usd"], 6), "http": http,
+        "rss_before_mb": round(rss0, 1), "peak_rss_mb": round(peak_rss_mb(), 1),
+        "stages": [
+            {"name": st["name"], "wall_s": round(st["wall_s"], 3), "busy_s": round(st["busy_s"], 3), "db_queries": st["db_queries"],
+             "llm_calls": st.get("llm_calls", 0), "errors": st["errors"]}
+            for st in prof["stages"]
+        ],
+    }
+
+def print_report(r: Dict[str, Any]):
+    http = r.get("http") or {}
+    status = ", ".join(f"{k}: {v}" for k, v in sorted((http.get("status") or {}).items()))
+    print(f"\n== {r['cues']} cues x {len(r['langs'])} lang(s) ({','.join(r['langs'])}): {r['wall_s']:.1f}s, {r['cues_per_s']} cues/s"
+          + (f"  FAILED: {r['error']}" if r["error"] else ""))
+    print(f"   LLM calls {r['llm_calls']} ({r['llm_errors']} failed), tokens {r['prompt_tokens']}/{r['completion_tokens']}, ${r['cost_usd']:.4f}"
+          + (f"; HTTP requests {http.get('requests', 0)} ({status})" if http else ""))
+    print(f"   DB statements {r['db_statements']} ({r['db_statements_in_stages']} inside stages); peak RSS {r['peak_rss_mb']:.0f} MiB"
+          f" (baseline {r['rss_before_mb']:.0f})")
+    print(f"   {'stage':<22}{'wall_s':>9}{'busy_s':>9}{'db_q':>8}{'llm':>6}")
+    for st in r["stages"]:
+        print(f"   {st['name']:<22}{st['wall_s']:>9.2f}{st['busy_s']:>9.2f}{st['db_queries']:>8}{st['llm_calls']:>6}"
+              + ("  !" if st["errors"] else ""))
+
+def wait_for(url: str, timeout_s: float = 15.0):
+    deadline = time.monotonic() + timeout_s
+    while True:
+        try:
+            with urlopen(url, timeout=1):
+                return
+        except OSError:
+            if time.monotonic() > deadline:
+                raise
+            time.sleep(0.1)
+
+def main():
+    ap = argparse.ArgumentParser(
+        description="Benchmark run_pipeline offline against a fake OpenRouter and a replayed ASR transcript.",
+        parents=[fake_openrouter.build_parser(add_help=False)],
+    )
+    ap.add_argument("--cues", default="100,1000,10000", help="comma-separated episode sizes")
+    ap.add_argument("--langs", default=None, help="target languages (default DEFAULT_TARGET_LANGS)")
+    ap.add_argument("--repeat", type=float, default=0.1, help="fraction of cues that repeat an earlier line")
+    ap.add_argument("--asr-delay-s", type=float, default=0.0)
+    ap.add_argument("--set", action="append", default=[], metavar="KEY=VALUE", help="setting override for the episodes, e.g. TRANSLATE_MAX_IN_FLIGHT=12")
+    ap.add_argument("--openrouter-url", default="", help="use this (already running) API instead of starting the fake")
+    ap.add_argument("--keep-tm", action="store_true", help="do not empty the TM and embedding cache before each episode")
+    ap.add_argument("--allow-any-db", action="store_true", help="run even if POSTGRES_DB does not contain 'bench'")
+    ap.add_argument("--data-dir", default="", help="default: a temporary directory, removed afterwards")
+    ap.add_argument("--json", default="", help="also write the full results here")
+    ap.add_argument("--episode", type=int, help=argparse.SUPPRESS)
+    ap.add_argument("--out", help=argparse.SUPPRESS)
+    args = ap.parse_args()
+
+    if args.episode is not None:
+        if "bench" not in settings.postgres_db and not args.allow_any_db:
+            sys.exit(f"refusing to benchmark against database {settings.postgres_db!r} (it empties the TM); "
+                     "use a separate POSTGRES_DB containing 'bench' or pass --allow-any-db")
+        if settings.asr_backend != "bench":
+            sys.exit("run episodes through `python -m app.bench`, which configures the fakes")
+        r = run_episode(args.episode, parse_langs(args.langs), args.seed, args.repeat, args.asr_delay_s, args.keep_tm)
+        Path(args.out).write_text(json.dumps(r), encoding="utf-8")
+        return
+
+    server = None
+    url = args.openrouter_url
+    if not url:
+        fake_keys = vars(fake_openrouter.build_parser().parse_args([]))
+        cmd = [sys.executable, "-m", "app.fake_openrouter"] + [f"--{k.replace('_', '-')}={getattr(args, k)}" for k in fake_keys]
+        server = subprocess.Popen(cmd)
+        url = f"http://{args.host}:{args.port}/api/v1"
+        wait_for(f"{url}/stats")
+    data_dir = args.data_dir or tempfile.mkdtemp(prefix="subtitle-bench-")
+    env = {
+        **os.environ, "OPENROUTER_BASE_URL": url, "OPENROUTER_API_KEY": os.environ.get("OPENROUTER_API_KEY", "bench"),
+        "ASR_BACKEND": "bench", "AUDIO_PREP_PASSTHROUGH": "true", "CONTENT_STORE_ENABLED": "false",
+        "LLM_CACHE_ENABLED": "false", "DATA_DIR": data_dir,
+    }
+    for kv in args.set:
+        k, sep, v = kv.partition("=")
+        if not sep:
+            ap.error(f"--set expects KEY=VALUE, got {kv!r}")
+        env[k.upper()] = v
+
+    results = []
+    try:
+        for n in [int(x) for x in args.cues.split(",") if x.strip()]:
+            with tempfile.NamedTemporaryFile(suffix=".json") as out:
+                cmd = [sys.executable, "-m", "app.bench", "--episode", str(n), "--out", out.name, "--seed", str(args.seed),
+                       "--repeat", str(args.repeat), "--asr-delay-s", str(args.asr_delay_s)]
+                cmd += (["--langs", args.langs] if args.langs else []) + (["--keep-tm"] if args.keep_tm else [])
+                cmd += ["--allow-any-db"] if args.allow_any_db else []
+                rc = subprocess.run(cmd, env=env).returncode
+                if rc:
+                    sys.exit(rc)
+                r = json.loads(Path(out.name).read_text(encoding="utf-8"))
+            r["settings"] = args.set
+            results.append(r)
+            print_report(r)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+        if not args.data_dir:
+            shutil.rmtree(data_dir, ignore_errors=True)
+    if args.json:
+        Path(args.json).write_text(json.dumps(results, indent=2), encoding="utf-8")
+
+if __name__ == "__main__":
+    main()
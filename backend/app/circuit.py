@@ -0,0 +1,70 @@
+import logging, time, threading
+from typing import Dict, List, Optional
+import redis
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+class CircuitBreaker:
+    # Failure counts and open circuits live in Redis so every worker and job sees them;
+    # if Redis is unreachable we fall back to this process's own view.
+    def __init__(self, prefix: str = "llm:cb"):
+        self.prefix = prefix
+        self._redis: Optional[redis.Redis] = None
+        self._lock = threading.Lock()
+        self._fails: Dict[str, List[float]] = {}
+        self._open_until: Dict[str, float] = {}
+
+    def _r(self) -> redis.Redis:
+        if self._redis is None:
+            self._redis = redis.Redis.from_url(settings.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        return self._redis
+
+    def is_open(self, model: str) -> bool:
+        if not settings.llm_circuit_enabled:
+            return False
+        try:
+            return bool(self._r().exists(f"{self.prefix}:open:{model}"))
+        except redis.RedisError:
+            with self._lock:
+                return self._open_until.get(model, 0) > time.monotonic()
+
+    def available(self, models: List[str]) -> List[str]:
+        # Never return an empty chain: if everything is tripped, try them all anyway.
+        ok = [m for m in models if not self.is_open(m)]
+        return ok or list(models)
+
+    def record_success(self, model: str):
+        if not settings.llm_circuit_enabled:
+            return
+        try:
+            self._r().delete(f"{self.prefix}:fails:{model}")
+        except redis.RedisError:
+            with self._lock:
+                self._fails.pop(model, None)
+
+    def record_failure(self, model: str):
+        if not settings.llm_circuit_enabled:
+            return
+        window = int(settings.llm_circuit_window_s)
+        cooldown = int(settings.llm_circuit_cooldown_s)
+        try:
+            key = f"{self.prefix}:fails:{model}"
+            pipe = self._r().pipeline()
+            pipe.incr(key)
+            pipe.expire(key, window)
+            fails = int(pipe.execute()[0])
+            if fails >= int(settings.llm_circuit_fail_threshold):
+                self._r().set(f"{self.prefix}:open:{model}", fails, ex=cooldown)
+                self._r().delete(key)
+                log.warning("circuit open for %s for %ss after %s failures", model, cooldown, fails)
+        except redis.RedisError:
+            now = time.monotonic()
+            with self._lock:
+                recent = [t for t in self._fails.get(model, []) if now - t < window] + [now]
+                self._fails[model] = recent
+                if len(recent) >= int(settings.llm_circuit_fail_threshold):
+                    self._open_until[model] = now + cooldown
+                    self._fails.pop(model, None)
+
+breaker = CircuitBreaker()
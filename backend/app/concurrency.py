@@ -0,0 +1,35 @@
+import contextvars, time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+from typing import Callable, Iterable, Iterator, Optional, Tuple, TypeVar
+
+T = TypeVar("T")
+R = TypeVar("R")
+
+def run_bounded(
+    fn: Callable[[T], R],
+    items: Iterable[T],
+    max_in_flight: int,
+    retries: int = 0,
+) -> Iterator[Tuple[T, Optional[R], Optional[Exception]]]:
+    # Yields (item, result, error) in completion order; one failing item never cancels the others.
+    items = list(items)
+    if not items:
+        return
+
+    def attempt(item: T) -> Tuple[Optional[R], Optional[Exception]]:
+        err: Optional[Exception] = None
+        for n in range(retries + 1):
+            if n:
+                time.sleep(min(2 ** n, 10))
+            try:
+                return fn(item), None
+            except Exception as e:
+                err = e
+        return None, err
+
+    workers = max(1, min(int(max_in_flight), len(items)))
+    with ThreadPoolExecutor(max_workers=workers) as ex:
+        futs = {ex.submit(contextvars.copy_context().run, attempt, it): it for it in items}
+        for f in as_completed(futs):
+            res, err = f.result()
+            yield futs[f], res, err
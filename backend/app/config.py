@@ -10,6 +10,19 @@ class Settings(BaseSettings):
 
     app_env: str = "local"
     data_dir: str = "/data"
+    default_target_langs: str = "fa"  # comma-separated; a job may override with its own list
+    # GET /jobs/{id}/cues only returns rows older than this, so a slow-committing batch can't be skipped by the cursor.
+    cues_since_settle_s: float = 2.0
+    upload_chunk_size: int = 8 * 1024 * 1024
+    # Resumable uploads untouched for this long are deleted (checked whenever a new upload starts).
+    upload_partial_ttl_h: float = 24.0
+    # POST /jobs/ingest: server-side paths must live under one of these roots (comma-separated).
+    ingest_path_roots: str = "/data"
+    # URL ingest makes the audio worker fetch arbitrary URLs, so it is off by default. Only hosts resolving to public
+    # addresses are fetched (every redirect hop is checked); optionally only these hosts ("*.example.com" allowed).
+    ingest_url_enabled: bool = False
+    ingest_url_allowed_hosts: str = ""
+    ingest_url_max_redirects: int = 5
 
     postgres_host: str = "postgres"
     postgres_port: int = 5432
@@ -22,17 +35,94 @@ class Settings(BaseSettings):
     celery_result_backend: str = "redis://redis:6379/2"
 
     openrouter_base_url: str = "https://openrouter.ai/api/v1"
+    llm_timeout_s: float = 180.0
+    llm_max_attempts: int = 3
+    llm_max_in_flight: int = 32
+    llm_max_in_flight_per_model: int = 8
+    llm_rate_limit_rps: float = 0.0  # 0 disables the token bucket
+    llm_rate_limit_burst: int = 10
+    # LLMRun rows are buffered and bulk-inserted by a background writer.
+    llm_run_flush_s: float = 1.0
+    llm_run_batch_size: int = 500
+    llm_run_queue_max: int = 50000
+    # Batches that hit a transient DB error are retried with exponential backoff, then dropped (counted in /metrics).
+    llm_run_retries: int = 5
+    llm_run_retry_max_s: float = 60.0
+    # Hedging: if the primary is slower than its own p{percentile} latency, race the first fallback.
+    llm_hedge_enabled: bool = False
+    llm_hedge_percentile: float = 0.9
+    llm_hedge_min_samples: int = 20
+    llm_hedge_default_delay_s: float = 30.0
+    # USD per 1M tokens, "model=prompt/completion,..."; only used when OpenRouter's usage has no cost.
+    llm_prices: str = ""
+    # Opt-in response cache keyed by (agent, model, temperature, max_tokens, input_sha).
+    llm_cache_enabled: bool = False
+    llm_cache_agents: str = ""  # comma-separated agent names; empty = every agent
+    llm_cache_max_temperature: float = 0.3
+    llm_cache_ttl_s: int = 30 * 24 * 3600  # 0 = no expiry
+    llm_cache_max_entries: int = 200000
+    llm_cache_prune_every: int = 500
+    llm_circuit_enabled: bool = True
+    llm_circuit_fail_threshold: int = 5
+    llm_circuit_window_s: int = 120
+    llm_circuit_cooldown_s: int = 300
     embedding_model: str = "openai/text-embedding-3-large"
+    embedding_dimensions: int = 3072
+    embedding_batch_size: int = 256
+    embedding_cache_lru_size: int = 20000
 
     tm_auto_reuse_threshold: float = 0.88
     tm_judge_threshold: float = 0.82
+    tm_topk: int = 8
+    tm_lookup_chunk_size: int = 500
+    # "halfvec" can be HNSW-indexed up to 4000 dims, "vector" only up to 2000.
+    tm_vector_type: str = "halfvec"
+    tm_hnsw_m: int = 16
+    tm_hnsw_ef_construction: int = 64
+    tm_hnsw_ef_search: int = 100
+    # pgvector >= 0.8: keep scanning the index until k rows pass the target_lang filter ("strict_order", or "off").
+    tm_hnsw_iterative_scan: str = "relaxed_order"
+
+    # Reuse normalized audio / ASR across uploads of the same file (content hash) or, optionally,
+    # the same decoded audio in another container (audio fingerprint).
+    content_store_enabled: bool = True
+    fingerprint_decoded_audio: bool = False
+
+    # Use the uploaded file as normalized.wav without ffmpeg (it must already be a 16 kHz mono WAV); for benchmarks.
+    audio_prep_passthrough: bool = False
+
+    asr_backend: str = "assemblyai"
+    # Recordings longer than asr_chunk_min_s are cut at silences into ~asr_chunk_s pieces
+    # (overlapping by asr_chunk_overlap_s) and transcribed concurrently. 0 disables chunking.
+    asr_chunk_s: int = 600
+    asr_chunk_min_s: int = 1200
+    asr_chunk_overlap_s: float = 2.0
+    asr_chunk_search_s: int = 60
+    asr_max_in_flight: int = 8
 
     max_lines: int = 2
     max_chars_per_line: int = 42
     target_cps: float = 15.0
     min_cue_ms: int = 900
     max_cue_ms: int = 6500
-    translation_batch_size: int = 20
+    # Token-aware packing: the token limits below size each batch; translation_batch_max_cues is only a safety cap.
+    translation_batch_max_cues: int = 80
+    translator_max_input_tokens: int = 12000
+    translator_max_output_tokens: int = 2600
+    translator_model_max_output_tokens: str = ""  # "model=tokens,model=tokens"
+    translator_output_token_ratio: float = 2.5  # Persian output tokens per English input token
+    translation_dedupe: bool = True
+    # Normalized lines matching this regex are translated per occurrence (context-dependent meaning).
+    translation_dedupe_exclude_regex: str = ""
+    translate_max_in_flight: int = 6
+    translate_batch_retries: int = 1
+    qa_shard_size: int = 40
+    qa_shard_overlap: int = 3
+    qa_max_in_flight: int = 4
+    qa_shard_retries: int = 1
+    # QA max_tokens is estimated per shard (polished text + score + issues per cue), capped here;
+    # shards that still come back truncated are split in half and retried.
+    qa_max_output_tokens: int = 8000
 
     model_strategist_low: str = "google/gemini-3-flash"
     model_strategist_high: str = "deepseek/deepseek-r1-0528"
@@ -53,6 +143,8 @@ class Settings(BaseSettings):
     fallback_qa_hard: str = "anthropic/claude-sonnet-4.5,openai/gpt-5.2"
 
     model_tm_judge: str = "google/gemini-3-flash"
+    tm_judge_batch_size: int = 25
+    tm_judge_max_in_flight: int = 4
 
     model_librarian: str = "deepseek/deepseek-v3.2"
     fallback_librarian: str = "deepseek/deepseek-r1-0528,google/gemini-3-pro"
@@ -1,4 +1,4 @@
-from sqlalchemy import create_engine
+from sqlalchemy import create_engine, text
 from sqlalchemy.orm import sessionmaker, DeclarativeBase
 from .config import settings
 
@@ -14,6 +14,56 @@ SessionLocal = sessionmaker(bind=engine, autoflush=False, autocommit=False)
 class Base(DeclarativeBase):
     pass
 
+# create_all() never touches existing tables, so indexes/columns added after
+# the first deploy are applied here (idempotent).
+SCHEMA_PATCHES = [
+    # One TM entry per (target_lang, en_hash) (keep the newest) so the librarian can INSERT ... ON CONFLICT.
+    """
+    DO $$ BEGIN
+    IF to_regclass('uq_tm_entries_lang_hash') IS NULL THEN
+        DELETE FROM tm_entries t USING tm_entries d
+        WHERE t.target_lang = d.target_lang AND t.en_hash = d.en_hash
+          AND (t.version, t.updated_at, t.tm_entry_id) < (d.version, d.updated_at, d.tm_entry_id);
+        CREATE UNIQUE INDEX uq_tm_entries_lang_hash ON tm_entries (target_lang, en_hash);
+    END IF;
+    END $$
+    """,
+    "DROP INDEX IF EXISTS uq_tm_entries_en_hash",
+    "DROP INDEX IF EXISTS ix_tm_entries_en_hash",
+    "ALTER TABLE llm_runs ADD COLUMN IF NOT EXISTS cache_hit boolean DEFAULT false",
+    "ALTER TABLE llm_runs ADD COLUMN IF NOT EXISTS attempts json",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS content_hash varchar",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS audio_fingerprint varchar",
+    "CREATE INDEX IF NOT EXISTS ix_jobs_content_hash ON jobs (content_hash)",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS target_langs json",
+    "ALTER TABLE jobs ADD COLUMN IF NOT EXISTS error text",
+    # llm_runs.cost_usd was numeric(10,4), which rounded most per-call costs to 0.
+    """
+    DO $$ BEGIN
+    IF (SELECT numeric_scale FROM information_schema.columns
+        WHERE table_schema = current_schema() AND table_name = 'llm_runs' AND column_name = 'cost_usd') < 8 THEN
+        ALTER TABLE llm_runs ALTER COLUMN cost_usd TYPE numeric(14,8);
+    END IF;
+    END $$
+    """,
+    "ALTER TABLE job_cues ADD COLUMN IF NOT EXISTS target_lang varchar DEFAULT 'fa'",
+    "CREATE INDEX IF NOT EXISTS ix_job_cues_job_lang ON job_cues (job_id, target_lang, cue_index)",
+    "ALTER TABLE job_glossary_terms ADD COLUMN IF NOT EXISTS target_lang varchar DEFAULT 'fa'",
+    "ALTER TABLE job_cues ADD COLUMN IF NOT EXISTS updated_at timestamptz DEFAULT clock_timestamp()",
+    "CREATE INDEX IF NOT EXISTS ix_job_cues_job_lang_updated ON job_cues (job_id, target_lang, updated_at, cue_id)",
+    # Per-language checkpoints are keyed "<STAGE>:<lang>"; pre-existing ones belong to the job's only language.
+    """
+    UPDATE job_stage_checkpoints c SET stage = c.stage || ':' || j.target_lang FROM jobs j
+    WHERE c.job_id = j.job_id AND j.target_langs IS NULL
+      AND c.stage IN ('TM_GATING', 'TERMS', 'TRANSLATE', 'QA', 'FINALIZE', 'LIBRARIAN')
+    """,
+]
+
 def init_db():
     from . import models  # noqa
+    from .tm import ensure_tm_index
     Base.metadata.create_all(bind=engine)
+    with engine.begin() as conn:
+        for stmt in SCHEMA_PATCHES:
+            conn.execute(text(stmt))
+        ensure_tm_index(conn)
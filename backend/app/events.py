@@ -0,0 +1,50 @@
+import json, logging
+from typing import Any, Dict, List, Optional
+import redis
+import redis.asyncio as aioredis
+from .config import settings
+
+log = logging.getLogger(__name__)
+
+# A job in one of these states publishes nothing more, so event streams stop watching it.
+TERMINAL_STATUSES = ("DONE", "FAILED")
+
+_redis: Optional[redis.Redis] = None
+
+def channel(job_id: str) -> str:
+    return f"jobs:events:{job_id}"
+
+def _r() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _redis
+
+def publish(job_id: str, event: Dict[str, Any]):
+    # Fire-and-forget: a missed event only delays a UI update, so Redis trouble never fails a stage.
+    try:
+        _r().publish(channel(job_id), json.dumps({"job_id": job_id, **event}, ensure_ascii=False, default=str))
+    except redis.RedisError as e:
+        log.warning("could not publish event for job %s: %s", job_id, e)
+
+def sse(event: Dict[str, Any]) -> str:
+    return f"event: {event.get('type', 'message')}\ndata: {json.dumps(event, ensure_ascii=False, default=str)}\n\n"
+
+class JobEvents:
+    # Async subscription to one or more jobs' channels (used by the SSE endpoints).
+    def __init__(self, job_ids: List[str]):
+        self.job_ids = job_ids
+        self._r = aioredis.Redis.from_url(settings.redis_url)
+        self._ps = self._r.pubsub()
+
+    async def open(self):
+        await self._ps.subscribe(*[channel(j) for j in self.job_ids])
+
+    async def next(self, timeout: float = 15.0) -> Optional[Dict[str, Any]]:
+        # None after `timeout` seconds without an event.
+        msg = await self._ps.get_message(ignore_subscribe_messages=True, timeout=timeout)
+        return json.loads(msg["data"]) if msg else None
+
+    async def close(self):
+        await self._ps.aclose()
+        await self._r.aclose()
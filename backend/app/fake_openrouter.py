@@ -0,0 +1,226 @@
+import argparse, hashlib, json, math, random, re, struct, threading, time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Dict, List, Optional, Tuple
+
+# Local stand-in for the OpenRouter chat/embeddings API, for benchmarks (see app.bench). Answers every agent's
+# prompt with well-formed JSON built from the prompt itself, with configurable latency, errors, 429s and usage.
+
+def parse_latency(spec: str) -> Tuple[float, float]:
+    # "median_ms/sigma": log-normal latency around median_ms; sigma 0 = constant.
+    median, _, sigma = spec.partition("/")
+    return float(median) / 1000, float(sigma or 0)
+
+def parse_model_latency(csv: str) -> Dict[str, Tuple[float, float]]:
+    # "model=median_ms/sigma,..."
+    out = {}
+    for item in (csv or "").split(","):
+        model, sep, spec = item.strip().rpartition("=")
+        if sep and model:
+            out[model] = parse_latency(spec)
+    return out
+
+def tokens(text: str) -> int:
+    return max(1, (len(text or "") + 3) // 4)
+
+def json_after(text: str, marker: str) -> Any:
+    _, sep, rest = text.partition(marker)
+    if not sep:
+        return None
+    try:
+        return json.loads(rest.strip())
+    except json.JSONDecodeError:
+        return None
+
+def fake_translation(en: str, lang: str) -> str:
+    return f"{lang}: {en}"
+
+def fake_score(cue_id: str, base: int) -> int:
+    # Deterministic per cue, spread over base-5..base+5.
+    return max(0, min(100, base - 5 + int(hashlib.sha256(cue_id.encode()).hexdigest(), 16) % 11))
+
+class FakeOpenRouter:
+    def __init__(self, args):
+        self.latency = parse_latency(args.latency)
+        self.model_latency = parse_model_latency(args.model_latency)
+        self.embed_latency = parse_latency(args.embed_latency)
+        self.error_rate = args.error_rate
+        self.rate_limit_rate = args.rate_limit_rate
+        self.retry_after_s = args.retry_after_s
+        self.prices = [float(x) for x in args.price.split("/", 1)]
+        self.difficulty = args.difficulty
+        self.qa_score = args.qa_score
+        self.rng = random.Random(args.seed)
+        self._lock = threading.Lock()
+        self.stats: Dict[str, Any] = {}
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.stats = {"requests": 0, "status": {}, "agents": {}, "prompt_tokens": 0, "completion_tokens": 0,
+                          "embedded_texts": 0, "truncated": 0}
+
+    def count(self, key: str, value: Any = 1, sub: Optional[str] = None):
+        with self._lock:
+            if sub is None:
+                self.stats[key] += value
+            else:
+                self.stats[key][sub] = self.stats[key].get(sub, 0) + value
+
+    def sleep(self, spec: Tuple[float, float]):
+        median, sigma = spec
+        with self._lock:
+            z = self.rng.gauss(0, 1)
+        time.sleep(median * math.exp(sigma * z))
+
+    def fault(self) -> Optional[Tuple[int, Dict[str, str]]]:
+        with self._lock:
+            x = self.rng.random()
+        if x < self.rate_limit_rate:
+            return 429, {"Retry-After": f"{self.retry_after_s:g}"}
+        if x < self.rate_limit_rate + self.error_rate:
+            return 502, {}
+        return None
+
+    def answer(self, system: str, user: str) -> Tuple[str, str]:
+        # -> (agent, content)
+        m = re.search(r"EN→([A-Za-z0-9\-]+)", system)
+        lang = m.group(1).lower() if m else "fa"
+        if "Strategist" in system:
+            return "strategist", json.dumps({
+                "genre": "tech_tutorial", "tone": "neutral", "domain_tags": ["bench"], "difficulty_score": self.difficulty,
+                "strategist_confidence": 80, "needs_terminologist": True, "notes_for_translator": [],
+            })
+        if "Terminologist" in system:
+            transcript = user.partition("Transcript:")[2]
+            terms = list(dict.fromkeys(re.findall(r"\b[A-Z][a-zA-Z]{4,}\b", transcript)))[:15]
+            return "terminologist", json.dumps({"terms": [
+                {"en_term": t, "target_term": t, "term_type": "jargon", "mandatory": True, "confidence": 90, "notes": ""} for t in terms
+            ]}, ensure_ascii=False)
+        if "Translator" in system:
+            cues = json_after(user, "Cues JSON:") or []
+            return "translator", json.dumps({c["cue_id"]: fake_translation(c["en_text"], lang) for c in cues}, ensure_ascii=False)
+        if "QA & Polisher" in system:
+            payload = json_after(user, "Input JSON:") or {}
+            ids = [c["cue_id"] for c in payload.get("cues", []) if not c.get("context_only")]
+            tr = payload.get("translations", {})
+            return "qa_polisher", json.dumps({
+                "polished": {i: tr.get(i, "") for i in ids}, "qa_scores": {i: fake_score(i, self.qa_score) for i in ids}, "issues": {},
+            }, ensure_ascii=False)
+        if "judge" in system:
+            pairs = json_after(user, "Pairs JSON:") or []
+            return "tm_judge", json.dumps({p["id"]: {"reuse": True, "reason": "bench"} for p in pairs})
+        return "other", "{}"
+
+    def chat(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        messages = body.get("messages") or []
+        system = next((m["content"] for m in messages if m.get("role") == "system"), "")
+        user = next((m["content"] for m in reversed(messages) if m.get("role") == "user"), "")
+        model = body.get("model", "")
+        self.sleep(self.model_latency.get(model, self.latency))
+        agent, content = self.answer(system, user)
+        finish = "stop"
+        max_tokens = int(body.get("max_tokens") or 0)
+        if max_tokens and tokens(content) > max_tokens:
+            # Cut like a real model would, so truncation handling is exercised too.
+            content, finish = content[:max_tokens * 4], "length"
+            self.count("truncated")
+        pt, ct = sum(tokens(m.get("content", "")) for m in messages), tokens(content)
+        self.count("agents", sub=agent)
+        self.count("prompt_tokens", pt)
+        self.count("completion_tokens", ct)
+        return {
+            "id": f"bench-{time.monotonic_ns()}", "model": model, "object": "chat.completion",
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}, "finish_reason": finish}],
+            "usage": {"prompt_tokens": pt, "completion_tokens": ct, "total_tokens": pt + ct,
+                      "cost": (pt * self.prices[0] + ct * self.prices[1]) / 1e6},
+        }
+
+    def embed(self, body: Dict[str, Any]) -> Dict[str, Any]:
+        inputs = body.get("input") or []
+        inputs = [inputs] if isinstance(inputs, str) else inputs
+        dims = int(body.get("dimensions") or 3072)
+        self.sleep(self.embed_latency)
+        self.count("embedded_texts", len(inputs))
+        pt = sum(tokens(t) for t in inputs)
+        self.count("prompt_tokens", pt)
+        return {"object": "list", "model": body.get("model"), "data": [{"index": i, "embedding": embedding(t, dims)} for i, t in enumerate(inputs)],
+                "usage": {"prompt_tokens": pt, "total_tokens": pt, "cost": pt * self.prices[0] / 1e6}}
+
+def embedding(text: str, dims: int) -> List[float]:
+    # Deterministic unit vector from the text's hash: equal texts embed equally, different ones near-orthogonally.
+    raw = struct.unpack(f"{dims}b", hashlib.shake_256(text.encode()).digest(dims))
+    norm = math.sqrt(sum(x * x for x in raw)) or 1.0
+    return [round(x / norm, 5) for x in raw]
+
+def make_handler(fake: FakeOpenRouter):
+    class Handler(BaseHTTPRequestHandler):
+        protocol_version = "HTTP/1.1"  # keep-alive, like the real API
+
+        def log_message(self, *args):
+            pass
+
+        def reply(self, status: int, obj: Any, headers: Optional[Dict[str, str]] = None):
+            data = json.dumps(obj, ensure_ascii=False).encode()
+            self.send_response(status)
+            self.send_header("Content-Type", "application/json")
+            self.send_header("Content-Length", str(len(data)))
+            for k, v in (headers or {}).items():
+                self.send_header(k, v)
+            self.end_headers()
+            self.wfile.write(data)
+
+        def do_GET(self):
+            if self.path.endswith("/stats"):
+                with fake._lock:
+                    stats = json.loads(json.dumps(fake.stats))
+                return self.reply(200, stats)
+            self.reply(404, {"error": {"message": "not found"}})
+
+        def do_POST(self):
+            body = json.loads(self.rfile.read(int(self.headers.get("Content-Length") or 0)) or b"{}")
+            if self.path.endswith("/reset"):
+                fake.reset()
+                return self.reply(200, {"ok": True})
+            fake.count("requests")
+            status, headers = fake.fault() or (200, {})
+            if status != 200:
+                obj = {"error": {"code": status, "message": "injected by fake_openrouter"}}
+            elif self.path.endswith("/chat/completions"):
+                obj = fake.chat(body)
+            elif self.path.endswith("/embeddings"):
+                obj = fake.embed(body)
+            else:
+                status, obj = 404, {"error": {"message": "not found"}}
+            fake.count("status", sub=str(status))
+            self.reply(status, obj, headers)
+
+    return Handler
+
+def build_parser(add_help: bool = True) -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Local fake OpenRouter API for benchmarks.", add_help=add_help)
+    ap.add_argument("--host", default="127.0.0.1")
+    ap.add_argument("--port", type=int, default=8099)
+    ap.add_argument("--latency", default="800/0.5", help="chat latency, median_ms/sigma (log-normal)")
+    ap.add_argument("--model-latency", default="", help="per-model override, model=median_ms/sigma,...")
+    ap.add_argument("--embed-latency", default="150/0.3", help="embeddings latency, median_ms/sigma")
+    ap.add_argument("--error-rate", type=float, default=0.0, help="fraction of requests answered with 502")
+    ap.add_argument("--rate-limit-rate", type=float, default=0.0, help="fraction of requests answered with 429")
+    ap.add_argument("--retry-after-s", type=float, default=1.0)
+    ap.add_argument("--price", default="1/4", help="USD per 1M tokens, prompt/completion (reported as usage.cost)")
+    ap.add_argument("--difficulty", type=int, default=5, help="difficulty_score the strategist reports")
+    ap.add_argument("--qa-score", type=int, default=90, help="mean QA score (>= 85 lets the librarian store cues)")
+    ap.add_argument("--seed", type=int, default=0)
+    return ap
+
+def main():
+    args = build_parser().parse_args()
+    server = ThreadingHTTPServer((args.host, args.port), make_handler(FakeOpenRouter(args)))
+    server.daemon_threads = True
+    print(f"fake OpenRouter on http://{args.host}:{args.port}/api/v1", flush=True)
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+import re
+from typing import Any, Dict, Iterable, List, Set
+from .persian import fold_persian
+
+_TOKEN = re.compile(r"[A-Za-z0-9]+(?:['’][A-Za-z]+)?")
+_END = ""
+
+def _strip_s(t: str) -> str:
+    return t[:-1] if len(t) > 3 and t.endswith("s") and not t.endswith(("ss", "us", "is")) else t
+
+def _stem(tok: str) -> str:
+    # Case/plural folding only; enough to make "APIs", "API's" and "api" the same term. Singular and plural
+    # must land on the same key, so a final "e"/"y" is folded too: house/houses -> hous, policy/policies -> polici.
+    # The "s" rule runs again after "es"/"e" are removed, so alias/aliases -> alia and database/databases -> databa.
+    if re.fullmatch(r"[A-Z0-9]{2,}s", tok):
+        return tok[:-1].lower()
+    t = tok.lower().replace("’", "'")
+    if t.endswith("'s"):
+        t = t[:-2]
+    t = t.replace("'", "")
+    if len(t) > 4 and t.endswith("ies"):
+        return t[:-3] + "i"
+    if len(t) > 3 and t.endswith("es"):
+        t = t[:-2]
+    t = _strip_s(t)
+    if len(t) > 2 and t.endswith("y") and t[-2] not in "aeiou":
+        return t[:-1] + "i"
+    if len(t) > 3 and t.endswith("e"):
+        t = t[:-1]
+    return _strip_s(t)
+
+def tokens(text: str) -> List[str]:
+    return [_stem(t) for t in _TOKEN.findall(text or "")]
+
+class GlossaryMatcher:
+    # Token trie over en_term; one pass per text finds every (multi-word) term occurrence.
+    def __init__(self, terms: Iterable[Dict[str, Any]]):
+        self.terms = list(terms)
+        self._root: Dict[str, Any] = {}
+        for i, t in enumerate(self.terms):
+            toks = tokens(t.get("en_term", ""))
+            if not toks:
+                continue
+            node = self._root
+            for tok in toks:
+                node = node.setdefault(tok, {})
+            node.setdefault(_END, []).append(i)
+
+    def match(self, text: str) -> Set[int]:
+        toks = tokens(text)
+        found: Set[int] = set()
+        for i in range(len(toks)):
+            node = self._root
+            j = i
+            while j < len(toks) and toks[j] in node:
+                node = node[toks[j]]
+                j += 1
+                found.update(node.get(_END, ()))
+        return found
+
+    def terms_in(self, texts: Iterable[str]) -> List[Dict[str, Any]]:
+        idx: Set[int] = set()
+        for t in texts:
+            idx |= self.match(t)
+        return [self.terms[i] for i in sorted(idx)]
+
+    def missing_mandatory(self, en_text: str, fa_text: str) -> List[str]:
+        # casefold: Latin-script targets may capitalize a term differently from the glossary.
+        fa = fold_persian(fa_text).casefold()
+        out = []
+        for i in sorted(self.match(en_text)):
+            t = self.terms[i]
+            want = fold_persian(t.get("fa_term", "")).casefold()
+            if t.get("mandatory", True) and want and want not in fa:
+                out.append(t["en_term"])
+        return out
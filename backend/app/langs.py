@@ -0,0 +1,36 @@
+import re
+from typing import List, Optional
+from .config import settings
+from .persian import normalize_persian_spacing, strip_speaker_ids
+
+LANG_NAMES = {
+    "fa": "Persian", "ar": "Arabic", "tr": "Turkish", "ur": "Urdu", "ps": "Pashto", "ku": "Kurdish",
+    "he": "Hebrew", "ru": "Russian", "de": "German", "fr": "French", "es": "Spanish", "it": "Italian",
+    "pt": "Portuguese", "hi": "Hindi", "zh": "Chinese", "ja": "Japanese", "ko": "Korean",
+}
+# Scripts that use the Arabic comma/question mark and share the Persian spacing rules.
+ARABIC_SCRIPT = {"fa", "ar", "ur", "ps"}
+LANG_CODE = re.compile(r"[a-z]{2,3}(-[a-z0-9]{2,8})?")
+
+def lang_name(code: str) -> str:
+    return LANG_NAMES.get(code, code)
+
+def job_langs(job) -> List[str]:
+    # Jobs created before multi-language support only have target_lang.
+    return list(job.target_langs or [job.target_lang])
+
+def parse_langs(value: Optional[str]) -> List[str]:
+    out: List[str] = []
+    for x in (value or settings.default_target_langs).split(","):
+        x = x.strip().lower()
+        if x and not LANG_CODE.fullmatch(x):
+            raise ValueError(f"Invalid language code: {x!r}")
+        if x and x not in out:
+            out.append(x)
+    return out
+
+def clean_translation(text: str, lang: str) -> str:
+    s = strip_speaker_ids(str(text))
+    if lang in ARABIC_SCRIPT:
+        return normalize_persian_spacing(s)
+    return re.sub(r"\s+", " ", s).strip()
@@ -0,0 +1,65 @@
+import hashlib, itertools
+from datetime import datetime, timedelta
+from typing import Any, Dict, List, Optional, Tuple
+from sqlalchemy import select, update, delete, func
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.orm import Session
+from .config import settings
+from .models import LLMCacheEntry
+
+_writes = itertools.count(1)
+
+def cache_enabled(agent_name: str, temperature: float) -> bool:
+    if not settings.llm_cache_enabled or float(temperature) > float(settings.llm_cache_max_temperature):
+        return False
+    agents = [a.strip() for a in settings.llm_cache_agents.split(",") if a.strip()]
+    return not agents or agent_name in agents
+
+def cache_key(agent_name: str, model: str, temperature: float, max_tokens: int, input_sha: str) -> str:
+    raw = f"{agent_name}|{model}|{float(temperature):.3f}|{int(max_tokens)}|{input_sha}"
+    return hashlib.sha256(raw.encode("utf-8")).hexdigest()
+
+def cache_get(db: Session, keys: List[Tuple[str, str]]) -> Optional[Tuple[str, LLMCacheEntry]]:
+    # keys: (model, cache_key) in preference order; returns the first live hit.
+    by_key = dict((k, m) for m, k in keys)
+    now = datetime.utcnow()
+    rows = db.execute(
+        select(LLMCacheEntry)
+        .where(LLMCacheEntry.cache_key.in_(list(by_key)))
+        .where((LLMCacheEntry.expires_at.is_(None)) | (LLMCacheEntry.expires_at > now))
+    ).scalars().all()
+    found = {r.cache_key: r for r in rows}
+    for m, k in keys:
+        if k in found:
+            db.execute(
+                update(LLMCacheEntry).where(LLMCacheEntry.cache_key == k)
+                .values(hits=LLMCacheEntry.hits + 1, last_hit_at=now)
+            )
+            return m, found[k]
+    return None
+
+def cache_put(db: Session, key: str, agent_name: str, model: str, temperature: float, max_tokens: int,
+              input_sha: str, content: str, usage: Dict[str, Any]):
+    now = datetime.utcnow()
+    ttl = int(settings.llm_cache_ttl_s)
+    row = dict(
+        cache_key=key, agent_name=agent_name, model=model, temperature=float(temperature),
+        max_tokens=int(max_tokens), input_sha=input_sha, content=content, usage=usage,
+        created_at=now, expires_at=now + timedelta(seconds=ttl) if ttl > 0 else None, hits=0,
+    )
+    stmt = pg_insert(LLMCacheEntry).values(row)
+    db.execute(stmt.on_conflict_do_update(
+        index_elements=["cache_key"],
+        set_={"content": stmt.excluded.content, "usage": stmt.excluded.usage,
+              "created_at": stmt.excluded.created_at, "expires_at": stmt.excluded.expires_at},
+    ))
+    if next(_writes) % max(1, int(settings.llm_cache_prune_every)) == 0:
+        prune(db)
+
+def prune(db: Session) -> int:
+    # TTL first, then keep only the llm_cache_max_entries most recently used rows.
+    n = db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.expires_at <= datetime.utcnow())).rowcount or 0
+    recency = func.coalesce(LLMCacheEntry.last_hit_at, LLMCacheEntry.created_at)
+    stale = select(LLMCacheEntry.cache_key).order_by(recency.desc()).offset(int(settings.llm_cache_max_entries))
+    n += db.execute(delete(LLMCacheEntry).where(LLMCacheEntry.cache_key.in_(stale))).rowcount or 0
+    return n
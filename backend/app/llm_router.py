@@ -1,11 +1,17 @@
-import hashlib, json
+import asyncio, hashlib, json, random, re, threading, time
+from collections import deque
 from datetime import datetime
-from typing import Any, Dict, List, Optional
-import requests
-from tenacity import retry, stop_after_attempt, wait_exponential_jitter
+from email.utils import parsedate_to_datetime
+from typing import Any, Callable, Deque, Dict, List, Optional, Tuple
+import httpx
 from sqlalchemy.orm import Session
 from .config import settings
-from .models import LLMRun
+from .models import uuid4
+from .db import SessionLocal
+from .circuit import breaker
+from .llm_cache import cache_enabled, cache_get, cache_key, cache_put
+from .telemetry import current_job_id, current_stage, llm_cost, observe_llm
+from .run_log import recorder
 
 def _sha(s: str) -> str:
     return hashlib.sha256(s.encode("utf-8")).hexdigest()
@@ -13,40 +19,278 @@ def _sha(s: str) -> str:
 def models_from_csv(csv: str) -> List[str]:
     return [m.strip() for m in (csv or "").split(",") if m.strip()]
 
-class OpenRouterClient:
+def model_map_from_csv(csv: str) -> Dict[str, str]:
+    out = {}
+    for item in models_from_csv(csv):
+        k, sep, v = item.rpartition("=")
+        if sep and k.strip():
+            out[k.strip()] = v.strip()
+    return out
+
+class TruncatedOutput(RuntimeError):
+    pass
+
+class HedgeFailed(RuntimeError):
+    def __init__(self, errors: Dict[str, BaseException]):
+        super().__init__("; ".join(f"{m}: {e}" for m, e in errors.items()))
+        self.errors = errors
+
+class InvalidOutput(RuntimeError):
+    # A complete reply that `validate` rejected (prose, wrong format): the next fallback model is tried.
+    pass
+
+def parse_json(content: str) -> Any:
+    # Tolerates a ```json fence around the value, which some models add despite "No markdown".
+    s = (content or "").strip()
+    m = re.fullmatch(r"```(?:json)?\s*(.*?)\s*```", s, re.S)
+    return json.loads(m.group(1) if m else s)
+
+def is_json(content: str) -> bool:
+    try:
+        parse_json(content)
+        return True
+    except ValueError:
+        return False
+
+def json_unterminated(content: str) -> bool:
+    # A JSON value that opens but never closes: how truncation looks when the provider omits finish_reason.
+    s = re.sub(r"^```(?:json)?\s*", "", (content or "").strip())
+    if not s.startswith(("{", "[")):
+        return False
+    depth, in_str, esc = 0, False, False
+    for ch in s:
+        if in_str:
+            if esc:
+                esc = False
+            elif ch == "\\":
+                esc = True
+            elif ch == '"':
+                in_str = False
+        elif ch == '"':
+            in_str = True
+        elif ch in "{[":
+            depth += 1
+        elif ch in "}]":
+            depth -= 1
+    return in_str or depth > 0
+
+def provider_fault(err: BaseException) -> bool:
+    # Only these count against a model's circuit: a 400/422 from our own oversized or malformed request
+    # says nothing about the provider and must not block the model for every worker.
+    if isinstance(err, httpx.HTTPStatusError):
+        code = err.response.status_code
+        return code >= 500 or code in (408, 429)
+    if isinstance(err, httpx.LocalProtocolError):
+        return False
+    return isinstance(err, (httpx.TransportError, asyncio.TimeoutError, TimeoutError))
+
+def _has_content(resp: Dict[str, Any]) -> bool:
+    try:
+        return bool(resp["choices"][0]["message"]["content"])
+    except (KeyError, IndexError, TypeError):
+        return False
+
+RETRY_STATUS = {408, 409, 425, 429, 500, 502, 503, 504}
+
+def _backoff(attempt: int) -> float:
+    return min(2 ** attempt, 30) * (0.5 + random.random() / 2)
+
+def retry_after_s(r: httpx.Response) -> Optional[float]:
+    ra = r.headers.get("retry-after")
+    if ra:
+        try:
+            return max(0.0, float(ra))
+        except ValueError:
+            try:
+                return max(0.0, parsedate_to_datetime(ra).timestamp() - time.time())
+            except (TypeError, ValueError):
+                pass
+    reset = r.headers.get("x-ratelimit-reset")
+    if reset:
+        try:
+            v = float(reset)
+            # OpenRouter sends an epoch in ms; some providers send seconds-from-now.
+            return max(0.0, v / 1000 - time.time()) if v > 1e11 else max(0.0, v)
+        except ValueError:
+            pass
+    return None
+
+class TokenBucket:
+    def __init__(self, rate: float, burst: int):
+        self.rate = float(rate)
+        self.capacity = max(1, int(burst))
+        self.tokens = float(self.capacity)
+        self.updated = time.monotonic()
+        self._lock = asyncio.Lock()
+
+    async def acquire(self):
+        if self.rate <= 0:
+            return
+        async with self._lock:
+            while True:
+                now = time.monotonic()
+                self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return
+                await asyncio.sleep((1 - self.tokens) / self.rate)
+
+class AsyncOpenRouterClient:
+    # Must only be used from one event loop: semaphores and the connection pool are bound to it.
     def __init__(self):
         self.base = settings.openrouter_base_url.rstrip("/")
         self.key = settings.openrouter_api_key
+        self._http: Optional[httpx.AsyncClient] = None
+        self._global: Optional[asyncio.Semaphore] = None
+        self._per_model: Dict[str, asyncio.Semaphore] = {}
+        self._paused_until: Dict[str, float] = {}
+        self._bucket: Optional[TokenBucket] = None
+
+    def _init(self):
+        if self._http is None:
+            self._http = httpx.AsyncClient(
+                base_url=self.base,
+                headers={
+                    "Authorization": f"Bearer {self.key}",
+                    "Content-Type": "application/json",
+                    "X-Title": "SubtitleAI-MVP",
+                },
+                timeout=httpx.Timeout(settings.llm_timeout_s, connect=10.0),
+                limits=httpx.Limits(
+                    max_connections=max(1, int(settings.llm_max_in_flight)),
+                    max_keepalive_connections=max(1, int(settings.llm_max_in_flight)),
+                ),
+            )
+            self._global = asyncio.Semaphore(max(1, int(settings.llm_max_in_flight)))
+            self._bucket = TokenBucket(settings.llm_rate_limit_rps, settings.llm_rate_limit_burst)
+
+    def _model_sem(self, model: str) -> asyncio.Semaphore:
+        sem = self._per_model.get(model)
+        if sem is None:
+            sem = self._per_model[model] = asyncio.Semaphore(max(1, int(settings.llm_max_in_flight_per_model)))
+        return sem
+
+    async def _post(self, path: str, model: str, payload: Dict[str, Any]) -> Dict[str, Any]:
+        if not self.key:
+            # An empty key makes an invalid "Bearer " header; no retry or fallback can fix that.
+            raise RuntimeError("OPENROUTER_API_KEY is not set")
+        self._init()
+        last: Optional[Exception] = None
+        attempts = max(1, int(settings.llm_max_attempts))
+        for attempt in range(attempts):
+            wait = self._paused_until.get(model, 0) - time.monotonic()
+            if wait > 0:
+                await asyncio.sleep(wait)
+            async with self._global, self._model_sem(model):
+                await self._bucket.acquire()
+                try:
+                    r = await self._http.post(path, json=payload)
+                except httpx.LocalProtocolError:
+                    raise  # the request itself is malformed; sending it again won't help
+                except httpx.TransportError as e:
+                    last, delay = e, _backoff(attempt)
+                else:
+                    if r.status_code not in RETRY_STATUS:
+                        r.raise_for_status()
+                        return r.json()
+                    last = httpx.HTTPStatusError(f"{r.status_code} from {model}: {r.text[:300]}", request=r.request, response=r)
+                    hint = retry_after_s(r)
+                    delay = hint if hint is not None else _backoff(attempt)
+                    if r.status_code == 429:
+                        # Hold back every caller of this model, not just this request.
+                        self._paused_until[model] = max(self._paused_until.get(model, 0), time.monotonic() + delay)
+            if attempt < attempts - 1:
+                await asyncio.sleep(delay)
+        raise last
+
+    async def chat(self, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> Dict[str, Any]:
+        # usage.include makes OpenRouter report the call's actual cost alongside the token counts.
+        payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens,
+                   "usage": {"include": True}}
+        return await self._post("/chat/completions", model, payload)
+
+    async def embed(self, model: str, inputs: List[str], dimensions: Optional[int] = None) -> Tuple[List[List[float]], Dict[str, Any]]:
+        # -> (embeddings, usage)
+        payload: Dict[str, Any] = {"model": model, "input": inputs, "usage": {"include": True}}
+        if dimensions:
+            payload["dimensions"] = int(dimensions)
+        data = await self._post("/embeddings", model, payload)
+        return [d["embedding"] for d in data["data"]], data.get("usage") or {}
+
+    async def aclose(self):
+        if self._http is not None:
+            await self._http.aclose()
+            self._http = None
+
+class OpenRouterClient:
+    # Sync facade for pipeline threads: every call runs on one shared background loop, so all
+    # threads of a process share the connection pool, semaphores and rate limiter.
+    def __init__(self):
+        self.aio = AsyncOpenRouterClient()
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._lock = threading.Lock()
+
+    def _run(self, coro):
+        with self._lock:
+            if self._loop is None:
+                loop = asyncio.new_event_loop()
+                threading.Thread(target=loop.run_forever, name="openrouter-client", daemon=True).start()
+                self._loop = loop
+        return asyncio.run_coroutine_threadsafe(coro, self._loop).result()
 
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(initial=1, max=10))
     def chat(self, model: str, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> Dict[str, Any]:
-        url = f"{self.base}/chat/completions"
-        headers = {
-            "Authorization": f"Bearer {self.key}",
-            "Content-Type": "application/json",
-            "X-Title": "SubtitleAI-MVP",
-        }
-        payload = {"model": model, "messages": messages, "temperature": temperature, "max_tokens": max_tokens}
-        r = requests.post(url, headers=headers, json=payload, timeout=180)
-        r.raise_for_status()
-        return r.json()
-
-    @retry(stop=stop_after_attempt(3), wait=wait_exponential_jitter(initial=1, max=10))
-    def embed(self, model: str, inputs: List[str]) -> List[List[float]]:
-        url = f"{self.base}/embeddings"
-        headers = {
-            "Authorization": f"Bearer {self.key}",
-            "Content-Type": "application/json",
-            "X-Title": "SubtitleAI-MVP",
-        }
-        payload = {"model": model, "input": inputs}
-        r = requests.post(url, headers=headers, json=payload, timeout=180)
-        r.raise_for_status()
-        data = r.json()
-        return [d["embedding"] for d in data["data"]]
+        return self._run(self.aio.chat(model, messages, temperature=temperature, max_tokens=max_tokens))
+
+    def embed(self, model: str, inputs: List[str], dimensions: Optional[int] = None) -> Tuple[List[List[float]], Dict[str, Any]]:
+        return self._run(self.aio.embed(model, inputs, dimensions=dimensions))
+
+    def chat_hedged(self, primary: str, hedge: str, delay_s: float, messages: List[Dict[str, str]], temperature: float, max_tokens: int) -> Tuple[str, Dict[str, Any], Dict[str, BaseException]]:
+        return self._run(self._hedged(primary, hedge, delay_s, messages, temperature, max_tokens))
+
+    async def _hedged(self, primary: str, hedge: str, delay_s: float, messages, temperature, max_tokens):
+        # First valid response wins; the loser is cancelled (which also aborts its HTTP request).
+        def start(m):
+            return asyncio.ensure_future(self.aio.chat(m, messages, temperature=temperature, max_tokens=max_tokens))
+        errors: Dict[str, BaseException] = {}
+        first = start(primary)
+        done, _ = await asyncio.wait({first}, timeout=delay_s)
+        if first in done:
+            if first.exception() is None and _has_content(first.result()):
+                return primary, first.result(), errors
+            errors[primary] = first.exception() or RuntimeError("empty response")
+            pending = {start(hedge): hedge}
+        else:
+            pending = {first: primary, start(hedge): hedge}
+        while pending:
+            done, _ = await asyncio.wait(set(pending), return_when=asyncio.FIRST_COMPLETED)
+            for t in done:
+                m = pending.pop(t)
+                if t.exception() is None and _has_content(t.result()):
+                    for other in pending:
+                        other.cancel()
+                    return m, t.result(), errors
+                errors[m] = t.exception() or RuntimeError("empty response")
+        raise HedgeFailed(errors)
 
 client = OpenRouterClient()
 
+# Latency samples per (model, agent): a judge call and a 80-cue translation batch on the same model have very
+# different latencies, and a pooled percentile would hedge the long calls almost always and the short ones never.
+_latencies: Dict[Tuple[str, str], Deque[float]] = {}
+_latencies_lock = threading.Lock()
+
+def record_latency(model: str, agent: str, seconds: float):
+    with _latencies_lock:
+        _latencies.setdefault((model, agent), deque(maxlen=200)).append(seconds)
+
+def hedge_delay(model: str, agent: str) -> float:
+    with _latencies_lock:
+        xs = sorted(_latencies.get((model, agent), ()))
+    if len(xs) < int(settings.llm_hedge_min_samples):
+        return float(settings.llm_hedge_default_delay_s)
+    return xs[min(len(xs) - 1, int(len(xs) * float(settings.llm_hedge_percentile)))]
+
 def call_with_fallbacks(
     db: Session,
     job_id: Optional[str],
@@ -58,43 +302,153 @@ def call_with_fallbacks(
     temperature: float = 0.2,
     max_tokens: int = 2000,
     meta: Optional[Dict[str, Any]] = None,
+    validate: Optional[Callable[[str], bool]] = None,
 ) -> str:
-    all_models = [primary_model] + list(fallback_models)
+    # validate: only responses it accepts are cached (e.g. "parses as JSON").
+    # `db` is the caller's session and is never written here: the run row (one per call, with every model
+    # tried in `attempts`) goes to the buffered recorder, and cache reads/writes use their own short sessions.
+    chain = [primary_model] + list(fallback_models)
+    all_models = breaker.available(chain)
     inp = json.dumps(messages, ensure_ascii=False)
-    run = LLMRun(
-        job_id=job_id,
-        cue_id=cue_id,
-        agent_name=agent_name,
-        model=primary_model,
-        provider="openrouter",
-        status="error",
-        input_sha=_sha(inp),
-        meta=meta or {},
+    input_sha = _sha(inp)
+    stage = current_stage()
+    if stage:
+        meta = {**(meta or {}), "stage": stage}
+    run: Dict[str, Any] = dict(
+        run_id=uuid4(), job_id=job_id, cue_id=cue_id, agent_name=agent_name, model=all_models[0],
+        provider="openrouter", started_at=datetime.utcnow(), status="error", input_sha=input_sha,
+        meta=meta or {}, cache_hit=False, attempts=[],
     )
-    db.add(run)
-    db.commit()
 
-    last_err = None
-    for m in all_models:
-        try:
-            run.model = m
-            run.started_at = datetime.utcnow()
-            db.commit()
-            resp = client.chat(m, messages, temperature=temperature, max_tokens=max_tokens)
-            content = resp["choices"][0]["message"]["content"]
-            run.status = "success"
-            run.finished_at = datetime.utcnow()
-            run.output_sha = _sha(content)
-            usage = resp.get("usage") or {}
-            run.prompt_tokens = usage.get("prompt_tokens")
-            run.completion_tokens = usage.get("completion_tokens")
-            db.commit()
-            return content
-        except Exception as e:
-            last_err = str(e)
-            run.status = "error"
-            run.error_message = last_err
-            run.finished_at = datetime.utcnow()
-            db.commit()
-            continue
-    raise RuntimeError(f"All models failed for {agent_name}. Last error: {last_err}")
+    def attempt(m: str, t0: float, status: str, error: Optional[str] = None):
+        a = {"model": m, "ms": int((time.monotonic() - t0) * 1000), "status": status}
+        if error:
+            a["error"] = error[:300]
+        run["attempts"].append(a)
+
+    def finish(m: str, resp: Dict[str, Any], seconds: float) -> str:
+        choice = resp["choices"][0]
+        content = choice["message"]["content"]
+        usage = resp.get("usage") or {}
+        run.update(
+            model=m, finished_at=datetime.utcnow(), cost_usd=llm_cost(m, usage),
+            prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"),
+        )
+        valid = validate is None or validate(content)
+        if choice.get("finish_reason") == "length" or (not valid and json_unterminated(content)):
+            # A bigger model won't help an oversized request; let the caller split it.
+            run.update(status="truncated", error_message=f"{m} hit max_tokens={max_tokens}")
+            run["attempts"][-1]["status"] = "truncated"
+            observe_llm(agent_name, m, "truncated", seconds, usage, run["cost_usd"])
+            raise TruncatedOutput(run["error_message"])
+        if not valid:
+            run["attempts"][-1].update(status="invalid", error=content[:300])
+            observe_llm(agent_name, m, "invalid", seconds, usage, run["cost_usd"])
+            raise InvalidOutput(f"{m} returned a reply that failed validation")
+        run.update(status="success", output_sha=_sha(content))
+        observe_llm(agent_name, m, "success", seconds, usage, run["cost_usd"])
+        if use_cache:
+            with SessionLocal() as cs:
+                cache_put(cs, cache_key(agent_name, m, temperature, max_tokens, input_sha), agent_name, m,
+                          temperature, max_tokens, input_sha, content, usage)
+                cs.commit()
+        return content
+
+    use_cache = cache_enabled(agent_name, temperature)
+    try:
+        if use_cache:
+            with SessionLocal() as cs:
+                hit = cache_get(cs, [(m, cache_key(agent_name, m, temperature, max_tokens, input_sha)) for m in chain])
+                hit = hit and (hit[0], hit[1].content, hit[1].usage or {})
+                cs.commit()
+            if hit and (validate is None or validate(hit[1])):
+                m, content, usage = hit
+                run.update(
+                    model=m, status="success", cache_hit=True, finished_at=datetime.utcnow(), output_sha=_sha(content),
+                    prompt_tokens=usage.get("prompt_tokens"), completion_tokens=usage.get("completion_tokens"), cost_usd=0,
+                )
+                observe_llm(agent_name, m, "cache_hit", 0, None, 0)
+                return content
+
+        last_err = None
+        if settings.llm_hedge_enabled and len(all_models) >= 2:
+            primary, hedge = all_models[0], all_models[1]
+            delay = hedge_delay(primary, agent_name)
+            run["meta"] = {**run["meta"], "hedge": {"primary": primary, "hedge": hedge, "delay_s": round(delay, 3)}}
+            t0 = time.monotonic()
+            try:
+                m, resp, errors = client.chat_hedged(primary, hedge, delay, messages, temperature=temperature, max_tokens=max_tokens)
+            except HedgeFailed as e:
+                last_err = str(e)
+                for failed, err in e.errors.items():
+                    if provider_fault(err):
+                        breaker.record_failure(failed)
+                    observe_llm(agent_name, failed, "error", time.monotonic() - t0, None, None)
+                    attempt(failed, t0, "error", str(err))
+                all_models = all_models[2:]
+            else:
+                elapsed = time.monotonic() - t0
+                record_latency(m, agent_name, elapsed)
+                breaker.record_success(m)
+                for failed, err in errors.items():
+                    if provider_fault(err):
+                        breaker.record_failure(failed)
+                    observe_llm(agent_name, failed, "error", elapsed, None, None)
+                    attempt(failed, t0, "error", str(err))
+                attempt(m, t0, "success")
+                run["meta"] = {**run["meta"], "hedge": {**run["meta"]["hedge"], "winner": m}}
+                try:
+                    return finish(m, resp, elapsed)
+                except InvalidOutput as e:
+                    # The cancelled loser may still answer properly: it goes back into the sequential chain.
+                    last_err, tried = str(e), set(errors) | {m}
+                    all_models = [x for x in all_models if x not in tried]
+
+        for m in all_models:
+            t0 = time.monotonic()
+            try:
+                resp = client.chat(m, messages, temperature=temperature, max_tokens=max_tokens)
+            except Exception as e:
+                if provider_fault(e):
+                    breaker.record_failure(m)
+                observe_llm(agent_name, m, "error", time.monotonic() - t0, None, None)
+                attempt(m, t0, "error", str(e))
+                last_err = str(e)
+                continue
+            elapsed = time.monotonic() - t0
+            record_latency(m, agent_name, elapsed)
+            breaker.record_success(m)
+            attempt(m, t0, "success")
+            try:
+                return finish(m, resp, elapsed)
+            except InvalidOutput as e:
+                last_err = str(e)
+        run.update(model=run["attempts"][-1]["model"] if run["attempts"] else run["model"], error_message=last_err)
+        raise RuntimeError(f"All models failed for {agent_name}. Last error: {last_err}")
+    finally:
+        run.setdefault("finished_at", datetime.utcnow())
+        recorder.record(run)
+
+def embed_recorded(model: str, inputs: List[str], dimensions: Optional[int] = None) -> List[List[float]]:
+    # One embeddings call, logged to llm_runs (agent "embedding") and the LLM metrics like a chat call,
+    # under the job and stage of the current telemetry span.
+    stage = current_stage()
+    run: Dict[str, Any] = dict(
+        run_id=uuid4(), job_id=current_job_id(), agent_name="embedding", model=model, provider="openrouter",
+        started_at=datetime.utcnow(), status="error", meta={"texts": len(inputs), **({"stage": stage} if stage else {})},
+        cache_hit=False,
+    )
+    t0 = time.monotonic()
+    usage: Dict[str, Any] = {}
+    try:
+        embs, usage = client.embed(model, inputs, dimensions=dimensions)
+        run["status"] = "success"
+        return embs
+    except Exception as e:
+        run["error_message"] = str(e)[:2000]
+        raise
+    finally:
+        run.update(finished_at=datetime.utcnow(), prompt_tokens=usage.get("prompt_tokens"), completion_tokens=0,
+                   cost_usd=llm_cost(model, usage) if usage else None)
+        observe_llm("embedding", model, run["status"], time.monotonic() - t0, usage, run["cost_usd"])
+        recorder.record(run)
@@ -1,11 +1,21 @@
-import uuid
+import os, re, uuid
 from pathlib import Path
-from fastapi import FastAPI, UploadFile, File, HTTPException
-from fastapi.responses import FileResponse
+from typing import Dict, List, Optional, Tuple
+from fastapi import FastAPI, UploadFile, File, Form, HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import FileResponse, StreamingResponse, PlainTextResponse
+from pydantic import BaseModel
+from sqlalchemy import select
 from sqlalchemy.orm import Session
+from .config import settings
 from .db import SessionLocal, init_db
 from .models import Job
-from .storage import save_upload, ensure_dirs
+from .langs import LANG_CODE, parse_langs, job_langs
+from .progress import jobs_progress, jobs_lang_stages, cues_since, stream_subtitles
+from .events import JobEvents, TERMINAL_STATUSES, sse
+from .telemetry import render_metrics, job_profile
+from .storage import (save_upload, ensure_dirs, report_name, ingest_path_allowed, check_ingest_url, partial_create,
+                      partial_info, partial_open_locked, partial_finish)
 from .worker import celery_app
 
 app = FastAPI(title="Subtitle AI MVP", version="0.1.0")
@@ -22,18 +32,205 @@ def db() -> Session:
 def health():
     return {"ok": True}
 
+@app.get("/metrics", response_class=PlainTextResponse)
+def metrics():
+    s = db()
+    try:
+        return PlainTextResponse(render_metrics(s), media_type="text/plain; version=0.0.4")
+    finally:
+        s.close()
+
+def start_job(s: Session, job_id: str, input_uri: str, input_type: str, target_langs: Optional[str] = None,
+              content_hash: Optional[str] = None) -> dict:
+    try:
+        langs = parse_langs(target_langs)
+    except ValueError as e:
+        raise HTTPException(400, str(e))
+    if not langs:
+        raise HTTPException(400, "No target languages")
+    job = Job(job_id=job_id, status="UPLOADED", input_uri=input_uri, input_type=input_type,
+              target_lang=langs[0], target_langs=langs, content_hash=content_hash)
+    s.add(job)
+    s.commit()
+    celery_app.send_task("run_job_pipeline", args=[job_id])
+    return {"job_id": job_id, "status": job.status, "target_langs": langs}
+
+# Sync endpoint: FastAPI runs it in a worker thread, so the spooled upload is copied to disk in chunks.
 @app.post("/jobs")
-async def create_job(file: UploadFile = File(...)):
+def create_job(file: UploadFile = File(...), target_langs: Optional[str] = Form(None)):
+    s = db()
+    try:
+        job_id = str(uuid.uuid4())
+        input_path, digest = save_upload(job_id, file.filename, file.file)
+        return start_job(s, job_id, input_path, "upload", target_langs, digest)
+    finally:
+        s.close()
+
+class IngestRequest(BaseModel):
+    path: Optional[str] = None
+    url: Optional[str] = None
+    target_langs: Optional[str] = None  # comma-separated, e.g. "fa,ar,tr"
+
+@app.post("/jobs/ingest")
+def ingest_job(req: IngestRequest):
+    if bool(req.path) == bool(req.url):
+        raise HTTPException(400, "Give exactly one of path or url")
+    s = db()
+    try:
+        job_id = str(uuid.uuid4())
+        if req.path:
+            if not ingest_path_allowed(req.path):
+                raise HTTPException(400, "Path not found or outside INGEST_PATH_ROOTS")
+            return start_job(s, job_id, str(Path(req.path).resolve()), "path", req.target_langs)
+        if not settings.ingest_url_enabled:
+            raise HTTPException(400, "URL ingest is disabled (INGEST_URL_ENABLED)")
+        try:
+            check_ingest_url(req.url)
+        except ValueError as e:
+            raise HTTPException(400, str(e))
+        # Downloaded by the audio worker, not here.
+        return start_job(s, job_id, req.url, "url", req.target_langs)
+    finally:
+        s.close()
+
+class UploadCreate(BaseModel):
+    filename: str
+    size: Optional[int] = None
+    target_langs: Optional[str] = None
+
+@app.post("/uploads")
+def create_upload(req: UploadCreate):
+    upload_id = partial_create(req.filename, req.size, req.target_langs)
+    return {"upload_id": upload_id, "offset": 0}
+
+@app.get("/uploads/{upload_id}")
+def upload_status(upload_id: str):
+    info = partial_info(upload_id)
+    if not info:
+        raise HTTPException(404, "Upload not found")
+    return {"upload_id": upload_id, **info}
+
+def chunk_range(headers, info: dict) -> Tuple[int, Optional[int]]:
+    # -> (start, expected body length or None). Content-Range is checked against the declared size before any
+    # body is read; without it, Upload-Offset (or the current offset) is the start and the length is open.
+    size = info["size"]
+    cr = headers.get("content-range")
+    if cr is None:
+        try:
+            return int(headers.get("upload-offset", info["offset"])), None
+        except ValueError:
+            raise HTTPException(400, "Malformed Upload-Offset")
+    m = re.fullmatch(r"bytes (\d+)-(\d+)/(\d+|\*)", cr.strip())
+    if not m:
+        raise HTTPException(400, "Malformed Content-Range")
+    start, end = int(m.group(1)), int(m.group(2))
+    total = None if m.group(3) == "*" else int(m.group(3))
+    if end < start:
+        raise HTTPException(400, "Content-Range end is before its start")
+    if total is not None and size is not None and total != size:
+        raise HTTPException(400, f"Content-Range total {total} does not match the declared size {size}")
+    limit = total if total is not None else size
+    if limit is not None and end >= limit:
+        raise HTTPException(416, f"Content-Range ends past the upload size {limit}")
+    return start, end - start + 1
+
+# Append a chunk at the current offset (Content-Range: bytes <start>-<end>/<total>, or Upload-Offset: <start>).
+# A mismatched start returns 409 with the offset to resume from. Disk writes go through the threadpool so a slow
+# disk does not stall the event loop.
+@app.put("/uploads/{upload_id}")
+async def upload_chunk(upload_id: str, request: Request):
+    info = await run_in_threadpool(partial_info, upload_id)
+    if not info:
+        raise HTTPException(404, "Upload not found")
+    start, expected = chunk_range(request.headers, info)
+    if start != info["offset"]:
+        raise HTTPException(409, {"offset": info["offset"]})
+    cap = expected if expected is not None else (info["size"] - start if info["size"] is not None else None)
+    length = request.headers.get("content-length")
+    if length is not None and length.isdigit() and (
+            (expected is not None and int(length) != expected) or (cap is not None and int(length) > cap)):
+        raise HTTPException(400, "Content-Length does not match Content-Range or exceeds the declared size")
+
+    try:
+        out = await run_in_threadpool(partial_open_locked, upload_id)
+    except BlockingIOError:
+        raise HTTPException(409, {"offset": info["offset"], "busy": True})
+    written = 0
+    try:
+        # Re-checked under the lock: a concurrent PUT may have appended since partial_info.
+        offset = os.fstat(out.fileno()).st_size
+        if start != offset:
+            raise HTTPException(409, {"offset": offset})
+        async for chunk in request.stream():
+            written += len(chunk)
+            if cap is not None and written > cap:
+                break
+            await run_in_threadpool(out.write, chunk)
+        if (cap is not None and written > cap) or (expected is not None and written != expected):
+            # Drop the partial chunk so the client can resend it from the same offset.
+            await run_in_threadpool(out.flush)
+            await run_in_threadpool(os.ftruncate, out.fileno(), start)
+            raise HTTPException(400, "Chunk body does not match Content-Range or exceeds the declared size")
+    finally:
+        await run_in_threadpool(out.close)
+    return {"upload_id": upload_id, "offset": start + written}
+
+@app.post("/uploads/{upload_id}/complete")
+def complete_upload(upload_id: str):
+    info = partial_info(upload_id)
+    if not info:
+        raise HTTPException(404, "Upload not found")
+    if info["size"] is not None and info["offset"] != info["size"]:
+        raise HTTPException(409, {"offset": info["offset"]})
+    try:
+        lock = partial_open_locked(upload_id)  # not while a chunk is still being written
+    except BlockingIOError:
+        raise HTTPException(409, {"offset": info["offset"], "busy": True})
     s = db()
     try:
         job_id = str(uuid.uuid4())
-        data = await file.read()
-        input_path = save_upload(job_id, file.filename, data)
-        job = Job(job_id=job_id, status="UPLOADED", input_uri=input_path, input_type="upload")
-        s.add(job)
-        s.commit()
-        celery_app.send_task("run_job_pipeline", args=[job_id])
-        return {"job_id": job_id, "status": job.status}
+        # Content hash is computed by the audio worker, keeping the 4 GB re-read off the API.
+        return start_job(s, job_id, partial_finish(upload_id, job_id), "upload", info.get("target_langs"))
+    finally:
+        lock.close()
+        s.close()
+
+def job_summary(job: Job, progress: dict, stages_done: dict) -> dict:
+    return {
+        "job_id": job.job_id,
+        "status": job.status,
+        "error": job.error,
+        "target_langs": job_langs(job),
+        "risk_level": job.risk_level,
+        "difficulty_score": job.difficulty_score,
+        "strategist_conf": job.strategist_conf,
+        "genre": job.genre,
+        "tone": job.tone,
+        "domain_tags": job.domain_tags,
+        "progress": progress,
+        "stages_done": stages_done,
+    }
+
+def job_summaries(s: Session, job_ids: List[str]) -> Dict[str, dict]:
+    # Three queries however many jobs: the rows, one GROUP BY for cue progress, and the language checkpoints.
+    jobs = s.execute(select(Job).where(Job.job_id.in_(job_ids))).scalars().all()
+    ids = [j.job_id for j in jobs]
+    progress, stages = jobs_progress(s, ids), jobs_lang_stages(s, ids)
+    return {j.job_id: job_summary(j, progress[j.job_id], stages[j.job_id]) for j in jobs}
+
+def split_ids(ids: str) -> List[str]:
+    out = list(dict.fromkeys(x.strip() for x in ids.split(",") if x.strip()))
+    if not out or len(out) > 500:
+        raise HTTPException(400, "ids must list 1-500 job ids")
+    return out
+
+@app.get("/jobs")
+def jobs_status(ids: str):
+    s = db()
+    try:
+        job_ids = split_ids(ids)
+        found = job_summaries(s, job_ids)
+        return [found.get(j, {"job_id": j, "status": "NOT_FOUND"}) for j in job_ids]
     finally:
         s.close()
 
@@ -41,30 +238,131 @@ async def create_job(file: UploadFile = File(...)):
 def job_status(job_id: str):
     s = db()
     try:
-        job = s.get(Job, job_id)
-        if not job:
+        found = job_summaries(s, [job_id])
+        if job_id not in found:
+            raise HTTPException(404, "Job not found")
+        return found[job_id]
+    finally:
+        s.close()
+
+# Where a job's time and money went: per-stage wall/busy time, DB queries, bytes, item counts and LLM cost.
+@app.get("/jobs/{job_id}/profile")
+def profile(job_id: str):
+    s = db()
+    try:
+        if not s.get(Job, job_id):
             raise HTTPException(404, "Job not found")
-        return {
-            "job_id": job.job_id,
-            "status": job.status,
-            "risk_level": job.risk_level,
-            "difficulty_score": job.difficulty_score,
-            "strategist_conf": job.strategist_conf,
-            "genre": job.genre,
-            "tone": job.tone,
-            "domain_tags": job.domain_tags,
-        }
+        return job_profile(s, job_id)
     finally:
         s.close()
 
+def load_summaries(job_ids: List[str]) -> Dict[str, dict]:
+    with SessionLocal() as s:
+        return job_summaries(s, job_ids)
+
+async def event_stream(request: Request, job_ids: List[str]):
+    # Subscribe first, then send the current state, so nothing published in between is lost.
+    # Each job gets an `end` event with its final status once it is DONE or FAILED; the stream ends after the
+    # last one (or when the client goes away).
+    sub = JobEvents(job_ids)
+    await sub.open()
+    try:
+        status: Dict[str, str] = {}
+        ended = set()
+
+        def end(job_id: str):
+            ended.add(job_id)
+            return sse({"type": "end", "job_id": job_id, "status": status[job_id]})
+
+        for job_id, summary in (await run_in_threadpool(load_summaries, job_ids)).items():
+            status[job_id] = summary["status"]
+            yield sse({"type": "snapshot", "job_id": job_id, "job": summary})
+            if summary["status"] in TERMINAL_STATUSES:
+                yield end(job_id)
+        while len(ended) < len(status) and not await request.is_disconnected():
+            ev = await sub.next()
+            if ev is None:
+                yield ": keepalive\n\n"
+                continue
+            yield sse(ev)
+            job_id = ev.get("job_id")
+            if ev.get("type") == "status" and job_id in status and job_id not in ended:
+                status[job_id] = ev["status"]
+                if ev["status"] in TERMINAL_STATUSES:
+                    yield end(job_id)
+    finally:
+        await sub.close()
+
+@app.get("/jobs/{job_id}/events")
+def job_events(job_id: str, request: Request):
+    return StreamingResponse(event_stream(request, [job_id]), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+@app.get("/events")
+def jobs_events(ids: str, request: Request):
+    return StreamingResponse(event_stream(request, split_ids(ids)), media_type="text/event-stream",
+                             headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"})
+
+def check_lang(s: Session, job_id: str, lang: Optional[str]) -> str:
+    job = s.get(Job, job_id)
+    if not job:
+        raise HTTPException(404, "Job not found")
+    lang = (lang or job.target_lang).lower()
+    if lang not in job_langs(job):
+        raise HTTPException(400, f"Job has no target language {lang!r}")
+    return lang
+
+# Cues that got a translation (or QA output) since the cursor; pass `next` back as `since` to continue.
+@app.get("/jobs/{job_id}/cues")
+def job_cues(job_id: str, lang: Optional[str] = None, since: Optional[str] = None, limit: int = 500):
+    s = db()
+    try:
+        lang = check_lang(s, job_id, lang)
+        try:
+            cues, nxt = cues_since(s, job_id, lang, since, max(1, min(limit, 5000)))
+        except ValueError:
+            raise HTTPException(400, "Invalid since cursor")
+        return {"job_id": job_id, "lang": lang, "cues": cues, "next": nxt}
+    finally:
+        s.close()
+
+# Partial subtitles while the job runs: cues in order up to the first one not translated yet (qa=true: not QA'd yet).
+@app.get("/jobs/{job_id}/stream/{fmt}")
+def stream(job_id: str, fmt: str, lang: Optional[str] = None, qa: bool = False):
+    if fmt not in ("srt", "vtt"):
+        raise HTTPException(400, "fmt must be srt or vtt")
+    s = db()
+    try:
+        lang = check_lang(s, job_id, lang)
+    except Exception:
+        s.close()
+        raise
+    media = "application/x-subrip" if fmt == "srt" else "text/vtt"
+    return StreamingResponse(stream_subtitles(s, job_id, lang, fmt, qa), media_type=f"{media}; charset=utf-8",
+                             headers={"Content-Disposition": f'inline; filename="{job_id}__{lang}.partial.{fmt}"'})
+
+# kind: en_srt | srt | fa_srt | qa_report | librarian; lang picks the target language (default: the job's first).
 @app.get("/jobs/{job_id}/download/{kind}")
-def download(job_id: str, kind: str):
+def download(job_id: str, kind: str, lang: Optional[str] = None):
     base = Path("/data")
+    if kind == "fa_srt":
+        lang = "fa"
+    elif not lang:
+        s = db()
+        try:
+            job = s.get(Job, job_id)
+            lang = job.target_lang if job else "fa"
+        finally:
+            s.close()
+    lang = lang.lower()
+    if not LANG_CODE.fullmatch(lang):
+        raise HTTPException(400, "Invalid lang")
     m = {
         "en_srt": base / "outputs" / f"{job_id}__en.srt",
-        "fa_srt": base / "outputs" / f"{job_id}__fa.srt",
-        "qa_report": base / "reports" / f"{job_id}__qa_report.json",
-        "librarian": base / "reports" / f"{job_id}__librarian.json",
+        "srt": base / "outputs" / f"{job_id}__{lang}.srt",
+        "fa_srt": base / "outputs" / f"{job_id}__{lang}.srt",
+        "qa_report": base / "reports" / f"{job_id}__{report_name('qa_report', lang)}",
+        "librarian": base / "reports" / f"{job_id}__{report_name('librarian', lang)}",
     }
     p = m.get(kind)
     if not p:
@@ -1,13 +1,19 @@
 import uuid
 from datetime import datetime
-from sqlalchemy import String, DateTime, Boolean, Integer, Numeric, ForeignKey, Text, JSON
+from sqlalchemy import String, DateTime, Boolean, Integer, BigInteger, Float, Numeric, ForeignKey, Text, JSON, Index, func
 from sqlalchemy.orm import Mapped, mapped_column, relationship
-from pgvector.sqlalchemy import Vector
+from pgvector.sqlalchemy import Vector, HALFVEC
 from .db import Base
+from .config import settings
 
 def uuid4():
     return str(uuid.uuid4())
 
+def embedding_type():
+    if settings.tm_vector_type == "halfvec":
+        return HALFVEC(settings.embedding_dimensions)
+    return Vector(settings.embedding_dimensions)
+
 class Job(Base):
     __tablename__ = "jobs"
     job_id: Mapped[str] = mapped_column(String, primary_key=True, default=uuid4)
@@ -15,9 +21,14 @@ class Job(Base):
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
     source_lang: Mapped[str] = mapped_column(String, default="en")
     target_lang: Mapped[str] = mapped_column(String, default="fa")
+    # All target languages (target_lang is the first); None on jobs created before multi-language support.
+    target_langs: Mapped[list | None] = mapped_column(JSON, nullable=True)
     status: Mapped[str] = mapped_column(String, default="UPLOADED")
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)  # why the job is FAILED
     input_type: Mapped[str] = mapped_column(String, default="upload")
     input_uri: Mapped[str] = mapped_column(String)
+    content_hash: Mapped[str | None] = mapped_column(String, nullable=True, index=True)
+    audio_fingerprint: Mapped[str | None] = mapped_column(String, nullable=True)
     normalized_uri: Mapped[str | None] = mapped_column(String, nullable=True)
     asr_json_uri: Mapped[str | None] = mapped_column(String, nullable=True)
     final_srt_uri: Mapped[str | None] = mapped_column(String, nullable=True)
@@ -39,9 +50,15 @@ class Job(Base):
     glossary: Mapped[list["JobGlossaryTerm"]] = relationship(back_populates="job", cascade="all, delete-orphan")
 
 class JobCue(Base):
+    # One row per (cue, target language); fa_text / fa_text_qa hold the target-language text.
     __tablename__ = "job_cues"
+    __table_args__ = (
+        Index("ix_job_cues_job_lang", "job_id", "target_lang", "cue_index"),
+        Index("ix_job_cues_job_lang_updated", "job_id", "target_lang", "updated_at", "cue_id"),
+    )
     cue_id: Mapped[str] = mapped_column(String, primary_key=True, default=uuid4)
     job_id: Mapped[str] = mapped_column(String, ForeignKey("jobs.job_id", ondelete="CASCADE"))
+    target_lang: Mapped[str] = mapped_column(String, default="fa")
     cue_index: Mapped[int] = mapped_column(Integer)
     start_ms: Mapped[int] = mapped_column(Integer)
     end_ms: Mapped[int] = mapped_column(Integer)
@@ -54,12 +71,39 @@ class JobCue(Base):
     tm_confidence: Mapped[float | None] = mapped_column(Numeric(5,2), nullable=True)
     qa_score: Mapped[float | None] = mapped_column(Numeric(5,2), nullable=True)
     issues: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    # Wall-clock DB time of the last write (bulk updates included); keyset cursor for GET /jobs/{id}/cues.
+    updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), server_default=func.clock_timestamp(), onupdate=func.clock_timestamp())
     job: Mapped["Job"] = relationship(back_populates="cues")
 
+class JobStageCheckpoint(Base):
+    __tablename__ = "job_stage_checkpoints"
+    job_id: Mapped[str] = mapped_column(String, ForeignKey("jobs.job_id", ondelete="CASCADE"), primary_key=True)
+    stage: Mapped[str] = mapped_column(String, primary_key=True)
+    completed_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    artifacts: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+
+class JobSpan(Base):
+    # One row per timed piece of a job: a whole stage, or the plan/unit/finish tasks of a fanned-out one.
+    __tablename__ = "job_spans"
+    span_id: Mapped[str] = mapped_column(String, primary_key=True, default=uuid4)
+    job_id: Mapped[str] = mapped_column(String, ForeignKey("jobs.job_id", ondelete="CASCADE"), index=True)
+    name: Mapped[str] = mapped_column(String)
+    kind: Mapped[str] = mapped_column(String, default="stage")
+    started_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    finished_at: Mapped[datetime] = mapped_column(DateTime(timezone=True))
+    duration_s: Mapped[float] = mapped_column(Float)
+    db_queries: Mapped[int] = mapped_column(Integer, default=0)
+    db_time_s: Mapped[float] = mapped_column(Float, default=0.0)
+    bytes: Mapped[int | None] = mapped_column(BigInteger, nullable=True)
+    counts: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    status: Mapped[str] = mapped_column(String, default="success")
+    error: Mapped[str | None] = mapped_column(Text, nullable=True)
+
 class JobGlossaryTerm(Base):
     __tablename__ = "job_glossary_terms"
     term_id: Mapped[str] = mapped_column(String, primary_key=True, default=uuid4)
     job_id: Mapped[str] = mapped_column(String, ForeignKey("jobs.job_id", ondelete="CASCADE"))
+    target_lang: Mapped[str] = mapped_column(String, default="fa")
     en_term: Mapped[str] = mapped_column(String)
     fa_term: Mapped[str] = mapped_column(String)
     term_type: Mapped[str | None] = mapped_column(String, nullable=True)
@@ -70,6 +114,7 @@ class JobGlossaryTerm(Base):
 
 class TMEntry(Base):
     __tablename__ = "tm_entries"
+    __table_args__ = (Index("uq_tm_entries_lang_hash", "target_lang", "en_hash", unique=True),)
     tm_entry_id: Mapped[str] = mapped_column(String, primary_key=True, default=uuid4)
     created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
     updated_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
@@ -83,7 +128,22 @@ class TMEntry(Base):
     confidence: Mapped[int | None] = mapped_column(Integer, nullable=True)
     en_hash: Mapped[str] = mapped_column(String)
     domain_tags: Mapped[dict | None] = mapped_column(JSON, nullable=True)
-    embedding: Mapped[list[float] | None] = mapped_column(Vector(3072), nullable=True)
+    embedding: Mapped[list[float] | None] = mapped_column(embedding_type(), nullable=True)
+
+class EmbeddingCacheEntry(Base):
+    __tablename__ = "embedding_cache"
+    en_hash: Mapped[str] = mapped_column(String, primary_key=True)
+    embedding_model: Mapped[str] = mapped_column(String, primary_key=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    embedding: Mapped[list[float]] = mapped_column(embedding_type())
+
+class TMJudgeVerdict(Base):
+    __tablename__ = "tm_judge_verdicts"
+    en_hash: Mapped[str] = mapped_column(String, primary_key=True)
+    tm_entry_id: Mapped[str] = mapped_column(String, ForeignKey("tm_entries.tm_entry_id", ondelete="CASCADE"), primary_key=True)
+    reuse: Mapped[bool] = mapped_column(Boolean)
+    reason: Mapped[str | None] = mapped_column(Text, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
 
 class LLMRun(Base):
     __tablename__ = "llm_runs"
@@ -97,9 +157,28 @@ class LLMRun(Base):
     finished_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
     prompt_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
     completion_tokens: Mapped[int | None] = mapped_column(Integer, nullable=True)
-    cost_usd: Mapped[float | None] = mapped_column(Numeric(10,4), nullable=True)
+    # 8 decimals: a single cheap call (or an embedding batch) costs well under $0.0001.
+    cost_usd: Mapped[float | None] = mapped_column(Numeric(14,8), nullable=True)
     status: Mapped[str] = mapped_column(String, default="success")
     error_message: Mapped[str | None] = mapped_column(Text, nullable=True)
     input_sha: Mapped[str | None] = mapped_column(String, nullable=True)
     output_sha: Mapped[str | None] = mapped_column(String, nullable=True)
     meta: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    cache_hit: Mapped[bool] = mapped_column(Boolean, default=False)
+    # One entry per model tried: {"model", "ms", "status", "error"?}; the row itself is the call's final outcome.
+    attempts: Mapped[list | None] = mapped_column(JSON, nullable=True)
+
+class LLMCacheEntry(Base):
+    __tablename__ = "llm_cache"
+    cache_key: Mapped[str] = mapped_column(String, primary_key=True)
+    agent_name: Mapped[str] = mapped_column(String)
+    model: Mapped[str] = mapped_column(String)
+    temperature: Mapped[float] = mapped_column(Numeric(4,3))
+    max_tokens: Mapped[int] = mapped_column(Integer)
+    input_sha: Mapped[str] = mapped_column(String)
+    content: Mapped[str] = mapped_column(Text)
+    usage: Mapped[dict | None] = mapped_column(JSON, nullable=True)
+    created_at: Mapped[datetime] = mapped_column(DateTime(timezone=True), default=datetime.utcnow)
+    expires_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    last_hit_at: Mapped[datetime | None] = mapped_column(DateTime(timezone=True), nullable=True)
+    hits: Mapped[int] = mapped_column(Integer, default=0)
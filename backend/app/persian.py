@@ -14,3 +14,8 @@ def normalize_persian_spacing(s: str) -> str:
 def strip_speaker_ids(s: str) -> str:
     s = (s or "").strip()
     return re.sub(r"^(speaker\s*\d+|[A-Z][A-Z0-9 _-]{1,30})\s*:\s*", "", s, flags=re.IGNORECASE).strip()
+
+def fold_persian(s: str) -> str:
+    # For containment checks only: ZWNJ/spacing and Arabic-vs-Persian letter variants don't count.
+    s = (s or "").replace("\u200c", " ").replace("ي", "ی").replace("ك", "ک").replace("ى", "ی")
+    return re.sub(r"\s+", " ", s).strip()
@@ -1,78 +1,269 @@
-import json
+import json, re
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from .models import Job, JobCue, JobGlossaryTerm, TMEntry
-from .storage import save_output, save_report, job_workdir
-from .audio_prep import ffmpeg_normalize, cobra_vad_optional
-from .asr import transcribe_with_assemblyai
+from .models import Job, JobCue, JobGlossaryTerm, JobStageCheckpoint
+from .storage import (save_output, save_report, report_name, job_workdir, file_sha256, link_or_copy, cas_find, cas_put,
+                      download_url, write_text_replacing)
+from .audio_prep import ffmpeg_normalize, cobra_vad_optional, decoded_audio_sha256
+from .asr import transcribe
 from .segmenter import segment_from_words, segment_fallback
 from .risk_router import risk_level
-from .agents import strategist, terminologist, translator, qa_polisher, librarian_should_store
+from .agents import strategist, terminologist, translate_adaptive, pack_translation_batches, qa_adaptive, librarian_should_store
+from .glossary import GlossaryMatcher
 from .srt_builder import Cue, build_srt, clamp_non_overlapping
-from .tm import embed_texts, tm_topk, composite_confidence, judge_tm_reuse, en_hash
+from .tm import embed_texts, tm_exact_lookup, tm_topk_batch, tm_store_entries, composite_confidence, judge_tm_reuse_batch, en_hash, normalize_for_hash
 from .config import settings
+from .langs import job_langs
+from .db import SessionLocal
+from .concurrency import run_bounded
+from .events import publish
+from .progress import job_progress
+from .telemetry import span
 
-def set_status(db: Session, job: Job, status: str):
+def set_status(db: Session, job: Job, status: str, error: Optional[str] = None):
     job.status = status
+    job.error = error
     db.add(job)
     db.commit()
+    publish(job.job_id, {"type": "status", "status": status, **({"error": error} if error else {})})
 
-def run_pipeline(db: Session, job_id: str):
-    job = db.get(Job, job_id)
-    if not job:
-        raise RuntimeError("Job not found")
+def mark_failed(db: Session, job: Job, error: str):
+    set_status(db, job, "FAILED", error[:2000])
+
+def publish_progress(db: Session, job_id: str, stage: str, lang: str, done: int):
+    publish(job_id, {"type": "progress", "stage": stage, "lang": lang, "done": done, "progress": job_progress(db, job_id)})
+
+def dedupe_cues(cues: List[JobCue]) -> Dict[str, List[JobCue]]:
+    # Groups repeated lines by normalized English text; keyed by the first occurrence's cue_id.
+    exclude = re.compile(settings.translation_dedupe_exclude_regex) if settings.translation_dedupe_exclude_regex else None
+    groups: Dict[str, List[JobCue]] = {}
+    first: Dict[str, str] = {}
+    for c in cues:
+        key = normalize_for_hash(c.en_text)
+        if not settings.translation_dedupe or (exclude and exclude.search(key)):
+            key = c.cue_id
+        rep = first.setdefault(key, c.cue_id)
+        groups.setdefault(rep, []).append(c)
+    return groups
+
+def qa_shards(cues: List[JobCue], size: int, overlap: int) -> List[Dict[str, Any]]:
+    # Each shard owns cues[i:i+size]; `overlap` neighbours on either side ride along as context only.
+    size = max(1, size)
+    overlap = max(0, overlap)
+    shards = []
+    for i in range(0, len(cues), size):
+        lo, hi = max(0, i - overlap), min(len(cues), i + size + overlap)
+        core_ids = [c.cue_id for c in cues[i:i+size]]
+        core = set(core_ids)
+        window = cues[lo:hi]
+        payload = []
+        for c in window:
+            item = {"cue_id": c.cue_id, "start_ms": c.start_ms, "end_ms": c.end_ms, "en_text": c.en_text}
+            if c.cue_id not in core:
+                item["context_only"] = True
+            payload.append(item)
+        shards.append({
+            "core_ids": core_ids,
+            "cues": payload,
+            "translations": {c.cue_id: (c.fa_text or "") for c in window},
+        })
+    return shards
+
+STAGES = ["AUDIO_PREP", "ASR", "SEGMENT", "STRATEGY", "TM_GATING", "TERMS", "TRANSLATE", "QA", "FINALIZE", "LIBRARIAN"]
+# Run once per target language (in parallel across languages); the stages before them are shared.
+LANG_STAGES = ["TM_GATING", "TERMS", "TRANSLATE", "QA", "FINALIZE", "LIBRARIAN"]
+SHARED_STAGES = [st for st in STAGES if st not in LANG_STAGES]
+
+def stage_key(stage: str, lang: Optional[str] = None) -> str:
+    # Checkpoint / status key: "SEGMENT", "TRANSLATE:ar".
+    return f"{stage}:{lang}" if stage in LANG_STAGES else stage
+
+def split_key(key: str) -> Tuple[str, Optional[str]]:
+    stage, _, lang = key.partition(":")
+    return stage, (lang or None)
+
+# Job.status while the per-language stages run; each language's own position is in its checkpoints and "stage" events.
+LANG_STATUS = "LANGUAGES"
+
+def load_cues(db: Session, job_id: str, lang: str) -> List[JobCue]:
+    return db.query(JobCue).filter(JobCue.job_id == job_id, JobCue.target_lang == lang).order_by(JobCue.cue_index).all()
+
+def lang_cues(job_id: str, lang: str):
+    return (JobCue.job_id == job_id, JobCue.target_lang == lang)
+
+def load_asr(job: Job) -> dict:
+    return json.loads(Path(job.asr_json_uri).read_text(encoding="utf-8"))
+
+def load_glossary(db: Session, job_id: str, lang: str) -> List[Dict[str, Any]]:
+    return [
+        {"en_term": t.en_term, "fa_term": t.fa_term, "term_type": t.term_type, "mandatory": t.mandatory}
+        for t in db.query(JobGlossaryTerm).filter(JobGlossaryTerm.job_id == job_id, JobGlossaryTerm.target_lang == lang).all()
+    ]
+
+def completed_stages(db: Session, job_id: str) -> Dict[str, dict]:
+    # A checkpoint only counts while the files it recorded still exist.
+    out = {}
+    for cp in db.query(JobStageCheckpoint).filter(JobStageCheckpoint.job_id == job_id).all():
+        arts = cp.artifacts or {}
+        if all(Path(f).exists() for f in arts.get("files", [])):
+            out[cp.stage] = arts
+    return out
+
+def mark_done(db: Session, job_id: str, stage: str, artifacts: Optional[dict] = None):
+    db.merge(JobStageCheckpoint(job_id=job_id, stage=stage, completed_at=datetime.utcnow(), artifacts=artifacts or {}))
+    db.commit()
+    publish(job_id, {"type": "stage_done", "stage": stage})
+
+def clear_checkpoints_from(db: Session, job_id: str, stage: str, lang: Optional[str] = None):
+    # A shared stage invalidates every later checkpoint; a language stage (with lang) only that language's.
+    later = set(STAGES[STAGES.index(stage):])
+    keys = [
+        cp.stage for cp in db.query(JobStageCheckpoint).filter(JobStageCheckpoint.job_id == job_id).all()
+        if split_key(cp.stage)[0] in later and (lang is None or split_key(cp.stage)[1] in (None, lang))
+    ]
+    if keys:
+        db.query(JobStageCheckpoint).filter(
+            JobStageCheckpoint.job_id == job_id, JobStageCheckpoint.stage.in_(keys)
+        ).delete(synchronize_session=False)
+    db.commit()
+
+def reset_from(db: Session, job_id: str, stage: str, lang: Optional[str] = None):
+    clear_checkpoints_from(db, job_id, stage, lang)
+    # Otherwise a forced TRANSLATE/QA would resume and skip every cue an earlier run finished.
+    scope = [JobCue.job_id == job_id] + ([JobCue.target_lang == lang] if lang else [])
+    if stage == "TRANSLATE":
+        db.query(JobCue).filter(*scope, JobCue.needs_translation.is_(True)).update({"fa_text": None})
+    if stage in ("TRANSLATE", "QA"):
+        db.query(JobCue).filter(*scope).update({"fa_text_qa": None, "qa_score": None, "issues": None})
+    db.commit()
+
+def content_keys(db: Session, job: Job) -> List[str]:
+    if not settings.content_store_enabled:
+        return []
+    if not job.content_hash:
+        job.content_hash = file_sha256(job.input_uri)
+    if settings.fingerprint_decoded_audio and not job.audio_fingerprint:
+        job.audio_fingerprint = decoded_audio_sha256(job.input_uri)
+    db.commit()
+    keys = [f"sha256:{job.content_hash}"]
+    if job.audio_fingerprint:
+        keys.append(f"audio:{job.audio_fingerprint}")
+    return keys
 
-    set_status(db, job, "AUDIO_PREP")
-    normalized = ffmpeg_normalize(job.input_uri, job_id)
-    normalized = cobra_vad_optional(normalized, job_id)
+def asr_store_name() -> str:
+    # Chunking changes the transcript (cut points, overlap dedupe), so its settings are part of the key.
+    if settings.asr_chunk_s <= 0:
+        return f"asr-{settings.asr_backend}-whole.json"
+    return (f"asr-{settings.asr_backend}-c{settings.asr_chunk_s}-min{settings.asr_chunk_min_s}"
+            f"-ov{settings.asr_chunk_overlap_s:g}-s{settings.asr_chunk_search_s}.json")
+
+def normalize_audio(db: Session, job: Job, keys: List[str]) -> str:
+    wd = job_workdir(job.job_id)
+    cached = cas_find(keys, "normalized.wav")
+    if cached:
+        normalized = link_or_copy(cached, wd / "normalized.wav")
+    else:
+        normalized = ffmpeg_normalize(job.input_uri, job.job_id)
+        normalized = cobra_vad_optional(normalized, job.job_id)
+        cas_put(keys, "normalized.wav", normalized)
     job.normalized_uri = normalized
     db.commit()
+    return normalized
+
+def fetch_input(db: Session, job: Job):
+    if job.input_type == "url" and job.input_uri.startswith(("http://", "https://")):
+        job.input_uri, job.content_hash = download_url(job.job_id, job.input_uri)
+        db.commit()
+
+def stage_audio_prep(db: Session, job: Job) -> dict:
+    fetch_input(db, job)
+    keys = content_keys(db, job)
+    if cas_find(keys, asr_store_name()) and not cas_find(keys, "normalized.wav"):
+        # Transcript already known for this content: nothing downstream needs the audio.
+        return {"skipped": "asr cached"}
+    normalized = normalize_audio(db, job, keys)
+    return {"files": [normalized]}
 
-    set_status(db, job, "ASR")
-    asr = transcribe_with_assemblyai(normalized)
-    wd = job_workdir(job_id)
-    asr_json = wd / "asr.json"
-    asr_json.write_text(json.dumps(asr, ensure_ascii=False, indent=2), encoding="utf-8")
+def stage_asr(db: Session, job: Job) -> dict:
+    keys = content_keys(db, job)
+    asr_json = job_workdir(job.job_id) / "asr.json"
+    cached = cas_find(keys, asr_store_name())
+    if cached:
+        link_or_copy(cached, asr_json)
+        asr = json.loads(asr_json.read_text(encoding="utf-8"))
+    else:
+        normalized = job.normalized_uri if job.normalized_uri and Path(job.normalized_uri).exists() else normalize_audio(db, job, keys)
+        asr = transcribe(normalized)
+        write_text_replacing(asr_json, json.dumps(asr, ensure_ascii=False, indent=2))
+        cas_put(keys, asr_store_name(), str(asr_json))
     job.asr_json_uri = str(asr_json)
     db.commit()
+    return {"files": [str(asr_json)], "words": len(asr.get("words") or []), "reused": bool(cached)}
 
-    set_status(db, job, "SEGMENT")
+def stage_segment(db: Session, job: Job) -> dict:
+    asr = load_asr(job)
     words = asr.get("words") or []
     seg = segment_from_words(words) if words else segment_fallback(asr.get("text",""))
-    db.query(JobCue).filter(JobCue.job_id == job_id).delete()
-    for i, c in enumerate(seg, start=1):
-        db.add(JobCue(job_id=job_id, cue_index=i, start_ms=c.start_ms, end_ms=c.end_ms, en_text=c.text))
+    db.query(JobCue).filter(JobCue.job_id == job.job_id).delete()
+    # Same timing and English text for every target language; each gets its own rows to translate.
+    for lang in job_langs(job):
+        for i, c in enumerate(seg, start=1):
+            db.add(JobCue(job_id=job.job_id, target_lang=lang, cue_index=i, start_ms=c.start_ms, end_ms=c.end_ms, en_text=c.text))
     db.commit()
 
-    cues = db.query(JobCue).filter(JobCue.job_id == job_id).order_by(JobCue.cue_index).all()
+    cues = load_cues(db, job.job_id, job_langs(job)[0])
     en_srt = build_srt(clamp_non_overlapping([Cue(i, c.start_ms, c.end_ms, c.en_text) for i,c in enumerate(cues, start=1)]))
-    save_output(job_id, "en.srt", en_srt)
+    return {"files": [save_output(job.job_id, "en.srt", en_srt)], "cues": len(cues)}
 
-    set_status(db, job, "STRATEGY")
-    sample_text = (asr.get("text","") or "")[:20000]
+def stage_strategy(db: Session, job: Job) -> dict:
+    sample_text = (load_asr(job).get("text","") or "")[:20000]
     rl = risk_level(sample_text)
     job.risk_level = rl
     db.commit()
 
-    st = strategist(db, job_id, rl, sample_text)
+    st = strategist(db, job.job_id, rl, sample_text)
     job.genre = st.get("genre")
     job.tone = st.get("tone")
     job.domain_tags = st.get("domain_tags", [])
     job.difficulty_score = int(st.get("difficulty_score", 5))
     job.strategist_conf = int(st.get("strategist_confidence", 70))
     db.commit()
+    return {"strategist": st}
+
+def stage_tm_gating(db: Session, job: Job, lang: str) -> dict:
+    job_id = job.job_id
+    cues = load_cues(db, job_id, lang)
+    for c in cues:
+        c.tm_reused, c.tm_entry_id, c.tm_confidence = False, None, None
+        c.needs_translation, c.fa_text = True, None
+        c.fa_text_qa, c.qa_score, c.issues = None, None, None
+    exact = tm_exact_lookup(db, [en_hash(c.en_text) for c in cues], lang)
+    rest = []
+    for c in cues:
+        hit = exact.get(en_hash(c.en_text))
+        if hit is None:
+            rest.append(c)
+            continue
+        c.tm_reused = True
+        c.tm_entry_id = hit.tm_entry_id
+        c.needs_translation = False
+        c.fa_text = hit.fa_text
+        c.tm_confidence = 1.0
 
-    set_status(db, job, "TM_GATING")
-    cues = db.query(JobCue).filter(JobCue.job_id == job_id).order_by(JobCue.cue_index).all()
-    embeddings = embed_texts([c.en_text for c in cues])
+    embeddings = embed_texts([c.en_text for c in rest]) if rest else []
+    matches = tm_topk_batch(db, embeddings, k=int(settings.tm_topk), lang=lang)
 
-    for c, emb in zip(cues, embeddings):
-        cands = tm_topk(db, emb, k=8)
+    borderline = []
+    for c, cands in zip(rest, matches):
         if not cands:
             c.needs_translation = True
             continue
-        best = cands[0]
-        sim_guess = 0.90
-        conf = composite_confidence(c.en_text, best.en_text, sim_guess)
+        best, conf = max(
+            ((e, composite_confidence(c.en_text, e.en_text, sim)) for e, sim in cands),
+            key=lambda x: x[1],
+        )
         c.tm_confidence = conf
         if conf >= settings.tm_auto_reuse_threshold:
             c.tm_reused = True
@@ -80,68 +271,155 @@ def run_pipeline(db: Session, job_id: str):
             c.needs_translation = False
             c.fa_text = best.fa_text
         elif conf >= settings.tm_judge_threshold:
-            if judge_tm_reuse(db, job_id, c.en_text, best.fa_text):
-                c.tm_reused = True
-                c.tm_entry_id = best.tm_entry_id
-                c.needs_translation = False
-                c.fa_text = best.fa_text
-            else:
-                c.needs_translation = True
+            borderline.append((c, best))
+        else:
+            c.needs_translation = True
+
+    verdicts = judge_tm_reuse_batch(db, job_id, [
+        {"id": c.cue_id, "en_text": c.en_text, "fa_text": best.fa_text, "tm_entry_id": best.tm_entry_id}
+        for c, best in borderline
+    ], lang)
+    for c, best in borderline:
+        if verdicts.get(c.cue_id):
+            c.tm_reused = True
+            c.tm_entry_id = best.tm_entry_id
+            c.needs_translation = False
+            c.fa_text = best.fa_text
         else:
             c.needs_translation = True
     db.commit()
+    return {"exact": len(cues) - len(rest), "judged": len(borderline), "reused": sum(1 for c in cues if c.tm_reused)}
 
-    glossary_terms = []
-    if bool(st.get("needs_terminologist")) and job.difficulty_score >= 4:
-        set_status(db, job, "TERMS")
-        term_out = terminologist(db, job_id, job.difficulty_score, sample_text)
-        db.query(JobGlossaryTerm).filter(JobGlossaryTerm.job_id == job_id).delete()
-        for t in term_out.get("terms", []):
-            db.add(JobGlossaryTerm(
-                job_id=job_id,
-                en_term=t["en_term"],
-                fa_term=t["fa_term"],
-                term_type=t.get("term_type"),
-                mandatory=bool(t.get("mandatory", True)),
-                confidence=t.get("confidence"),
-                notes=t.get("notes"),
-            ))
-            glossary_terms.append(t)
-        db.commit()
-    else:
-        for t in db.query(JobGlossaryTerm).filter(JobGlossaryTerm.job_id == job_id).all():
-            glossary_terms.append({"en_term": t.en_term, "fa_term": t.fa_term, "term_type": t.term_type, "mandatory": t.mandatory})
-
-    set_status(db, job, "TRANSLATE")
-    need = [c for c in cues if c.needs_translation]
-    bs = int(settings.translation_batch_size)
-    for i in range(0, len(need), bs):
-        batch = need[i:i+bs]
-        payload = [{"cue_id": c.cue_id, "start_ms": c.start_ms, "end_ms": c.end_ms, "en_text": c.en_text} for c in batch]
-        out = translator(db, job_id, job.difficulty_score, glossary_terms, payload)
-        for c in batch:
-            c.fa_text = out.get(c.cue_id, c.fa_text)
+def stage_terms(db: Session, job: Job, st: dict, lang: str) -> dict:
+    if not (bool(st.get("needs_terminologist")) and job.difficulty_score >= 4):
+        return {"skipped": True}
+    sample_text = (load_asr(job).get("text","") or "")[:20000]
+    term_out = terminologist(db, job.job_id, job.difficulty_score, sample_text, lang)
+    db.query(JobGlossaryTerm).filter(JobGlossaryTerm.job_id == job.job_id, JobGlossaryTerm.target_lang == lang).delete()
+    for t in term_out.get("terms", []):
+        db.add(JobGlossaryTerm(
+            job_id=job.job_id,
+            target_lang=lang,
+            en_term=t["en_term"],
+            fa_term=t.get("target_term") or t["fa_term"],
+            term_type=t.get("term_type"),
+            mandatory=bool(t.get("mandatory", True)),
+            confidence=t.get("confidence"),
+            notes=t.get("notes"),
+        ))
     db.commit()
+    return {"terms": len(term_out.get("terms", []))}
 
-    set_status(db, job, "QA")
-    payload = [{"cue_id": c.cue_id, "start_ms": c.start_ms, "end_ms": c.end_ms, "en_text": c.en_text} for c in cues]
-    translations = {c.cue_id: (c.fa_text or "") for c in cues}
-    qa = qa_polisher(db, job_id, job.difficulty_score, glossary_terms, payload, translations)
+# TRANSLATE and QA are split into plan / unit / finish so the same units can run on the
+# in-process thread pool (run_pipeline) or as individual Celery tasks (tasks.pipeline_stage).
 
-    for c in cues:
-        c.fa_text_qa = qa.get("polished", {}).get(c.cue_id, c.fa_text or "")
-        c.qa_score = qa.get("qa_scores", {}).get(c.cue_id)
-        c.issues = {"issues": qa.get("issues", {}).get(c.cue_id, [])}
+def plan_translate(db: Session, job: Job, lang: str) -> List[Dict[str, Any]]:
+    # Resumable: cues translated by an earlier attempt keep their fa_text and are not re-sent.
+    need = [c for c in load_cues(db, job.job_id, lang) if c.needs_translation and c.fa_text is None]
+    groups = dedupe_cues(need)
+    reps = [g[0] for g in groups.values()]
+    batches = pack_translation_batches(
+        job.difficulty_score, load_glossary(db, job.job_id, lang),
+        [{"cue_id": c.cue_id, "start_ms": c.start_ms, "end_ms": c.end_ms, "en_text": c.en_text} for c in reps],
+    )
+    return [
+        {"lang": lang, "cues": batch, "targets": {p["cue_id"]: [c.cue_id for c in groups[p["cue_id"]]] for p in batch}}
+        for batch in batches
+    ]
+
+def translate_unit(db: Session, job_id: str, difficulty: int, unit: Dict[str, Any], matcher: Optional[GlossaryMatcher] = None) -> int:
+    matcher = matcher or GlossaryMatcher(load_glossary(db, job_id, unit["lang"]))
+    terms = matcher.terms_in(p["en_text"] for p in unit["cues"])
+    out = translate_adaptive(db, job_id, difficulty, terms, unit["cues"], unit["lang"])
+    n = 0
+    for rep, targets in unit["targets"].items():
+        fa = out.get(rep)
+        if fa is None:
+            continue
+        db.query(JobCue).filter(JobCue.cue_id.in_(targets)).update({"fa_text": fa}, synchronize_session=False)
+        n += len(targets)
     db.commit()
+    publish_progress(db, job_id, "TRANSLATE", unit["lang"], n)
+    return n
+
+def finish_translate(db: Session, job: Job, lang: str) -> dict:
+    scope = lang_cues(job.job_id, lang)
+    left = db.query(JobCue).filter(*scope, JobCue.needs_translation.is_(True), JobCue.fa_text.is_(None)).count()
+    if left:
+        raise RuntimeError(f"{left} {lang} cues are still untranslated")
+    return {"translated": db.query(JobCue).filter(*scope, JobCue.needs_translation.is_(True)).count()}
 
-    set_status(db, job, "FINALIZE")
-    fa_cues = [Cue(i, c.start_ms, c.end_ms, (c.fa_text_qa or c.fa_text or "").strip()) for i, c in enumerate(cues, start=1)]
-    fa_srt = build_srt(clamp_non_overlapping(fa_cues))
-    job.final_srt_uri = save_output(job_id, "fa.srt", fa_srt)
+def plan_qa(db: Session, job: Job, lang: str) -> List[Dict[str, Any]]:
+    # Shards whose cues all have QA output from an earlier attempt are not re-sent.
+    cues = load_cues(db, job.job_id, lang)
+    pending = {c.cue_id for c in cues if c.fa_text_qa is None}
+    shards = qa_shards(cues, int(settings.qa_shard_size), int(settings.qa_shard_overlap))
+    return [{**sh, "lang": lang} for sh in shards if pending.intersection(sh["core_ids"])]
+
+def qa_unit(db: Session, job_id: str, difficulty: int, shard: Dict[str, Any], matcher: Optional[GlossaryMatcher] = None) -> int:
+    matcher = matcher or GlossaryMatcher(load_glossary(db, job_id, shard["lang"]))
+    terms = matcher.terms_in(c["en_text"] for c in shard["cues"])
+    qa = qa_adaptive(db, job_id, difficulty, terms, shard["cues"], shard["translations"], shard["lang"])
+    cues = db.query(JobCue).filter(JobCue.cue_id.in_(shard["core_ids"])).all()
+    for c in cues:
+        cid = c.cue_id
+        c.fa_text_qa = qa.get("polished", {}).get(cid, c.fa_text or "")
+        c.qa_score = qa.get("qa_scores", {}).get(cid)
+        c.issues = {"issues": qa.get("issues", {}).get(cid, [])}
+        missing = matcher.missing_mandatory(c.en_text, c.fa_text_qa)
+        if missing:
+            c.issues["glossary_missing"] = missing
     db.commit()
+    publish_progress(db, job_id, "QA", shard["lang"], len(cues))
+    return len(cues)
+
+def finish_qa(db: Session, job: Job, lang: str) -> dict:
+    scope = lang_cues(job.job_id, lang)
+    left = db.query(JobCue).filter(*scope, JobCue.fa_text_qa.is_(None)).count()
+    if left:
+        raise RuntimeError(f"{left} {lang} cues have no QA output")
+    return {"cues": db.query(JobCue).filter(*scope).count()}
+
+def run_units(job: Job, lang: str, unit_fn, units: List[Dict[str, Any]], max_in_flight: int, retries: int, what: str):
+    # Worker threads never touch the pipeline session; each unit (and its LLMRun rows) gets its own.
+    job_id, difficulty = job.job_id, job.difficulty_score
+    with SessionLocal() as s:
+        matcher = GlossaryMatcher(load_glossary(s, job_id, lang))
+
+    def run(unit):
+        with SessionLocal() as s:
+            return unit_fn(s, job_id, difficulty, unit, matcher)
+
+    failed, last_err = 0, None
+    for _, _, err in run_bounded(run, units, max_in_flight, retries=retries):
+        if err is not None:
+            failed += 1
+            last_err = err
+    if failed:
+        raise RuntimeError(f"{failed} of {len(units)} {what} failed. Last error: {last_err}")
+
+def stage_translate(db: Session, job: Job, lang: str) -> dict:
+    units = plan_translate(db, job, lang)
+    run_units(job, lang, translate_unit, units, settings.translate_max_in_flight, settings.translate_batch_retries, "translation batches")
+    return {**finish_translate(db, job, lang), "batches": len(units)}
+
+def stage_qa(db: Session, job: Job, lang: str) -> dict:
+    units = plan_qa(db, job, lang)
+    run_units(job, lang, qa_unit, units, settings.qa_max_in_flight, settings.qa_shard_retries, "QA shards")
+    return {**finish_qa(db, job, lang), "shards": len(units)}
+
+def stage_finalize(db: Session, job: Job, lang: str) -> dict:
+    job_id = job.job_id
+    cues = load_cues(db, job_id, lang)
+    out_cues = [Cue(i, c.start_ms, c.end_ms, (c.fa_text_qa or c.fa_text or "").strip()) for i, c in enumerate(cues, start=1)]
+    srt_uri = save_output(job_id, f"{lang}.srt", build_srt(clamp_non_overlapping(out_cues)))
+    if lang == job.target_lang:
+        job.final_srt_uri = srt_uri
+        db.commit()
 
     rep = {
         "job_id": job_id,
+        "target_lang": lang,
         "risk_level": job.risk_level,
         "difficulty_score": job.difficulty_score,
         "genre": job.genre,
@@ -155,14 +433,16 @@ def run_pipeline(db: Session, job_id: str):
                 "tm_confidence": float(c.tm_confidence) if c.tm_confidence is not None else None,
                 "qa_score": float(c.qa_score) if c.qa_score is not None else None,
                 "issues": (c.issues or {}).get("issues", []),
+                "glossary_missing": (c.issues or {}).get("glossary_missing", []),
             } for c in cues
         ]
     }
-    save_report(job_id, "qa_report.json", json.dumps(rep, ensure_ascii=False, indent=2))
+    report = save_report(job_id, report_name("qa_report", lang), json.dumps(rep, ensure_ascii=False, indent=2))
+    return {"files": [srt_uri, report]}
 
-    set_status(db, job, "LIBRARIAN")
-    stored = 0
-    for c in cues:
+def stage_librarian(db: Session, job: Job, lang: str) -> dict:
+    entries = []
+    for c in load_cues(db, job.job_id, lang):
         issues = (c.issues or {}).get("issues", [])
         if not librarian_should_store(c.qa_score, issues):
             continue
@@ -170,21 +450,111 @@ def run_pipeline(db: Session, job_id: str):
         fa = (c.fa_text_qa or c.fa_text or "").strip()
         if not en or not fa:
             continue
-        h = en_hash(en)
-        exists = db.query(TMEntry).filter(TMEntry.en_hash == h).first()
-        if exists:
-            continue
-        emb = embed_texts([en])[0]
-        db.add(TMEntry(
-            en_text=en, fa_text=fa, en_hash=h,
+        entries.append(dict(
+            target_lang=lang, en_text=en, fa_text=fa,
             domain_tags=job.domain_tags,
             quality_grade="trusted",
             qa_score=float(c.qa_score) if c.qa_score is not None else None,
             confidence=90,
-            embedding=emb
         ))
-        stored += 1
-    db.commit()
-    save_report(job_id, "librarian.json", json.dumps({"stored_tm_entries": stored}, ensure_ascii=False, indent=2))
+    stored = tm_store_entries(db, entries)
+    report = save_report(job.job_id, report_name("librarian", lang), json.dumps({"stored_tm_entries": stored}, ensure_ascii=False, indent=2))
+    return {"files": [report], "stored": stored}
+
+def strategy_output(db: Session, job_id: str) -> dict:
+    cp = db.get(JobStageCheckpoint, (job_id, "STRATEGY"))
+    return ((cp.artifacts or {}) if cp else {}).get("strategist", {})
+
+def dispatch_stage(db: Session, job: Job, stage: str, lang: Optional[str] = None) -> dict:
+    if stage == "AUDIO_PREP":
+        arts = stage_audio_prep(db, job)
+    elif stage == "ASR":
+        arts = stage_asr(db, job)
+    elif stage == "SEGMENT":
+        arts = stage_segment(db, job)
+    elif stage == "STRATEGY":
+        arts = stage_strategy(db, job)
+    elif stage == "TM_GATING":
+        arts = stage_tm_gating(db, job, lang)
+    elif stage == "TERMS":
+        arts = stage_terms(db, job, strategy_output(db, job.job_id), lang)
+    elif stage == "TRANSLATE":
+        arts = stage_translate(db, job, lang)
+    elif stage == "QA":
+        arts = stage_qa(db, job, lang)
+    elif stage == "FINALIZE":
+        arts = stage_finalize(db, job, lang)
+    elif stage == "LIBRARIAN":
+        arts = stage_librarian(db, job, lang)
+    else:
+        raise ValueError(f"Unknown stage {stage}")
+    return arts
+
+def enter_stage(db: Session, job: Job, stage: str, lang: Optional[str] = None) -> str:
+    # Languages run concurrently, so only shared stages (and the coordinator) write Job.status;
+    # a language stage just announces itself, leaving the job at LANG_STATUS.
+    key = stage_key(stage, lang)
+    if stage in LANG_STAGES:
+        publish(job.job_id, {"type": "stage", "stage": stage, "lang": lang})
+    else:
+        set_status(db, job, key)
+    return key
 
+def run_stage(db: Session, job: Job, stage: str, lang: Optional[str] = None) -> dict:
+    key = enter_stage(db, job, stage, lang)
+    with span(job.job_id, key) as sp:
+        arts = dispatch_stage(db, job, stage, lang)
+        sp.add_counts(arts)
+    mark_done(db, job.job_id, key, arts)
+    return arts
+
+def pending_stages(db: Session, job_id: str, restart_from: Optional[str] = None) -> Tuple[List[str], Dict[str, List[str]]]:
+    # (shared stages still to run, {lang: language stages still to run}). Each runs from its first stage
+    # without a valid checkpoint; restart_from is "TRANSLATE" (every language) or "TRANSLATE:ar".
+    job = db.get(Job, job_id)
+    if restart_from:
+        reset_from(db, job_id, *split_key(restart_from))
+    done = completed_stages(db, job_id)
+    first = next((st for st in SHARED_STAGES if st not in done), None)
+    if first is not None:
+        # Checkpoints after the first incomplete stage were computed from inputs about to change.
+        clear_checkpoints_from(db, job_id, first)
+        return SHARED_STAGES[SHARED_STAGES.index(first):], {lang: list(LANG_STAGES) for lang in job_langs(job)}
+    per_lang = {}
+    for lang in job_langs(job):
+        first = next((st for st in LANG_STAGES if stage_key(st, lang) not in done), None)
+        if first is not None:
+            clear_checkpoints_from(db, job_id, first, lang)
+            per_lang[lang] = LANG_STAGES[LANG_STAGES.index(first):]
+    return [], per_lang
+
+def run_pipeline(db: Session, job_id: str, restart_from: Optional[str] = None):
+    job = db.get(Job, job_id)
+    if not job:
+        raise RuntimeError("Job not found")
+    try:
+        run_job_stages(db, job, restart_from)
+    except Exception as e:
+        db.rollback()
+        mark_failed(db, job, f"{type(e).__name__}: {e}")
+        raise
     set_status(db, job, "DONE")
+
+def run_job_stages(db: Session, job: Job, restart_from: Optional[str] = None):
+    job_id = job.job_id
+    shared, per_lang = pending_stages(db, job_id, restart_from)
+    for stage in shared:
+        run_stage(db, job, stage)
+    if per_lang:
+        set_status(db, job, LANG_STATUS)
+
+    def run_lang(item):
+        lang, stages = item
+        with SessionLocal() as s:
+            j = s.get(Job, job_id)
+            for stage in stages:
+                run_stage(s, j, stage, lang)
+
+    errors = [f"{lang}: {err}" for (lang, _), _, err in run_bounded(run_lang, list(per_lang.items()), max(1, len(per_lang))) if err]
+    if errors:
+        raise RuntimeError("Language stages failed: " + "; ".join(errors))
@@ -0,0 +1,104 @@
+from datetime import datetime, timedelta
+from typing import Any, Dict, Iterator, List, Optional, Tuple
+from sqlalchemy import func, select, tuple_
+from sqlalchemy.orm import Session
+from .config import settings
+from .models import JobCue, JobStageCheckpoint
+from .srt_builder import Cue, iter_non_overlapping, srt_block, vtt_block, VTT_HEADER
+
+def cue_text(c: JobCue) -> Optional[str]:
+    return c.fa_text_qa or c.fa_text
+
+def cue_state(c: JobCue) -> str:
+    if c.fa_text_qa is not None:
+        return "qa"
+    if c.fa_text is not None:
+        return "tm" if c.tm_reused else "translated"
+    return "pending"
+
+def jobs_progress(db: Session, job_ids: List[str]) -> Dict[str, Dict[str, Dict[str, Any]]]:
+    # One GROUP BY over the jobs' cues: {job_id: {lang: {"cues", "tm_reused", "translate": {done,total}, "qa": {done,total}}}}.
+    rows = db.execute(
+        select(
+            JobCue.job_id, JobCue.target_lang, func.count(), func.count(JobCue.fa_text), func.count(JobCue.fa_text_qa),
+            func.count().filter(JobCue.tm_reused.is_(True)),
+        ).where(JobCue.job_id.in_(job_ids)).group_by(JobCue.job_id, JobCue.target_lang)
+    ).all()
+    out: Dict[str, Dict[str, Dict[str, Any]]] = {j: {} for j in job_ids}
+    for job_id, lang, total, translated, qa, reused in rows:
+        out[job_id][lang] = {"cues": total, "tm_reused": reused,
+                             "translate": {"done": translated, "total": total}, "qa": {"done": qa, "total": total}}
+    return out
+
+def jobs_lang_stages(db: Session, job_ids: List[str]) -> Dict[str, Dict[str, str]]:
+    # Last language stage each target language finished, from the "STAGE:lang" checkpoints: {job_id: {lang: stage}}.
+    rows = db.execute(
+        select(JobStageCheckpoint.job_id, JobStageCheckpoint.stage)
+        .where(JobStageCheckpoint.job_id.in_(job_ids), JobStageCheckpoint.stage.contains(":"))
+        .order_by(JobStageCheckpoint.completed_at)
+    ).all()
+    out: Dict[str, Dict[str, str]] = {j: {} for j in job_ids}
+    for job_id, key in rows:
+        stage, _, lang = key.partition(":")
+        out[job_id][lang] = stage
+    return out
+
+def job_progress(db: Session, job_id: str) -> Dict[str, Dict[str, Any]]:
+    return jobs_progress(db, [job_id])[job_id]
+
+def encode_cursor(updated_at: datetime, cue_id: str) -> str:
+    return f"{updated_at.isoformat()},{cue_id}"
+
+def decode_cursor(cursor: str) -> Tuple[datetime, str]:
+    ts, _, cue_id = cursor.rpartition(",")
+    return datetime.fromisoformat(ts), cue_id
+
+def cues_since(db: Session, job_id: str, lang: str, since: Optional[str], limit: int) -> Tuple[List[Dict[str, Any]], Optional[str]]:
+    # Keyset over (updated_at, cue_id): cues that got a translation or QA output since the cursor.
+    settled = select(func.clock_timestamp()).scalar_subquery() - timedelta(seconds=settings.cues_since_settle_s)
+    stmt = (
+        select(JobCue)
+        .where(JobCue.job_id == job_id, JobCue.target_lang == lang, JobCue.fa_text.is_not(None), JobCue.updated_at < settled)
+        .order_by(JobCue.updated_at, JobCue.cue_id)
+        .limit(limit)
+    )
+    if since:
+        stmt = stmt.where(tuple_(JobCue.updated_at, JobCue.cue_id) > tuple_(*decode_cursor(since)))
+    cues = list(db.execute(stmt).scalars())
+    out = [
+        {
+            "cue_id": c.cue_id, "cue_index": c.cue_index, "start_ms": c.start_ms, "end_ms": c.end_ms,
+            "en_text": c.en_text, "text": cue_text(c), "state": cue_state(c),
+            "qa_score": float(c.qa_score) if c.qa_score is not None else None,
+        } for c in cues
+    ]
+    return out, (encode_cursor(cues[-1].updated_at, cues[-1].cue_id) if cues else since)
+
+def completed_prefix(db: Session, job_id: str, lang: str, qa_only: bool = False, page: int = 500) -> Iterator[Cue]:
+    # Cues in order up to the first one still without text, read in cue_index pages.
+    col = JobCue.fa_text_qa if qa_only else func.coalesce(JobCue.fa_text_qa, JobCue.fa_text)
+    after = 0
+    while True:
+        rows = db.execute(
+            select(JobCue.cue_index, JobCue.start_ms, JobCue.end_ms, col)
+            .where(JobCue.job_id == job_id, JobCue.target_lang == lang, JobCue.cue_index > after)
+            .order_by(JobCue.cue_index).limit(page)
+        ).all()
+        for idx, start, end, text in rows:
+            if text is None:
+                return
+            yield Cue(idx, start, end, text)
+        if len(rows) < page:
+            return
+        after = rows[-1][0]
+
+def stream_subtitles(db: Session, job_id: str, lang: str, fmt: str, qa_only: bool = False) -> Iterator[str]:
+    # Closes the session itself: StreamingResponse consumes this after the endpoint has returned.
+    try:
+        block = srt_block if fmt == "srt" else vtt_block
+        if fmt == "vtt":
+            yield VTT_HEADER
+        for c in iter_non_overlapping(completed_prefix(db, job_id, lang, qa_only)):
+            yield block(c)
+    finally:
+        db.close()
@@ -0,0 +1,118 @@
+import atexit, logging, queue, threading, time
+from typing import Any, Dict, List, Tuple
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from sqlalchemy.exc import DBAPIError, IntegrityError
+from .config import settings
+from .db import SessionLocal
+from .models import LLMRun
+from .telemetry import incr, series
+
+log = logging.getLogger(__name__)
+
+class RunRecorder:
+    # LLMRun rows are appended here and bulk-inserted by one background thread on its own connection,
+    # so LLM calls never commit (or flush) the pipeline's session. Rows can lag by llm_run_flush_s.
+    def __init__(self):
+        self._q: "queue.Queue[Dict[str, Any]]" = queue.Queue(maxsize=max(1, int(settings.llm_run_queue_max)))
+        self._lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._thread: threading.Thread | None = None
+        self._stop = threading.Event()
+        self._retry: List[Tuple[float, int, List[Dict[str, Any]]]] = []  # (due, attempt, rows); flusher-only
+        self.dropped = 0
+
+    def record(self, row: Dict[str, Any]):
+        self._start()
+        try:
+            self._q.put_nowait(row)
+        except queue.Full:
+            self._drop(1, "queue_full")
+            if self.dropped % 1000 == 1:
+                log.warning("LLM run queue full; dropped %d rows so far", self.dropped)
+
+    def _drop(self, n: int, reason: str):
+        self.dropped += n
+        incr({series("subtitle_llm_runs_dropped_total", reason=reason): n})
+
+    def _start(self):
+        if self._thread is not None:
+            return
+        with self._lock:
+            if self._thread is None:
+                self._thread = threading.Thread(target=self._loop, name="llm-run-recorder", daemon=True)
+                self._thread.start()
+                atexit.register(self.close)
+
+    def _loop(self):
+        while not self._stop.wait(float(settings.llm_run_flush_s)):
+            self.flush()
+
+    def _drain(self) -> List[Dict[str, Any]]:
+        rows = []
+        while True:
+            try:
+                rows.append(self._q.get_nowait())
+            except queue.Empty:
+                return rows
+
+    def flush(self, final: bool = False) -> int:
+        # Also callable directly (benchmarks, shutdown) to make everything recorded so far visible.
+        with self._flush_lock:
+            now = time.monotonic()
+            due = [b for b in self._retry if final or b[0] <= now]
+            self._retry = [b for b in self._retry if not (final or b[0] <= now)]
+            for _, attempt, batch in due:
+                self._insert(batch, attempt)
+            rows = self._drain()
+            bs = max(1, int(settings.llm_run_batch_size))
+            for i in range(0, len(rows), bs):
+                self._insert(rows[i:i+bs])
+            if final and self._retry:
+                self._drop(sum(len(b) for _, _, b in self._retry), "shutdown")
+                self._retry = []
+            return len(rows)
+
+    def _insert(self, rows: List[Dict[str, Any]], attempt: int = 0):
+        # A multi-row VALUES needs the same keys in every row.
+        cols = set().union(*rows)
+        rows = [{c: r.get(c) for c in cols} for r in rows]
+        try:
+            with SessionLocal() as s:
+                s.execute(pg_insert(LLMRun).values(rows).on_conflict_do_nothing())
+                s.commit()
+            return
+        except IntegrityError:
+            pass  # e.g. a job deleted meanwhile (FK); keep the rows that still fit
+        except DBAPIError as e:
+            # Connection lost, failover, lock or statement timeout: the rows are fine, try again later.
+            self._retry_later(rows, attempt, e)
+            return
+        except Exception as e:
+            log.warning("could not write %d LLM runs: %s", len(rows), e)
+            self._drop(len(rows), "error")
+            return
+        for row in rows:
+            try:
+                with SessionLocal() as s:
+                    s.execute(pg_insert(LLMRun).values(row).on_conflict_do_nothing())
+                    s.commit()
+            except Exception as e:
+                log.warning("dropping LLM run %s: %s", row.get("run_id"), e)
+                self._drop(1, "rejected")
+
+    def _retry_later(self, rows: List[Dict[str, Any]], attempt: int, err: Exception):
+        # Held rows count against llm_run_queue_max, so a long outage cannot grow memory without bound.
+        held = sum(len(b) for _, _, b in self._retry)
+        if attempt >= int(settings.llm_run_retries) or held + len(rows) > int(settings.llm_run_queue_max):
+            log.warning("giving up on %d LLM runs after %d attempts: %s", len(rows), attempt + 1, err)
+            self._drop(len(rows), "db_unavailable")
+            return
+        delay = min(float(settings.llm_run_retry_max_s), max(0.0, float(settings.llm_run_flush_s)) * 2 ** attempt)
+        log.info("could not write %d LLM runs (%s); retrying in %.1fs", len(rows), err, delay)
+        self._retry.append((time.monotonic() + delay, attempt + 1, rows))
+
+    def close(self):
+        self._stop.set()
+        self.flush(final=True)
+
+recorder = RunRecorder()
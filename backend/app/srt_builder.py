@@ -1,5 +1,5 @@
 from dataclasses import dataclass
-from typing import List
+from typing import Iterable, Iterator, List
 import srt
 from datetime import timedelta
 
@@ -13,15 +13,16 @@ class Cue:
 def ms_to_td(ms: int) -> timedelta:
     return timedelta(milliseconds=int(ms))
 
-def clamp_non_overlapping(cues: List[Cue], min_gap_ms: int = 1) -> List[Cue]:
-    out = []
+def iter_non_overlapping(cues: Iterable[Cue], min_gap_ms: int = 1) -> Iterator[Cue]:
     last_end = -1
     for c in cues:
         start = max(c.start_ms, last_end + min_gap_ms)
         end = max(c.end_ms, start + min_gap_ms)
-        out.append(Cue(c.index, start, end, c.text))
+        yield Cue(c.index, start, end, c.text)
         last_end = end
-    return out
+
+def clamp_non_overlapping(cues: List[Cue], min_gap_ms: int = 1) -> List[Cue]:
+    return list(iter_non_overlapping(cues, min_gap_ms))
 
 def build_srt(cues: List[Cue]) -> str:
     subs = []
@@ -33,3 +34,15 @@ def build_srt(cues: List[Cue]) -> str:
             content=(c.text or "").strip()
         ))
     return srt.compose(subs)
+
+def srt_block(c: Cue) -> str:
+    return srt.Subtitle(index=c.index, start=ms_to_td(c.start_ms), end=ms_to_td(c.end_ms), content=(c.text or "").strip()).to_srt()
+
+def vtt_ts(ms: int) -> str:
+    ms = int(ms)
+    return f"{ms // 3600000:02d}:{ms // 60000 % 60:02d}:{ms // 1000 % 60:02d}.{ms % 1000:03d}"
+
+VTT_HEADER = "WEBVTT\n\n"
+
+def vtt_block(c: Cue) -> str:
+    return f"{c.index}\n{vtt_ts(c.start_ms)} --> {vtt_ts(c.end_ms)}\n{(c.text or '').strip()}\n\n"
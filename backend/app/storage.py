@@ -1,17 +1,150 @@
+import fcntl, hashlib, ipaddress, json, os, shutil, socket, time, uuid
 from pathlib import Path
+from typing import BinaryIO, Iterable, List, Optional, Tuple
+from urllib.parse import urlparse
+import httpx
 from .config import settings
 
 BASE = Path(settings.data_dir)
 
 def ensure_dirs():
-    for d in ["uploads", "work", "outputs", "reports"]:
+    for d in ["uploads", "work", "outputs", "reports", "cas"]:
         (BASE / d).mkdir(parents=True, exist_ok=True)
 
-def save_upload(job_id: str, filename: str, data: bytes) -> str:
+def upload_path(job_id: str, filename: str) -> Path:
     ensure_dirs()
-    safe = filename.replace("/", "_")
-    p = BASE / "uploads" / f"{job_id}__{safe}"
-    p.write_bytes(data)
+    safe = (filename or "upload").replace("/", "_")
+    return BASE / "uploads" / f"{job_id}__{safe}"
+
+def save_upload(job_id: str, filename: str, src: BinaryIO) -> Tuple[str, str]:
+    # Copies in chunks and hashes on the way through; returns (path, sha256).
+    p = upload_path(job_id, filename)
+    h = hashlib.sha256()
+    with open(p, "wb") as out:
+        while chunk := src.read(settings.upload_chunk_size):
+            h.update(chunk)
+            out.write(chunk)
+    return str(p), h.hexdigest()
+
+def url_host_allowed(host: str) -> bool:
+    allowed = [h.strip().lower() for h in settings.ingest_url_allowed_hosts.split(",") if h.strip()]
+    host = host.lower().rstrip(".")
+    return not allowed or any(host == a or (a.startswith("*.") and host.endswith(a[1:])) for a in allowed)
+
+def public_address(addr: str) -> bool:
+    ip = ipaddress.ip_address(addr.split("%", 1)[0])
+    if isinstance(ip, ipaddress.IPv6Address) and ip.ipv4_mapped:
+        ip = ip.ipv4_mapped
+    # is_global excludes private, loopback, link-local, shared (CGNAT) and reserved ranges.
+    return ip.is_global and not ip.is_multicast
+
+def check_ingest_url(url: str) -> str:
+    # Raises ValueError unless url is http(s) on an allowed host whose every address is public; returns the
+    # address to connect to, so the connection can't be re-resolved elsewhere (DNS rebinding).
+    u = urlparse(url)
+    if u.scheme not in ("http", "https") or not u.hostname:
+        raise ValueError("Unsupported URL; use http(s)://host/...")
+    if not url_host_allowed(u.hostname):
+        raise ValueError(f"Host {u.hostname!r} is not in INGEST_URL_ALLOWED_HOSTS")
+    try:
+        infos = socket.getaddrinfo(u.hostname, u.port or (443 if u.scheme == "https" else 80), proto=socket.IPPROTO_TCP)
+    except (socket.gaierror, UnicodeError):
+        raise ValueError(f"Cannot resolve host {u.hostname!r}")
+    if not infos or not all(public_address(info[4][0]) for info in infos):
+        raise ValueError(f"Host {u.hostname!r} resolves to a non-public address")
+    return infos[0][4][0].split("%", 1)[0]
+
+def pinned_request(client: httpx.Client, url: str, addr: str) -> httpx.Request:
+    # Connects to `addr` while keeping the original Host header and TLS server name (SNI and certificate check).
+    u = httpx.URL(url)
+    return client.build_request("GET", u.copy_with(host=addr), headers={"Host": u.netloc.decode("ascii")},
+                                extensions={"sni_hostname": u.host})
+
+def download_url(job_id: str, url: str) -> Tuple[str, str]:
+    # Redirects are followed by hand so every hop goes through check_ingest_url and is pinned to the checked
+    # address. trust_env=False: an environment proxy would make the connection somewhere else.
+    with httpx.Client(follow_redirects=False, trust_env=False, timeout=httpx.Timeout(60.0, read=300.0)) as client:
+        for _ in range(settings.ingest_url_max_redirects + 1):
+            r = client.send(pinned_request(client, url, check_ingest_url(url)), stream=True)
+            try:
+                if r.is_redirect:
+                    url = str(httpx.URL(url).join(r.headers["location"]))
+                    continue
+                r.raise_for_status()
+                p = upload_path(job_id, Path(urlparse(url).path).name or "download")
+                h = hashlib.sha256()
+                with open(p, "wb") as out:
+                    for chunk in r.iter_bytes(settings.upload_chunk_size):
+                        h.update(chunk)
+                        out.write(chunk)
+                return str(p), h.hexdigest()
+            finally:
+                r.close()
+    raise ValueError(f"More than {settings.ingest_url_max_redirects} redirects")
+
+def ingest_path_allowed(path: str) -> bool:
+    p = Path(path).resolve()
+    roots = [Path(r.strip()).resolve() for r in settings.ingest_path_roots.split(",") if r.strip()]
+    return p.is_file() and any(p.is_relative_to(r) for r in roots)
+
+# Resumable uploads: uploads/partial/<id>.part grows by ranged PUTs; <id>.json holds filename and total size.
+
+def partial_paths(upload_id: str) -> Tuple[Path, Path]:
+    ensure_dirs()
+    d = BASE / "uploads" / "partial"
+    d.mkdir(exist_ok=True)
+    return d / f"{upload_id}.part", d / f"{upload_id}.json"
+
+def partial_expire(max_age_s: float) -> List[str]:
+    # Abandoned uploads: both files of an id go once neither has been written for max_age_s.
+    part, _ = partial_paths("x")
+    now = time.time()
+    newest = {}
+    for p in part.parent.iterdir():
+        try:
+            newest[p.stem] = max(newest.get(p.stem, 0.0), p.stat().st_mtime)
+        except FileNotFoundError:
+            pass
+    expired = [uid for uid, mtime in newest.items() if now - mtime > max_age_s]
+    for uid in expired:
+        for p in partial_paths(uid):
+            p.unlink(missing_ok=True)
+    return expired
+
+def partial_open_locked(upload_id: str) -> BinaryIO:
+    # The .part file opened for appending under an exclusive flock, so concurrent PUTs (from any API process)
+    # can't interleave; raises BlockingIOError if another request holds it. Closing releases the lock.
+    part, _ = partial_paths(upload_id)
+    f = open(part, "ab")
+    try:
+        fcntl.flock(f.fileno(), fcntl.LOCK_EX | fcntl.LOCK_NB)
+    except BlockingIOError:
+        f.close()
+        raise
+    return f
+
+def partial_create(filename: str, size: Optional[int], target_langs: Optional[str] = None) -> str:
+    partial_expire(settings.upload_partial_ttl_h * 3600)
+    upload_id = uuid.uuid4().hex
+    part, meta = partial_paths(upload_id)
+    part.touch()
+    meta.write_text(json.dumps({"filename": filename, "size": size, "target_langs": target_langs}), encoding="utf-8")
+    return upload_id
+
+def partial_info(upload_id: str) -> Optional[dict]:
+    part, meta = partial_paths(upload_id)
+    if not meta.exists() or not part.exists():
+        return None
+    info = json.loads(meta.read_text(encoding="utf-8"))
+    info["offset"] = part.stat().st_size
+    return info
+
+def partial_finish(upload_id: str, job_id: str) -> str:
+    part, meta = partial_paths(upload_id)
+    info = json.loads(meta.read_text(encoding="utf-8"))
+    p = upload_path(job_id, info["filename"])
+    os.replace(part, p)
+    meta.unlink(missing_ok=True)
     return str(p)
 
 def job_workdir(job_id: str) -> Path:
@@ -26,8 +159,58 @@ def save_output(job_id: str, name: str, text: str) -> str:
     p.write_text(text, encoding="utf-8")
     return str(p)
 
+def report_name(kind: str, lang: str) -> str:
+    # Persian keeps the original single-language names.
+    return f"{kind}.json" if lang == "fa" else f"{kind}.{lang}.json"
+
 def save_report(job_id: str, name: str, text: str) -> str:
     ensure_dirs()
     p = BASE / "reports" / f"{job_id}__{name}"
     p.write_text(text, encoding="utf-8")
     return str(p)
+
+def file_sha256(path: str, chunk_size: int = 1 << 20) -> str:
+    h = hashlib.sha256()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            h.update(chunk)
+    return h.hexdigest()
+
+def write_text_replacing(path: Path, text: str) -> str:
+    # Writes a new file and renames it over `path`, never through it: `path` may be a hard link into the
+    # content store, and rewriting that inode would change the cached copy too.
+    tmp = path.with_name(f".{path.name}.{uuid.uuid4().hex}")
+    tmp.write_text(text, encoding="utf-8")
+    os.replace(tmp, path)
+    return str(path)
+
+def link_or_copy(src: str, dst: Path) -> str:
+    dst.unlink(missing_ok=True)
+    try:
+        os.link(src, dst)
+    except OSError:
+        shutil.copyfile(src, dst)
+    return str(dst)
+
+# Content-addressed store: cas/<last 2 hex>/<key>/<name>, keys like "sha256:<hex>" or "audio:<hex>".
+
+def cas_path(key: str, name: str) -> Path:
+    safe = key.replace(":", "_")
+    return BASE / "cas" / safe[-2:] / safe / name
+
+def cas_find(keys: Iterable[str], name: str) -> Optional[str]:
+    for k in keys:
+        p = cas_path(k, name)
+        if p.exists():
+            return str(p)
+    return None
+
+def cas_put(keys: Iterable[str], name: str, src: str):
+    for k in keys:
+        p = cas_path(k, name)
+        if p.exists():
+            continue
+        p.parent.mkdir(parents=True, exist_ok=True)
+        tmp = p.with_name(f".{name}.{uuid.uuid4().hex}")
+        link_or_copy(src, tmp)
+        os.replace(tmp, p)
@@ -1,13 +1,170 @@
-from celery import shared_task
+import logging
+from typing import Any, Dict, Optional
+from celery import Task, shared_task, chain, chord, group
 from sqlalchemy.orm import Session
 from .db import SessionLocal
-from .pipeline import run_pipeline
+from .models import Job
+from .telemetry import span
+from .pipeline import (
+    run_stage, enter_stage, pending_stages, set_status, mark_failed, mark_done, stage_key, split_key, LANG_STATUS,
+    plan_translate, translate_unit, finish_translate, plan_qa, qa_unit, finish_qa,
+)
 
-@shared_task(name="run_job_pipeline")
-def run_job_pipeline(job_id: str) -> str:
+# CPU-bound ffmpeg work, long ASR waits and I/O-bound LLM calls scale on separate worker pools.
+STAGE_QUEUES = {"AUDIO_PREP": "audio", "ASR": "asr"}
+FANOUT = {
+    "TRANSLATE": (plan_translate, "translate_unit", finish_translate),
+    "QA": (plan_qa, "qa_unit", finish_qa),
+}
+RETRY = dict(autoretry_for=(Exception,), retry_backoff=30, retry_backoff_max=600, max_retries=3)
+
+log = logging.getLogger(__name__)
+
+class JobTask(Task):
+    # A task that fails for good (retries exhausted) fails its job; otherwise the chain or chord
+    # waiting on it never fires and the job keeps its last running status forever.
+    def on_failure(self, exc, task_id, args, kwargs, einfo):
+        job_id = kwargs.get("job_id") or (args[0] if args else None)
+        if job_id:
+            fail_job(job_id, f"{self.name} failed: {type(exc).__name__}: {exc}")
+
+def fail_job(job_id: str, error: str):
+    try:
+        with SessionLocal() as db:
+            job = db.get(Job, job_id)
+            if job and job.status != "FAILED":
+                mark_failed(db, job, error)
+    except Exception as e:
+        log.error("could not mark job %s failed (%s): %s", job_id, error, e)
+
+def job_failed(job: Job) -> bool:
+    # Tasks still queued for a failed job (other languages, later stages) do nothing.
+    return job.status == "FAILED"
+
+def stage_queue(key: str) -> str:
+    return STAGE_QUEUES.get(split_key(key)[0], "llm")
+
+def _job(db: Session, job_id: str) -> Job:
+    job = db.get(Job, job_id)
+    if not job:
+        raise RuntimeError("Job not found")
+    return job
+
+def stage_sig(job_id: str, key: str):
+    return pipeline_stage.si(job_id, key).set(queue=stage_queue(key))
+
+@shared_task(name="run_job_pipeline", base=JobTask)
+def run_job_pipeline(job_id: str, restart_from: Optional[str] = None) -> str:
+    # Entry point: works out which stages still need to run (checkpoints) and chains them. Shared stages
+    # run once; each target language then gets its own chain, all in parallel, joined by finish_job.
+    db: Session = SessionLocal()
+    try:
+        # Resubmitting a FAILED job clears the failure; checkpoints make it resume where it stopped.
+        set_status(db, _job(db, job_id), "QUEUED")
+        shared, per_lang = pending_stages(db, job_id, restart_from)
+    finally:
+        db.close()
+    steps = [stage_sig(job_id, st) for st in shared]
+    lang_chains = [chain(*[stage_sig(job_id, stage_key(st, lang)) for st in sts]) for lang, sts in per_lang.items()]
+    done = finish_job.si(job_id).set(queue="llm")
+    if lang_chains:
+        steps.append(start_languages.si(job_id).set(queue="llm"))
+        steps.append(chord(group(lang_chains), done))
+    else:
+        steps.append(done)
+    chain(*steps).apply_async()
+    return "queued"
+
+@shared_task(name="start_languages", base=JobTask)
+def start_languages(job_id: str) -> str:
+    # The one writer of Job.status between the shared stages and finish_job; language chains never touch it.
+    db: Session = SessionLocal()
+    try:
+        job = _job(db, job_id)
+        if job_failed(job):
+            return "skipped"
+        set_status(db, job, LANG_STATUS)
+        return "ok"
+    finally:
+        db.close()
+
+@shared_task(name="pipeline_stage", base=JobTask, bind=True, **RETRY)
+def pipeline_stage(self, job_id: str, key: str) -> str:
+    stage, lang = split_key(key)
+    db: Session = SessionLocal()
+    try:
+        job = _job(db, job_id)
+        if job_failed(job):
+            return "skipped"
+        if stage not in FANOUT:
+            run_stage(db, job, stage, lang)
+            return "ok"
+        plan, unit_task, _ = FANOUT[stage]
+        enter_stage(db, job, stage, lang)
+        with span(job_id, key, "plan") as sp:
+            units = plan(db, job, lang)
+            sp.counts["units"] = len(units)
+        if not units:
+            finish_stage(job_id, key)
+            return "ok"
+    finally:
+        db.close()
+    # Fan out one task per batch/shard; the rest of the chain continues after finish_stage.
+    header = group(unit_tasks[unit_task].si(job_id, u).set(queue="llm") for u in units)
+    raise self.replace(chord(header, finish_stage.si(job_id, key).set(queue="llm")))
+
+@shared_task(name="translate_unit", base=JobTask, **RETRY)
+def translate_unit_task(job_id: str, unit: Dict[str, Any]) -> int:
+    db: Session = SessionLocal()
+    try:
+        job = _job(db, job_id)
+        if job_failed(job):
+            return 0
+        with span(job_id, stage_key("TRANSLATE", unit["lang"]), "unit") as sp:
+            sp.counts["cues"] = translate_unit(db, job_id, job.difficulty_score, unit)
+        return sp.counts["cues"]
+    finally:
+        db.close()
+
+@shared_task(name="qa_unit", base=JobTask, **RETRY)
+def qa_unit_task(job_id: str, shard: Dict[str, Any]) -> int:
+    db: Session = SessionLocal()
+    try:
+        job = _job(db, job_id)
+        if job_failed(job):
+            return 0
+        with span(job_id, stage_key("QA", shard["lang"]), "unit") as sp:
+            sp.counts["cues"] = qa_unit(db, job_id, job.difficulty_score, shard)
+        return sp.counts["cues"]
+    finally:
+        db.close()
+
+unit_tasks = {"translate_unit": translate_unit_task, "qa_unit": qa_unit_task}
+
+@shared_task(name="finish_stage", base=JobTask)
+def finish_stage(job_id: str, key: str) -> str:
+    stage, lang = split_key(key)
+    db: Session = SessionLocal()
+    try:
+        job = _job(db, job_id)
+        if job_failed(job):
+            return "skipped"
+        with span(job_id, key, "finish") as sp:
+            arts = FANOUT[stage][2](db, job, lang)
+            sp.add_counts(arts)
+        mark_done(db, job_id, key, arts)
+        return "ok"
+    finally:
+        db.close()
+
+@shared_task(name="finish_job", base=JobTask)
+def finish_job(job_id: str) -> str:
     db: Session = SessionLocal()
     try:
-        run_pipeline(db, job_id)
+        job = _job(db, job_id)
+        if job_failed(job):
+            return "skipped"
+        set_status(db, job, "DONE")
         return "ok"
     finally:
         db.close()
@@ -0,0 +1,254 @@
+import contextvars, logging, threading, time
+from contextlib import contextmanager
+from datetime import datetime
+from pathlib import Path
+from typing import Any, Dict, Iterable, Iterator, List, Optional
+import redis
+from sqlalchemy import event, func, select
+from sqlalchemy.orm import Session
+from .config import settings
+from .db import engine, SessionLocal
+from .models import Job, JobSpan, LLMRun
+
+log = logging.getLogger(__name__)
+
+# Aggregates shared by the API and every worker live in one Redis hash: field "name{labels}" -> value.
+METRICS_KEY = "metrics:counters"
+METRIC_HELP = {
+    "subtitle_stage_seconds_total": ("counter", "Time spent in pipeline spans (divide by subtitle_stage_spans_total for the mean)"),
+    "subtitle_stage_spans_total": ("counter", "Pipeline spans finished"),
+    "subtitle_stage_db_queries_total": ("counter", "SQL statements issued inside pipeline spans"),
+    "subtitle_stage_db_seconds_total": ("counter", "Time spent in SQL statements inside pipeline spans"),
+    "subtitle_stage_bytes_total": ("counter", "Bytes of files written by pipeline stages"),
+    "subtitle_llm_calls_total": ("counter", "LLM calls by final status"),
+    "subtitle_llm_seconds_total": ("counter", "LLM request latency (sum)"),
+    "subtitle_llm_tokens_total": ("counter", "LLM tokens by kind"),
+    "subtitle_llm_cost_usd_total": ("counter", "LLM cost in USD (OpenRouter usage.cost, else LLM_PRICES)"),
+    "subtitle_llm_runs_dropped_total": ("counter", "LLM run rows never written to llm_runs, by reason"),
+    "subtitle_tm_judge_unjudged_total": ("counter", "TM matches the judge gave no verdict for (treated as no reuse)"),
+}
+
+_redis: Optional[redis.Redis] = None
+
+def _r() -> redis.Redis:
+    global _redis
+    if _redis is None:
+        _redis = redis.Redis.from_url(settings.redis_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+    return _redis
+
+def _label(v: Any) -> str:
+    return str(v).replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+def series(name: str, **labels) -> str:
+    if not labels:
+        return name
+    inner = ",".join(f'{k}="{_label(v)}"' for k, v in sorted(labels.items()))
+    return f"{name}{{{inner}}}"
+
+def incr(values: Dict[str, float]):
+    # values: {series(...): amount}. Metrics are best-effort and never fail the caller.
+    try:
+        pipe = _r().pipeline(transaction=False)
+        for k, v in values.items():
+            if v:
+                pipe.hincrbyfloat(METRICS_KEY, k, float(v))
+        pipe.execute()
+    except redis.RedisError as e:
+        log.debug("metrics update failed: %s", e)
+
+class Span:
+    def __init__(self, job_id: Optional[str], name: str, kind: str):
+        self.job_id, self.name, self.kind = job_id, name, kind
+        self.started_at = datetime.utcnow()
+        self.t0 = time.perf_counter()
+        self.db_queries = 0
+        self.db_time_s = 0.0
+        self.bytes = 0
+        self.counts: Dict[str, Any] = {}
+        self._lock = threading.Lock()
+
+    def add_query(self, seconds: float):
+        with self._lock:
+            self.db_queries += 1
+            self.db_time_s += seconds
+
+    def add_files(self, files: Iterable[str]):
+        for f in files:
+            try:
+                self.bytes += Path(f).stat().st_size
+            except OSError:
+                pass
+
+    def add_counts(self, artifacts: Optional[dict]):
+        # Numeric artifacts (cues, words, batches, stored, ...) are the span's item counts.
+        for k, v in (artifacts or {}).items():
+            if isinstance(v, (int, float)) and not isinstance(v, bool):
+                self.counts[k] = v
+        self.add_files((artifacts or {}).get("files", []))
+
+_current: contextvars.ContextVar[Optional[Span]] = contextvars.ContextVar("telemetry_span", default=None)
+
+def current_stage() -> Optional[str]:
+    sp = _current.get()
+    return sp.name if sp else None
+
+def current_job_id() -> Optional[str]:
+    sp = _current.get()
+    return sp.job_id if sp else None
+
+@event.listens_for(engine, "before_cursor_execute")
+def _before_execute(conn, cursor, statement, parameters, context, executemany):
+    conn.info["telemetry_t0"] = time.perf_counter()
+
+@event.listens_for(engine, "after_cursor_execute")
+def _after_execute(conn, cursor, statement, parameters, context, executemany):
+    sp = _current.get()
+    if sp is not None:
+        sp.add_query(time.perf_counter() - conn.info.get("telemetry_t0", time.perf_counter()))
+
+@contextmanager
+def span(job_id: Optional[str], name: str, kind: str = "stage") -> Iterator[Span]:
+    # kind: "stage" (whole stage), or "plan" / "unit" / "finish" for the pieces of a fanned-out Celery stage.
+    # Worker threads started through run_bounded inherit the span, so their queries are counted too.
+    sp = Span(job_id, name, kind)
+    token = _current.set(sp)
+    status, error = "success", None
+    try:
+        yield sp
+    except BaseException as e:
+        status, error = "error", str(e)[:2000]
+        raise
+    finally:
+        _current.reset(token)
+        record_span(sp, status, error)
+
+def record_span(sp: Span, status: str, error: Optional[str]):
+    duration = time.perf_counter() - sp.t0
+    stage = sp.name.partition(":")[0]
+    incr({
+        series("subtitle_stage_seconds_total", stage=stage, kind=sp.kind): duration,
+        series("subtitle_stage_spans_total", stage=stage, kind=sp.kind, status=status): 1,
+        series("subtitle_stage_db_queries_total", stage=stage): sp.db_queries,
+        series("subtitle_stage_db_seconds_total", stage=stage): sp.db_time_s,
+        series("subtitle_stage_bytes_total", stage=stage): sp.bytes,
+    })
+    if not sp.job_id:
+        return
+    try:
+        with SessionLocal() as s:
+            s.add(JobSpan(
+                job_id=sp.job_id, name=sp.name, kind=sp.kind, started_at=sp.started_at, finished_at=datetime.utcnow(),
+                duration_s=duration, db_queries=sp.db_queries, db_time_s=sp.db_time_s, bytes=sp.bytes,
+                counts=sp.counts, status=status, error=error,
+            ))
+            s.commit()
+    except Exception as e:
+        log.warning("could not record span %s for job %s: %s", sp.name, sp.job_id, e)
+
+def price_table() -> Dict[str, List[float]]:
+    # LLM_PRICES="model=prompt_usd_per_mtok/completion_usd_per_mtok,..."
+    out = {}
+    for item in (settings.llm_prices or "").split(","):
+        model, sep, prices = item.strip().rpartition("=")
+        if sep and model:
+            try:
+                out[model] = [float(x) for x in prices.split("/", 1)]
+            except ValueError:
+                log.warning("bad LLM_PRICES entry %r", item)
+    return out
+
+def llm_cost(model: str, usage: Optional[Dict[str, Any]]) -> Optional[float]:
+    usage = usage or {}
+    if usage.get("cost") is not None:
+        return float(usage["cost"])
+    prices = price_table().get(model)
+    if not prices or len(prices) != 2:
+        return None
+    return (int(usage.get("prompt_tokens") or 0) * prices[0] + int(usage.get("completion_tokens") or 0) * prices[1]) / 1e6
+
+def observe_llm(agent: str, model: str, status: str, seconds: Optional[float], usage: Optional[Dict[str, Any]], cost: Optional[float]):
+    usage = usage or {}
+    incr({
+        series("subtitle_llm_calls_total", agent=agent, model=model, status=status): 1,
+        series("subtitle_llm_seconds_total", model=model): seconds or 0,
+        series("subtitle_llm_tokens_total", model=model, kind="prompt"): usage.get("prompt_tokens") or 0,
+        series("subtitle_llm_tokens_total", model=model, kind="completion"): usage.get("completion_tokens") or 0,
+        series("subtitle_llm_cost_usd_total", model=model): cost or 0,
+    })
+
+def render_metrics(db: Session) -> str:
+    # Prometheus text format: Redis counters, plus jobs by status and Celery queue depth read at scrape time.
+    lines: List[str] = []
+    try:
+        counters = {k.decode(): float(v) for k, v in _r().hgetall(METRICS_KEY).items()}
+    except redis.RedisError:
+        counters = {}
+    for name, (kind, help_) in METRIC_HELP.items():
+        rows = sorted((k, v) for k, v in counters.items() if k == name or k.startswith(name + "{"))
+        if not rows:
+            continue
+        lines += [f"# HELP {name} {help_}", f"# TYPE {name} {kind}"]
+        lines += [f"{k} {v:g}" for k, v in rows]
+    lines += ["# HELP subtitle_jobs Jobs by current status", "# TYPE subtitle_jobs gauge"]
+    for status, n in db.execute(select(Job.status, func.count()).group_by(Job.status)).all():
+        lines.append(f"{series('subtitle_jobs', status=status)} {n}")
+    try:
+        broker = redis.Redis.from_url(settings.celery_broker_url, socket_timeout=0.5, socket_connect_timeout=0.5)
+        depths = {q: broker.llen(q) for q in ("default", "audio", "asr", "llm")}
+        lines += ["# HELP subtitle_queue_length Celery tasks waiting per queue", "# TYPE subtitle_queue_length gauge"]
+        lines += [f"{series('subtitle_queue_length', queue=q)} {n}" for q, n in depths.items()]
+    except redis.RedisError:
+        pass
+    return "\n".join(lines) + "\n"
+
+def job_profile(db: Session, job_id: str) -> Dict[str, Any]:
+    spans = db.execute(select(JobSpan).where(JobSpan.job_id == job_id).order_by(JobSpan.started_at)).scalars().all()
+    stages: Dict[str, Dict[str, Any]] = {}
+    for sp in spans:
+        st = stages.setdefault(sp.name, {
+            "name": sp.name, "started_at": sp.started_at, "finished_at": sp.finished_at, "busy_s": 0.0,
+            "spans": 0, "errors": 0, "db_queries": 0, "db_time_s": 0.0, "bytes": 0, "counts": {},
+        })
+        st["started_at"] = min(st["started_at"], sp.started_at)
+        st["finished_at"] = max(st["finished_at"], sp.finished_at)
+        st["busy_s"] += sp.duration_s
+        st["spans"] += 1
+        st["errors"] += sp.status != "success"
+        st["db_queries"] += sp.db_queries
+        st["db_time_s"] += sp.db_time_s
+        st["bytes"] += sp.bytes or 0
+        for k, v in (sp.counts or {}).items():
+            st["counts"][k] = st["counts"].get(k, 0) + v
+    for st in stages.values():
+        st["wall_s"] = (st["finished_at"] - st["started_at"]).total_seconds()
+
+    stage_col = LLMRun.meta["stage"].as_string()
+    latency = func.extract("epoch", LLMRun.finished_at - LLMRun.started_at)
+    llm = [
+        {
+            "stage": stage, "agent": agent, "model": model, "calls": calls, "errors": errors, "cache_hits": hits,
+            "prompt_tokens": int(pt or 0), "completion_tokens": int(ct or 0),
+            "cost_usd": float(cost or 0), "avg_latency_s": float(lat) if lat is not None else None,
+        }
+        for stage, agent, model, calls, errors, hits, pt, ct, cost, lat in db.execute(
+            select(
+                stage_col, LLMRun.agent_name, LLMRun.model, func.count(),
+                func.count().filter(LLMRun.status != "success"), func.count().filter(LLMRun.cache_hit.is_(True)),
+                func.sum(LLMRun.prompt_tokens), func.sum(LLMRun.completion_tokens), func.sum(LLMRun.cost_usd),
+                func.avg(latency),
+            ).where(LLMRun.job_id == job_id).group_by(stage_col, LLMRun.agent_name, LLMRun.model)
+        ).all()
+    ]
+    for row in llm:
+        st = stages.get(row["stage"])
+        if st is not None:
+            st["llm_calls"] = st.get("llm_calls", 0) + row["calls"]
+            st["cost_usd"] = st.get("cost_usd", 0.0) + row["cost_usd"]
+    wall = (max(s.finished_at for s in spans) - min(s.started_at for s in spans)).total_seconds() if spans else 0.0
+    return {
+        "job_id": job_id,
+        "wall_s": wall,
+        "cost_usd": sum(r["cost_usd"] for r in llm),
+        "stages": sorted(stages.values(), key=lambda st: st["started_at"]),
+        "llm": llm,
+    }
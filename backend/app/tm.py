@@ -1,10 +1,23 @@
-import hashlib, re, json
-from typing import List
+import hashlib, re, json, threading, logging
+from datetime import datetime
+from collections import OrderedDict
+from typing import Any, Dict, Iterable, List, Optional, Tuple
 from sqlalchemy.orm import Session
-from sqlalchemy import select
-from .models import TMEntry
+from sqlalchemy import select, text, tuple_
+from sqlalchemy.dialects.postgresql import insert as pg_insert
+from .models import TMEntry, EmbeddingCacheEntry, TMJudgeVerdict, uuid4
 from .config import settings
-from .llm_router import client, call_with_fallbacks
+from .db import SessionLocal
+from .concurrency import run_bounded
+from .llm_router import call_with_fallbacks, embed_recorded, is_json, parse_json, TruncatedOutput
+from .langs import lang_name
+from .telemetry import incr, series
+
+log = logging.getLogger(__name__)
+
+HNSW_INDEX = "ix_tm_entries_embedding_hnsw"
+HNSW_MAX_DIMS = {"vector": 2000, "halfvec": 4000}
+_iterative_scan: Optional[bool] = None
 
 def normalize_for_hash(s: str) -> str:
     s = (s or "").strip().lower()
@@ -14,18 +27,213 @@ def normalize_for_hash(s: str) -> str:
 def en_hash(s: str) -> str:
     return hashlib.sha256(normalize_for_hash(s).encode("utf-8")).hexdigest()
 
+_emb_lru: "OrderedDict[Tuple[str, str], List[float]]" = OrderedDict()
+_emb_lru_lock = threading.Lock()
+
+def _lru_get(key: Tuple[str, str]) -> Optional[List[float]]:
+    with _emb_lru_lock:
+        emb = _emb_lru.get(key)
+        if emb is not None:
+            _emb_lru.move_to_end(key)
+        return emb
+
+def _lru_put(key: Tuple[str, str], emb: List[float]):
+    with _emb_lru_lock:
+        _emb_lru[key] = emb
+        _emb_lru.move_to_end(key)
+        while len(_emb_lru) > max(0, int(settings.embedding_cache_lru_size)):
+            _emb_lru.popitem(last=False)
+
+def vector_sql_type() -> str:
+    return f"{settings.tm_vector_type}({int(settings.embedding_dimensions)})"
+
+def embedding_cache_key() -> str:
+    # Reduced-dimension embeddings are not interchangeable with full ones.
+    return f"{settings.embedding_model}@{int(settings.embedding_dimensions)}"
+
+def column_type(conn, table: str, column: str) -> Optional[str]:
+    return conn.execute(text(
+        "SELECT format_type(a.atttypid, a.atttypmod) FROM pg_attribute a "
+        "WHERE a.attrelid = to_regclass(:t) AND a.attname = :c AND NOT a.attisdropped"
+    ), {"t": table, "c": column}).scalar()
+
+def pgvector_version(conn) -> Tuple[int, ...]:
+    v = conn.execute(text("SELECT extversion FROM pg_extension WHERE extname = 'vector'")).scalar()
+    return tuple(int(x) for x in re.findall(r"\d+", v or ""))
+
+def iterative_scan_supported(conn) -> bool:
+    global _iterative_scan
+    if _iterative_scan is None:
+        _iterative_scan = pgvector_version(conn) >= (0, 8)
+        if not _iterative_scan:
+            log.warning("pgvector < 0.8: HNSW lookups filter target_lang after the scan, so languages with "
+                        "few TM rows can get fewer than k matches")
+    return _iterative_scan
+
+def tm_embedding_type(db: Session) -> str:
+    # The column's actual type: until tm_migrate has run it can still be the old one (e.g. vector(3072) while
+    # TM_VECTOR_TYPE=halfvec), and lookups must cast to it or `<=>` has no matching operator.
+    return column_type(db.connection(), "tm_entries", "embedding") or vector_sql_type()
+
+def ensure_tm_index(conn, rebuild: bool = False):
+    target = vector_sql_type()
+    current = column_type(conn, "tm_entries", "embedding")
+    if current != target:
+        log.warning("tm_entries.embedding is %s, expected %s; TM lookups run unindexed until "
+                    "`python -m app.tm_migrate` converts it", current, target)
+        return
+    if int(settings.embedding_dimensions) > HNSW_MAX_DIMS.get(settings.tm_vector_type, 0):
+        log.warning("HNSW cannot index %s; use halfvec or fewer embedding_dimensions", target)
+        return
+    if rebuild:
+        conn.execute(text(f"DROP INDEX IF EXISTS {HNSW_INDEX}"))
+    conn.execute(text(
+        f"CREATE INDEX IF NOT EXISTS {HNSW_INDEX} ON tm_entries "
+        f"USING hnsw (embedding {settings.tm_vector_type}_cosine_ops) "
+        f"WITH (m = {int(settings.tm_hnsw_m)}, ef_construction = {int(settings.tm_hnsw_ef_construction)})"
+    ))
+
 def embed_texts(texts: List[str]) -> List[List[float]]:
-    return client.embed(settings.embedding_model, texts)
+    # Content-addressed: in-process LRU -> embedding_cache table -> OpenRouter (misses only).
+    model = embedding_cache_key()
+    hashes = [en_hash(t) for t in texts]
+    found: Dict[str, List[float]] = {}
+    todo: Dict[str, str] = {}
+    for h, t in zip(hashes, texts):
+        if h in found or h in todo:
+            continue
+        emb = _lru_get((model, h))
+        if emb is not None:
+            found[h] = emb
+        else:
+            todo[h] = t
+    if not todo:
+        return [found[h] for h in hashes]
+
+    with SessionLocal() as s:
+        rows = s.execute(
+            select(EmbeddingCacheEntry.en_hash, EmbeddingCacheEntry.embedding)
+            .where(EmbeddingCacheEntry.embedding_model == model, EmbeddingCacheEntry.en_hash.in_(list(todo)))
+        ).all()
+        for h, emb in rows:
+            emb = [float(x) for x in emb]
+            found[h] = emb
+            _lru_put((model, h), emb)
+            todo.pop(h, None)
+
+        items = list(todo.items())
+        bs = max(1, int(settings.embedding_batch_size))
+        for i in range(0, len(items), bs):
+            chunk = items[i:i+bs]
+            embs = embed_recorded(settings.embedding_model, [t for _, t in chunk], dimensions=settings.embedding_dimensions)
+            rows = []
+            for (h, _), emb in zip(chunk, embs):
+                found[h] = emb
+                _lru_put((model, h), emb)
+                rows.append({"en_hash": h, "embedding_model": model, "embedding": emb})
+            s.execute(pg_insert(EmbeddingCacheEntry).values(rows).on_conflict_do_nothing())
+            s.commit()
+    return [found[h] for h in hashes]
 
-def tm_topk(db: Session, emb: List[float], k: int = 8) -> List[TMEntry]:
+def tm_exact_lookup(db: Session, hashes: Iterable[str], lang: str = "fa") -> Dict[str, TMEntry]:
+    hashes = set(hashes)
+    if not hashes:
+        return {}
     stmt = (
         select(TMEntry)
-        .where(TMEntry.embedding.is_not(None))
+        .where(TMEntry.target_lang == lang, TMEntry.en_hash.in_(hashes), TMEntry.quality_grade == "trusted")
+        .order_by(TMEntry.version.desc(), TMEntry.updated_at.desc())
+    )
+    out: Dict[str, TMEntry] = {}
+    for e in db.execute(stmt).scalars():
+        out.setdefault(e.en_hash, e)
+    return out
+
+def tm_store_entries(db: Session, entries: List[Dict[str, Any]]) -> int:
+    # entries: TMEntry column dicts (with target_lang) without en_hash/embedding. One query for existing
+    # (target_lang, en_hash) keys, then embed + bulk insert per embedding batch; ON CONFLICT makes concurrent jobs race-free.
+    by_key: Dict[Tuple[str, str], Dict[str, Any]] = {}
+    for e in entries:
+        e.setdefault("target_lang", "fa")
+        by_key.setdefault((e["target_lang"], en_hash(e["en_text"])), e)
+    if not by_key:
+        return 0
+    existing = {tuple(r) for r in db.execute(
+        select(TMEntry.target_lang, TMEntry.en_hash).where(tuple_(TMEntry.target_lang, TMEntry.en_hash).in_(list(by_key)))
+    )}
+    new = [(h, e) for (lang, h), e in by_key.items() if (lang, h) not in existing]
+    stored = 0
+    bs = max(1, int(settings.embedding_batch_size))
+    for i in range(0, len(new), bs):
+        chunk = new[i:i+bs]
+        embs = embed_texts([e["en_text"] for _, e in chunk])
+        now = datetime.utcnow()
+        rows = [
+            {**e, "tm_entry_id": uuid4(), "en_hash": h, "embedding": emb, "created_at": now, "updated_at": now}
+            for (h, e), emb in zip(chunk, embs)
+        ]
+        res = db.execute(pg_insert(TMEntry).values(rows).on_conflict_do_nothing(index_elements=["target_lang", "en_hash"]))
+        stored += max(0, res.rowcount or 0)
+    db.commit()
+    return stored
+
+def tm_topk(db: Session, emb: List[float], k: int = 8, lang: str = "fa") -> List[TMEntry]:
+    stmt = (
+        select(TMEntry)
+        .where(TMEntry.target_lang == lang, TMEntry.embedding.is_not(None))
         .order_by(TMEntry.embedding.cosine_distance(emb))
         .limit(k)
     )
     return list(db.execute(stmt).scalars().all())
 
+def _topk_batch_sql(vt: str):
+    return text(f"""
+SELECT q.idx, c.tm_entry_id, c.sim
+FROM unnest(CAST(:idx AS integer[]), CAST(:embs AS text[])) AS q(idx, emb)
+CROSS JOIN LATERAL (
+    SELECT t.tm_entry_id, 1 - (t.embedding <=> CAST(q.emb AS {vt})) AS sim
+    FROM tm_entries t
+    WHERE t.target_lang = :lang AND t.embedding IS NOT NULL
+    ORDER BY t.embedding <=> CAST(q.emb AS {vt})
+    LIMIT :k
+) c
+""")
+
+def vector_literal(emb: List[float]) -> str:
+    return "[" + ",".join(repr(float(x)) for x in emb) + "]"
+
+def tm_topk_batch(db: Session, embs: List[List[float]], k: int = 8, lang: str = "fa") -> List[List[Tuple[TMEntry, float]]]:
+    # One lateral-join query per chunk of cues; returns (entry, cosine similarity) best-first per input.
+    if not embs:
+        return []
+    hits = []
+    sql = _topk_batch_sql(tm_embedding_type(db))
+    db.execute(text(f"SET LOCAL hnsw.ef_search = {max(int(settings.tm_hnsw_ef_search), k)}"))
+    # One index covers every language and target_lang is filtered after the scan; without iterative scans a
+    # language with a small share of the TM finds few (often none) of its rows among the ef_search nearest.
+    mode = settings.tm_hnsw_iterative_scan
+    if mode in ("relaxed_order", "strict_order") and iterative_scan_supported(db.connection()):
+        db.execute(text(f"SET LOCAL hnsw.iterative_scan = {mode}"))
+    chunk = max(1, int(settings.tm_lookup_chunk_size))
+    for start in range(0, len(embs), chunk):
+        part = embs[start:start+chunk]
+        hits.extend(db.execute(sql, {
+            "idx": list(range(start, start + len(part))),
+            "embs": [vector_literal(e) for e in part],
+            "k": k,
+            "lang": lang,
+        }).all())
+    ids = {r.tm_entry_id for r in hits}
+    entries = {}
+    if ids:
+        entries = {e.tm_entry_id: e for e in db.execute(select(TMEntry).where(TMEntry.tm_entry_id.in_(ids))).scalars()}
+    out: List[List[Tuple[TMEntry, float]]] = [[] for _ in embs]
+    for r in hits:
+        out[r.idx].append((entries[r.tm_entry_id], float(r.sim)))
+    for cands in out:
+        cands.sort(key=lambda x: x[1], reverse=True)
+    return out
+
 def composite_confidence(en_text: str, cand_en: str, sim: float) -> float:
     a = en_text.strip()
     b = cand_en.strip()
@@ -38,21 +246,92 @@ def composite_confidence(en_text: str, cand_en: str, sim: float) -> float:
     conf = 0.75 * sim + 0.15 * len_ratio + 0.10 * num_match
     return float(max(0.0, min(1.0, conf)))
 
-def judge_tm_reuse(db: Session, job_id: str, en_text: str, fa_text: str) -> bool:
-    sys = "You are a strict bilingual subtitle QA judge (EN→FA)."
+TM_JUDGE_SYS = "You are a strict bilingual subtitle QA judge (EN→{lang})."
+
+def _judge_batch(job_id: str, lang: str, pairs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    # Short per-batch ids keep the prompt and the answer small; mapped back to pair ids here.
+    local = {f"p{i}": p for i, p in enumerate(pairs, start=1)}
+    items = [{"id": k, "english": p["en_text"], "translation": p["fa_text"]} for k, p in local.items()]
     usr = (
-        "Decide if the Persian translation can be reused AS-IS for the English sentence. "
-        "Return ONLY JSON: {\"reuse\": true/false, \"reason\": \"...\"}.\n\n"
-        f"English: {en_text}\nPersian: {fa_text}"
-    )
-    content = call_with_fallbacks(
-        db=db, job_id=job_id, cue_id=None, agent_name="tm_judge",
-        primary_model=settings.model_tm_judge, fallback_models=[],
-        messages=[{"role":"system","content":sys},{"role":"user","content":usr}],
-        temperature=0.0, max_tokens=200, meta={"purpose":"tm_reuse_judge"},
+        f"For each pair, decide if the {lang_name(lang)} translation can be reused AS-IS for the English sentence. "
+        "Return ONLY JSON mapping id -> {\"reuse\": true/false, \"reason\": \"...\"} (reason: at most 10 words).\n\n"
+        f"Pairs JSON:\n{json.dumps(items, ensure_ascii=False)}"
     )
+    with SessionLocal() as s:
+        content = call_with_fallbacks(
+            db=s, job_id=job_id, cue_id=None, agent_name="tm_judge",
+            primary_model=settings.model_tm_judge, fallback_models=[],
+            messages=[{"role":"system","content":TM_JUDGE_SYS.format(lang=lang.upper())},{"role":"user","content":usr}],
+            temperature=0.0, max_tokens=100 + 80 * len(pairs),
+            meta={"purpose":"tm_reuse_judge", "pairs": len(pairs), "lang": lang}, validate=is_json,
+        )
     try:
-        obj = json.loads(content.strip())
-        return bool(obj.get("reuse"))
-    except Exception:
-        return False
+        obj = parse_json(content)
+    except ValueError as e:
+        raise TruncatedOutput(f"tm_judge returned invalid JSON for {len(pairs)} pairs: {e}") from e
+    out = {}
+    for k, p in local.items():
+        v = obj.get(k)
+        if isinstance(v, dict) and "reuse" in v:
+            out[p["id"]] = {"reuse": bool(v.get("reuse")), "reason": v.get("reason")}
+    return out
+
+def _judge_adaptive(job_id: str, lang: str, pairs: List[Dict[str, Any]]) -> Dict[str, Dict[str, Any]]:
+    # A truncated verdict list is split in half and re-asked, instead of losing the whole batch.
+    try:
+        return _judge_batch(job_id, lang, pairs)
+    except TruncatedOutput:
+        if len(pairs) <= 1:
+            raise
+        mid = len(pairs) // 2
+        return {**_judge_adaptive(job_id, lang, pairs[:mid]), **_judge_adaptive(job_id, lang, pairs[mid:])}
+
+def judge_tm_reuse_batch(db: Session, job_id: str, pairs: List[Dict[str, Any]], lang: str = "fa") -> Dict[str, bool]:
+    # pairs: {"id", "en_text", "fa_text", "tm_entry_id"}. Prior verdicts for (en_hash, tm_entry_id)
+    # are reused; the rest go out in packed, concurrent prompts. Unjudged pairs count as "no reuse".
+    if not pairs:
+        return {}
+    for p in pairs:
+        p["en_hash"] = en_hash(p["en_text"])
+    keys = {(p["en_hash"], p["tm_entry_id"]) for p in pairs}
+    cached = {
+        (r.en_hash, r.tm_entry_id): r.reuse
+        for r in db.execute(
+            select(TMJudgeVerdict).where(tuple_(TMJudgeVerdict.en_hash, TMJudgeVerdict.tm_entry_id).in_(list(keys)))
+        ).scalars()
+    }
+    verdicts = {p["id"]: cached[(p["en_hash"], p["tm_entry_id"])] for p in pairs if (p["en_hash"], p["tm_entry_id"]) in cached}
+
+    todo, seen = [], set()
+    for p in pairs:
+        k = (p["en_hash"], p["tm_entry_id"])
+        if k not in cached and k not in seen:
+            seen.add(k)
+            todo.append(p)
+    bs = max(1, int(settings.tm_judge_batch_size))
+    batches = [todo[i:i+bs] for i in range(0, len(todo), bs)]
+    rows = {}
+    unjudged = 0
+    for batch, out, err in run_bounded(lambda b: _judge_adaptive(job_id, lang, b), batches, settings.tm_judge_max_in_flight):
+        if err is not None:
+            log.warning("TM judge failed for %d %s pairs of job %s; treating them as no reuse: %s", len(batch), lang, job_id, err)
+            unjudged += len(batch)
+            continue
+        for p in batch:
+            if p["id"] in out:
+                rows[(p["en_hash"], p["tm_entry_id"])] = out[p["id"]]
+            else:
+                unjudged += 1
+    if unjudged:
+        incr({series("subtitle_tm_judge_unjudged_total", lang=lang): unjudged})
+    if rows:
+        db.execute(pg_insert(TMJudgeVerdict).values([
+            {"en_hash": h, "tm_entry_id": tid, "reuse": v["reuse"], "reason": v.get("reason"), "created_at": datetime.utcnow()}
+            for (h, tid), v in rows.items()
+        ]).on_conflict_do_nothing())
+        db.commit()
+    for p in pairs:
+        v = rows.get((p["en_hash"], p["tm_entry_id"]))
+        if v is not None:
+            verdicts[p["id"]] = v["reuse"]
+    return verdicts
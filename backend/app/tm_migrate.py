@@ -0,0 +1,62 @@
+import argparse
+from sqlalchemy import text
+from .db import engine, init_db
+from .config import settings
+from .tm import HNSW_INDEX, column_type, embed_texts, ensure_tm_index, vector_literal, vector_sql_type
+
+def _dims(sql_type: str) -> str:
+    return sql_type.rsplit("(", 1)[-1].rstrip(")")
+
+def migrate_columns():
+    target = vector_sql_type()
+    with engine.begin() as conn:
+        for table in ("tm_entries", "embedding_cache"):
+            current = column_type(conn, table, "embedding")
+            if current is None or current == target:
+                continue
+            print(f"{table}.embedding: {current} -> {target}")
+            if table == "tm_entries":
+                conn.execute(text(f"DROP INDEX IF EXISTS {HNSW_INDEX}"))
+            if _dims(current) == _dims(target):
+                conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN embedding TYPE {target} USING CAST(embedding AS {target})"))
+            else:
+                # Different dimensionality cannot be cast; drop the vectors and re-embed below.
+                if table == "embedding_cache":
+                    conn.execute(text("DELETE FROM embedding_cache"))
+                conn.execute(text(f"ALTER TABLE {table} ALTER COLUMN embedding TYPE {target} USING NULL"))
+
+def backfill(batch_size: int) -> int:
+    vt = vector_sql_type()
+    done = 0
+    while True:
+        with engine.begin() as conn:
+            rows = conn.execute(text(
+                "SELECT tm_entry_id, en_text FROM tm_entries WHERE embedding IS NULL ORDER BY tm_entry_id LIMIT :n"
+            ), {"n": batch_size}).all()
+            if not rows:
+                return done
+            embs = embed_texts([r.en_text for r in rows])
+            conn.execute(
+                text(f"UPDATE tm_entries SET embedding = CAST(:emb AS {vt}) WHERE tm_entry_id = :id"),
+                [{"id": r.tm_entry_id, "emb": vector_literal(e)} for r, e in zip(rows, embs)],
+            )
+        done += len(rows)
+        print(f"backfilled {done} TM entries")
+
+def main():
+    ap = argparse.ArgumentParser(description="Migrate TM embeddings to the configured vector type/dimensions and (re)build the HNSW index.")
+    ap.add_argument("--batch-size", type=int, default=settings.embedding_batch_size)
+    ap.add_argument("--reindex", action="store_true", help="drop and rebuild the HNSW index (e.g. after changing m/ef_construction)")
+    ap.add_argument("--skip-backfill", action="store_true")
+    args = ap.parse_args()
+
+    init_db()
+    migrate_columns()
+    if not args.skip_backfill:
+        print(f"backfill complete: {backfill(max(1, args.batch_size))} entries")
+    with engine.begin() as conn:
+        ensure_tm_index(conn, rebuild=args.reindex)
+    print(f"HNSW index {HNSW_INDEX} ready on {vector_sql_type()}")
+
+if __name__ == "__main__":
+    main()
@@ -1,4 +1,5 @@
 from celery import Celery
+from celery.signals import worker_shutdown
 from .config import settings
 
 celery_app = Celery(
@@ -7,5 +8,20 @@ celery_app = Celery(
     backend=settings.celery_result_backend,
     include=["app.tasks"],
 )
-celery_app.conf.task_routes = {"run_job_pipeline": {"queue": "default"}}
+celery_app.conf.task_routes = {
+    "run_job_pipeline": {"queue": "default"},
+    "translate_unit": {"queue": "llm"},
+    "qa_unit": {"queue": "llm"},
+    "finish_stage": {"queue": "llm"},
+    "finish_job": {"queue": "llm"},
+}
+# Stage tasks get their queue per stage (tasks.stage_queue); late acks + prefetch 1 keep
+# long-running stages from being hoarded by one worker and make them survive worker loss.
+celery_app.conf.task_acks_late = True
+celery_app.conf.worker_prefetch_multiplier = 1
 celery_app.conf.result_expires = 3600
+
+@worker_shutdown.connect
+def _flush_llm_runs(**_):
+    from .run_log import recorder
+    recorder.close()
@@ -0,0 +1,16 @@
+from types import SimpleNamespace
+import pytest
+
+def new_cue(i: int, text: str = "", **kw) -> SimpleNamespace:
+    # Stand-in for a JobCue row: the helpers under test only read attributes.
+    fields = dict(cue_id=f"c{i}", cue_index=i, start_ms=i * 1000, end_ms=i * 1000 + 900,
+                  en_text=text or f"line number {i}", fa_text=None, fa_text_qa=None, needs_translation=True)
+    return SimpleNamespace(**{**fields, **kw})
+
+@pytest.fixture
+def make_cue():
+    return new_cue
+
+@pytest.fixture
+def cues():
+    return [new_cue(i) for i in range(1, 11)]
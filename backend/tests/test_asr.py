@@ -0,0 +1,71 @@
+import wave
+import pytest
+from app import asr
+from app.asr import ASRBackend, plan_cuts, stitch
+
+def test_backend_must_implement_transcribe():
+    class Incomplete(ASRBackend):
+        name = "incomplete"
+
+    with pytest.raises(TypeError):
+        Incomplete()
+
+def test_cuts_snap_to_nearby_silences():
+    silences = [(590.0, 591.0), (1215.0, 1216.0), (1900.0, 1902.0)]
+    assert plan_cuts(2400, silences, target_s=600, search_s=60) == [590.5, 1215.5, 1815.5]
+
+def test_cuts_fall_back_to_target_without_silence():
+    assert plan_cuts(1900, [], target_s=600, search_s=60) == [600, 1200]
+    assert plan_cuts(500, [], target_s=600, search_s=60) == []
+
+def test_no_tiny_last_chunk():
+    # 1300s would leave a 100s tail after a cut at 1200, so the last chunk absorbs it.
+    assert plan_cuts(1300, [], target_s=600, search_s=60) == [600]
+
+def test_stitch_keeps_each_overlapping_word_once():
+    # Chunk 0 covers 0-12s, chunk 1 covers 8-20s (offset 8); the cut is at 10s.
+    a = {"words": [{"text": "one", "start": 1000, "end": 1500}, {"text": "edge", "start": 9600, "end": 10200},
+                   {"text": "late", "start": 11000, "end": 11500}]}
+    b = {"words": [{"text": "edge", "start": 1600, "end": 2200}, {"text": "late", "start": 3000, "end": 3500},
+                   {"text": "end", "start": 10000, "end": 10500}]}
+    out = stitch([(0.0, 0.0, 10.0, a), (8.0, 10.0, float("inf"), b)])
+    assert out["text"] == "one edge late end"
+    assert out["words"][-1] == {"text": "end", "start": 18000, "end": 18500}
+
+class Recorder(ASRBackend):
+    name = "recorder"
+
+    def __init__(self):
+        self.paths = []
+
+    def transcribe(self, audio_path):
+        self.paths.append(audio_path)
+        return {"text": "hi", "words": [{"text": "hi", "start": 1500, "end": 1700}]}
+
+def write_wav(path, seconds):
+    with wave.open(str(path), "wb") as w:
+        w.setnchannels(1)
+        w.setsampwidth(2)
+        w.setframerate(8000)
+        w.writeframes(b"\0\0" * int(8000 * seconds))
+
+def test_short_audio_is_sent_whole(tmp_path, monkeypatch):
+    monkeypatch.setattr(asr.settings, "asr_chunk_min_s", 1200)
+    path = tmp_path / "a.wav"
+    write_wav(path, 2)
+    backend = Recorder()
+    assert asr.transcribe(str(path), backend)["text"] == "hi"
+    assert backend.paths == [str(path)]
+
+def test_long_audio_is_chunked_and_stitched(tmp_path, monkeypatch):
+    monkeypatch.setattr(asr.settings, "asr_chunk_min_s", 10)
+    monkeypatch.setattr(asr.settings, "asr_chunk_s", 10)
+    monkeypatch.setattr(asr.settings, "asr_chunk_overlap_s", 1.0)
+    monkeypatch.setattr(asr, "detect_silences", lambda path: [])
+    path = tmp_path / "a.wav"
+    write_wav(path, 30)
+    backend = Recorder()
+    out = asr.transcribe(str(path), backend)
+    assert len(backend.paths) == 3
+    assert [w["start"] for w in out["words"]] == [1500, 10500, 20500]
+    assert not (tmp_path / "asr_chunks").exists()
@@ -0,0 +1,50 @@
+import pytest
+from app import pipeline
+
+@pytest.mark.parametrize("key, value", [("asr_chunk_s", 300), ("asr_chunk_min_s", 600), ("asr_chunk_overlap_s", 1.0),
+                                        ("asr_chunk_search_s", 30), ("asr_backend", "other")])
+def test_store_name_changes_with_asr_settings(monkeypatch, key, value):
+    before = pipeline.asr_store_name()
+    monkeypatch.setattr(pipeline.settings, key, value)
+    assert pipeline.asr_store_name() != before
+
+def test_store_name_ignores_chunk_sizes_when_chunking_is_off(monkeypatch):
+    monkeypatch.setattr(pipeline.settings, "asr_chunk_s", 0)
+    before = pipeline.asr_store_name()
+    monkeypatch.setattr(pipeline.settings, "asr_chunk_min_s", 1)
+    assert pipeline.asr_store_name() == before
+
+class FakeDB:
+    def commit(self):
+        pass
+
+def test_rerun_with_new_key_does_not_rewrite_the_cached_transcript(monkeypatch, tmp_path):
+    from types import SimpleNamespace
+    from app import storage
+    monkeypatch.setattr(storage, "BASE", tmp_path)
+    monkeypatch.setattr(pipeline, "content_keys", lambda db, job: ["sha256:abc"])
+    audio = tmp_path / "normalized.wav"
+    audio.write_bytes(b"RIFF")
+    job = SimpleNamespace(job_id="j1", normalized_uri=str(audio), asr_json_uri=None)
+    monkeypatch.setattr(pipeline, "transcribe", lambda path: {"text": "old", "words": []})
+    pipeline.stage_asr(FakeDB(), job)
+    old_entry = storage.cas_find(["sha256:abc"], pipeline.asr_store_name())
+
+    assert pipeline.stage_asr(FakeDB(), job)["reused"]  # work-dir asr.json is now linked to the CAS entry
+    monkeypatch.setattr(pipeline.settings, "asr_chunk_s", pipeline.settings.asr_chunk_s + 1)
+    monkeypatch.setattr(pipeline, "transcribe", lambda path: {"text": "new", "words": []})
+    assert not pipeline.stage_asr(FakeDB(), job)["reused"]
+    assert '"old"' in open(old_entry, encoding="utf-8").read()
+    assert '"new"' in open(job.asr_json_uri, encoding="utf-8").read()
+
+def test_normalize_replaces_instead_of_writing_through(monkeypatch, tmp_path):
+    from app import audio_prep, storage
+    monkeypatch.setattr(storage, "BASE", tmp_path)
+    monkeypatch.setattr(audio_prep.settings, "audio_prep_passthrough", False)
+    cached = tmp_path / "cached.wav"
+    cached.write_bytes(b"cached")
+    out = storage.job_workdir("j1") / "normalized.wav"
+    storage.link_or_copy(str(cached), out)
+    monkeypatch.setattr(audio_prep.subprocess, "check_call", lambda cmd: open(cmd[cmd.index("-o") + 1], "wb").write(b"fresh"))
+    assert audio_prep.ffmpeg_normalize("in.mp4", "j1") == str(out)
+    assert (out.read_bytes(), cached.read_bytes()) == (b"fresh", b"cached")
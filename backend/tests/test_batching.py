@@ -0,0 +1,26 @@
+import json
+from app.agents import pack_translation_batches, translator_output_budget, estimate_tokens
+from app.config import settings
+
+def cues(n: int, text: str):
+    return [{"cue_id": f"0b4c1f7e-5d2a-4c1e-9a57-{i:012d}", "start_ms": i * 1000, "end_ms": i * 1000 + 900, "en_text": text} for i in range(n)]
+
+def test_short_cues_pack_into_fewer_larger_batches():
+    batches = pack_translation_batches(5, [], cues(100, "Okay."))
+    assert len(batches) < 5  # fixed 20-cue batching gave 5
+    assert sum(len(b) for b in batches) == 100
+    assert max(len(b) for b in batches) > 20
+
+def test_count_cap_still_applies(monkeypatch):
+    monkeypatch.setattr(settings, "translation_batch_max_cues", 10)
+    batches = pack_translation_batches(5, [], cues(35, "Okay."))
+    assert [len(b) for b in batches] == [10, 10, 10, 5]
+
+def test_long_cues_are_limited_by_output_budget():
+    long = "This is a considerably longer subtitle line that keeps going for a while, " * 3
+    batches = pack_translation_batches(5, [], cues(60, long))
+    max_out = int(translator_output_budget(5) * 0.85)
+    for b in batches:
+        out = sum(int(estimate_tokens(c["en_text"]) * settings.translator_output_token_ratio) + estimate_tokens(json.dumps(c["cue_id"])) + 4 for c in b)
+        assert out <= max_out or len(b) == 1
+    assert [c["cue_id"] for b in batches for c in b] == [c["cue_id"] for c in cues(60, long)]
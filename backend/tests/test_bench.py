@@ -0,0 +1,91 @@
+import asyncio, json, os, socket, subprocess, sys, threading
+from http.server import ThreadingHTTPServer
+import httpx
+import pytest
+from app import fake_openrouter
+from app.bench import synthetic_words
+from app.config import settings
+from app.llm_router import AsyncOpenRouterClient
+from app.segmenter import segment_from_words
+
+def test_synthetic_episode_segments_one_cue_per_sentence():
+    words = synthetic_words(50, seed=1)
+    assert len(segment_from_words(words)) == 50
+    assert synthetic_words(50, seed=1) == words
+
+@pytest.fixture
+def fake(monkeypatch):
+    args = fake_openrouter.build_parser().parse_args(["--latency", "0/0", "--embed-latency", "0/0", "--port", "0"])
+    fo = fake_openrouter.FakeOpenRouter(args)
+    server = ThreadingHTTPServer(("127.0.0.1", 0), fake_openrouter.make_handler(fo))
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    monkeypatch.setattr(settings, "openrouter_base_url", f"http://127.0.0.1:{server.server_port}/api/v1")
+    monkeypatch.setattr(settings, "llm_rate_limit_rps", 0.0)
+    yield fo
+    server.shutdown()
+    server.server_close()
+
+def call(coro_fn):
+    async def run():
+        c = AsyncOpenRouterClient()
+        c.key = "bench"
+        try:
+            return await coro_fn(c)
+        finally:
+            await c.aclose()
+    return asyncio.run(run())
+
+def translator_messages(cues):
+    return [{"role": "system", "content": "You are the Translator (EN→fa)."},
+            {"role": "user", "content": "Cues JSON:\n" + json.dumps(cues)}]
+
+def test_fake_answers_agents_with_usage_and_cost(fake):
+    cues = [{"cue_id": "c1", "en_text": "Hello there"}, {"cue_id": "c2", "en_text": "Run the job"}]
+    resp = call(lambda c: c.chat("m", translator_messages(cues), temperature=0, max_tokens=500))
+    assert json.loads(resp["choices"][0]["message"]["content"]) == {"c1": "fa: Hello there", "c2": "fa: Run the job"}
+    assert resp["choices"][0]["finish_reason"] == "stop"
+    assert resp["usage"]["cost"] > 0
+
+    embs, usage = call(lambda c: c.embed("e", ["same", "same", "other"], dimensions=8))
+    assert embs[0] == embs[1] != embs[2]
+    assert usage["cost"] > 0
+    stats = httpx.get(f"{settings.openrouter_base_url}/stats").json()
+    assert stats["agents"] == {"translator": 1}
+    assert stats["embedded_texts"] == 3
+
+def test_fake_truncates_at_max_tokens(fake):
+    cues = [{"cue_id": f"c{i}", "en_text": "a fairly long line of speech"} for i in range(20)]
+    resp = call(lambda c: c.chat("m", translator_messages(cues), temperature=0, max_tokens=20))
+    assert resp["choices"][0]["finish_reason"] == "length"
+
+def test_client_retries_injected_429s(fake, monkeypatch):
+    fake.rate_limit_rate, fake.retry_after_s = 1.0, 0.01
+    monkeypatch.setattr(settings, "llm_max_attempts", 2)
+    with pytest.raises(httpx.HTTPStatusError):
+        call(lambda c: c.embed("e", ["x"]))
+    stats = httpx.get(f"{settings.openrouter_base_url}/stats").json()
+    assert stats["status"] == {"429": 2}
+
+def postgres_reachable() -> bool:
+    try:
+        socket.create_connection((settings.postgres_host, settings.postgres_port), timeout=1).close()
+        return True
+    except OSError:
+        return False
+
+@pytest.mark.skipif("bench" not in settings.postgres_db or not postgres_reachable(),
+                    reason="needs Postgres and Redis with a POSTGRES_DB containing 'bench' (see README, Offline benchmark)")
+def test_offline_benchmark_runs_end_to_end(tmp_path):
+    out = tmp_path / "bench.json"
+    port = socket.socket()
+    port.bind(("127.0.0.1", 0))
+    free = port.getsockname()[1]
+    port.close()
+    subprocess.run([sys.executable, "-m", "app.bench", "--cues", "30", "--latency", "5/0", "--embed-latency", "1/0",
+                    "--port", str(free), "--json", str(out)], check=True, timeout=600,
+                   cwd=os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+    [r] = json.loads(out.read_text())
+    assert r["error"] is None
+    assert r["cues"] >= 30
+    assert r["llm_calls"] > 0 and r["http"]["status"].get("200")
@@ -0,0 +1,90 @@
+from types import SimpleNamespace
+import pytest
+from app import pipeline
+from app.pipeline import LANG_STAGES, SHARED_STAGES, pending_stages, split_key, stage_key
+
+def test_stage_keys_round_trip():
+    assert stage_key("SEGMENT", "ar") == "SEGMENT"
+    assert stage_key("TRANSLATE", "ar") == "TRANSLATE:ar"
+    assert split_key("TRANSLATE:ar") == ("TRANSLATE", "ar")
+    assert split_key("SEGMENT") == ("SEGMENT", None)
+
+class FakeDB:
+    def __init__(self, langs):
+        self.job = SimpleNamespace(job_id="j", target_lang=langs[0], target_langs=langs)
+
+    def get(self, model, job_id):
+        return self.job
+
+@pytest.fixture
+def checkpoints(monkeypatch):
+    # completed_stages / clear / reset over an in-memory set of checkpoint keys.
+    state = {"done": set(), "cleared": [], "reset": []}
+    monkeypatch.setattr(pipeline, "completed_stages", lambda db, job_id: {k: {} for k in state["done"]})
+
+    def clear(db, job_id, stage, lang=None):
+        state["cleared"].append((stage, lang))
+        later = set(pipeline.STAGES[pipeline.STAGES.index(stage):])
+        state["done"] = {k for k in state["done"] if not (split_key(k)[0] in later and (lang is None or split_key(k)[1] in (None, lang)))}
+
+    def reset(db, job_id, stage, lang=None):
+        state["reset"].append((stage, lang))
+        clear(db, job_id, stage, lang)
+
+    monkeypatch.setattr(pipeline, "clear_checkpoints_from", clear)
+    monkeypatch.setattr(pipeline, "reset_from", reset)
+    return state
+
+def all_done(langs):
+    return set(SHARED_STAGES) | {stage_key(st, l) for st in LANG_STAGES for l in langs}
+
+def test_fresh_job_runs_everything(checkpoints):
+    shared, per_lang = pending_stages(FakeDB(["fa", "ar"]), "j")
+    assert shared == SHARED_STAGES
+    assert per_lang == {"fa": LANG_STAGES, "ar": LANG_STAGES}
+
+def test_resumes_each_language_from_its_first_missing_stage(checkpoints):
+    checkpoints["done"] = all_done(["fa", "ar"]) - {"QA:fa", "FINALIZE:fa", "LIBRARIAN:fa", "LIBRARIAN:ar"}
+    shared, per_lang = pending_stages(FakeDB(["fa", "ar"]), "j")
+    assert shared == []
+    assert per_lang == {"fa": ["QA", "FINALIZE", "LIBRARIAN"], "ar": ["LIBRARIAN"]}
+    assert ("QA", "fa") in checkpoints["cleared"]
+
+def test_missing_shared_stage_reruns_all_later_work(checkpoints):
+    checkpoints["done"] = all_done(["fa"]) - {"STRATEGY"}
+    shared, per_lang = pending_stages(FakeDB(["fa"]), "j")
+    assert shared == ["STRATEGY"]
+    assert per_lang == {"fa": LANG_STAGES}
+    assert not any(k.startswith("TRANSLATE") for k in checkpoints["done"])
+
+def test_restart_from_one_language(checkpoints):
+    checkpoints["done"] = all_done(["fa", "ar"])
+    shared, per_lang = pending_stages(FakeDB(["fa", "ar"]), "j", restart_from="TRANSLATE:ar")
+    assert checkpoints["reset"] == [("TRANSLATE", "ar")]
+    assert shared == [] and per_lang == {"ar": ["TRANSLATE", "QA", "FINALIZE", "LIBRARIAN"]}
+
+def test_done_job_has_nothing_pending(checkpoints):
+    checkpoints["done"] = all_done(["fa"])
+    assert pending_stages(FakeDB(["fa"]), "j") == ([], {})
+
+class FakeSession(FakeDB):
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+def test_language_stages_never_write_job_status(checkpoints, monkeypatch):
+    # Languages run on their own threads; if each wrote Job.status the last writer would win.
+    statuses, events = [], []
+    db = FakeSession(["fa", "ar"])
+    monkeypatch.setattr(pipeline, "set_status", lambda db, job, status, error=None: statuses.append(status))
+    monkeypatch.setattr(pipeline, "publish", lambda job_id, ev: events.append(ev))
+    monkeypatch.setattr(pipeline, "dispatch_stage", lambda db, job, stage, lang: {})
+    monkeypatch.setattr(pipeline, "mark_done", lambda db, job_id, key, arts: checkpoints["done"].add(key))
+    monkeypatch.setattr(pipeline, "SessionLocal", lambda: db)
+    checkpoints["done"] = set(SHARED_STAGES) - {"STRATEGY"}
+    pipeline.run_job_stages(db, db.job)
+    assert statuses == ["STRATEGY", pipeline.LANG_STATUS]
+    assert sorted((e["lang"], e["stage"]) for e in events if e["type"] == "stage") == sorted((l, st) for l in ["fa", "ar"] for st in LANG_STAGES)
+    assert checkpoints["done"] == all_done(["fa", "ar"])
@@ -0,0 +1,21 @@
+from app.config import settings
+from app.pipeline import dedupe_cues
+
+def test_repeated_lines_grouped_under_first_occurrence(make_cue):
+    # Case and whitespace are normalized; punctuation is not (it can change the translation).
+    cues = [make_cue(1, "Thank you."), make_cue(2, "Next slide"), make_cue(3, " thank  YOU."), make_cue(4, "Thank you!")]
+    groups = dedupe_cues(cues)
+    assert {k: [c.cue_id for c in g] for k, g in groups.items()} == {"c1": ["c1", "c3"], "c2": ["c2"], "c4": ["c4"]}
+    assert sum(len(g) for g in groups.values()) == len(cues)
+
+def test_dedupe_disabled(monkeypatch, make_cue):
+    monkeypatch.setattr(settings, "translation_dedupe", False)
+    cues = [make_cue(1, "Yes."), make_cue(2, "Yes.")]
+    assert list(dedupe_cues(cues)) == ["c1", "c2"]
+
+def test_excluded_lines_translated_per_occurrence(monkeypatch, make_cue):
+    monkeypatch.setattr(settings, "translation_dedupe_exclude_regex", r"^(right|okay)$")
+    cues = [make_cue(1, "Right"), make_cue(2, "Right"), make_cue(3, "Good point"), make_cue(4, "Good point")]
+    groups = dedupe_cues(cues)
+    assert list(groups) == ["c1", "c2", "c3"]
+    assert [c.cue_id for c in groups["c3"]] == ["c3", "c4"]
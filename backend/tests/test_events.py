@@ -0,0 +1,64 @@
+import asyncio, json
+from app import main
+
+class FakeSub:
+    def __init__(self, events):
+        self.events = list(events)
+        self.closed = False
+
+    async def open(self):
+        pass
+
+    async def next(self):
+        return self.events.pop(0) if self.events else None
+
+    async def close(self):
+        self.closed = True
+
+class FakeRequest:
+    def __init__(self, disconnect_after=100):
+        self.polls = disconnect_after
+
+    async def is_disconnected(self):
+        self.polls -= 1
+        return self.polls < 0
+
+def run(monkeypatch, statuses, events, request=None):
+    sub = FakeSub(events)
+    monkeypatch.setattr(main, "JobEvents", lambda ids: sub)
+    monkeypatch.setattr(main, "load_summaries", lambda ids: {j: {"status": statuses[j]} for j in ids if j in statuses})
+
+    async def collect():
+        out = []
+        async for chunk in main.event_stream(request or FakeRequest(), list(statuses)):
+            if chunk.startswith("event:"):
+                out.append(json.loads(chunk.split("data: ", 1)[1]))
+        return out
+
+    return asyncio.run(collect()), sub
+
+def test_stream_ends_with_failed_status(monkeypatch):
+    events = [{"job_id": "a", "type": "stage_done", "stage": "asr"},
+              {"job_id": "a", "type": "status", "status": "FAILED", "error": "boom"},
+              {"job_id": "a", "type": "progress"}]
+    out, sub = run(monkeypatch, {"a": "RUNNING"}, events)
+    assert [e["type"] for e in out] == ["snapshot", "stage_done", "status", "end"]
+    assert out[-1] == {"type": "end", "job_id": "a", "status": "FAILED"}
+    assert sub.closed
+
+def test_terminal_job_ends_right_after_snapshot(monkeypatch):
+    out, _ = run(monkeypatch, {"a": "DONE"}, [{"job_id": "a", "type": "progress"}])
+    assert [e["type"] for e in out] == ["snapshot", "end"]
+
+def test_multi_job_stream_waits_for_every_job(monkeypatch):
+    events = [{"job_id": "a", "type": "status", "status": "DONE"},
+              {"job_id": "b", "type": "status", "status": "TRANSLATING"},
+              {"job_id": "b", "type": "status", "status": "FAILED"}]
+    out, _ = run(monkeypatch, {"a": "RUNNING", "b": "RUNNING"}, events)
+    assert [(e["job_id"], e["status"]) for e in out if e["type"] == "end"] == [("a", "DONE"), ("b", "FAILED")]
+    assert out[-1]["type"] == "end"
+
+def test_client_disconnect_stops_the_stream(monkeypatch):
+    out, sub = run(monkeypatch, {"a": "RUNNING"}, [], FakeRequest(disconnect_after=3))
+    assert [e["type"] for e in out] == ["snapshot"]
+    assert sub.closed
@@ -0,0 +1,89 @@
+import httpx
+import pytest
+from app import agents, llm_router
+from app.llm_router import TruncatedOutput, call_with_fallbacks, is_json, json_unterminated
+
+class FakeChat:
+    def __init__(self, replies):
+        self.replies = replies  # model -> (content, finish_reason)
+        self.calls = []
+
+    def chat(self, model, messages, temperature, max_tokens):
+        self.calls.append(model)
+        content, finish = self.replies[model]
+        return {"choices": [{"message": {"content": content}, "finish_reason": finish}], "usage": {}}
+
+@pytest.fixture
+def runs(monkeypatch):
+    rows = []
+    monkeypatch.setattr(llm_router.settings, "llm_hedge_enabled", False)
+    monkeypatch.setattr(llm_router, "cache_enabled", lambda *a: False)
+    monkeypatch.setattr(llm_router.recorder, "record", rows.append)
+    monkeypatch.setattr(llm_router, "observe_llm", lambda *a: None)
+    monkeypatch.setattr(llm_router.breaker, "available", lambda chain: list(chain))
+    monkeypatch.setattr(llm_router.breaker, "record_success", lambda m: None)
+    monkeypatch.setattr(llm_router.breaker, "record_failure", lambda m, *a, **kw: None)
+    return rows
+
+def call(monkeypatch, replies):
+    fake = FakeChat(replies)
+    monkeypatch.setattr(llm_router, "client", fake)
+    content = call_with_fallbacks(None, None, None, "translator", "a", ["b"], [{"role": "user", "content": "x"}],
+                                  validate=is_json)
+    return content, fake.calls
+
+def test_prose_reply_moves_on_to_the_fallback_model(monkeypatch, runs):
+    content, calls = call(monkeypatch, {"a": ("Sure! Here are the translations:", "stop"), "b": ('{"c1": "x"}', "stop")})
+    assert (content, calls) == ('{"c1": "x"}', ["a", "b"])
+    assert [a["status"] for a in runs[0]["attempts"]] == ["invalid", "success"]
+    assert runs[0]["status"] == "success" and runs[0]["model"] == "b"
+
+def test_fenced_json_is_accepted(monkeypatch, runs):
+    content, calls = call(monkeypatch, {"a": ('```json\n{"c1": "x"}\n```', "stop"), "b": ("{}", "stop")})
+    assert calls == ["a"]
+    assert llm_router.parse_json(content) == {"c1": "x"}
+
+def test_unterminated_json_is_truncation_even_without_finish_reason(monkeypatch, runs):
+    with pytest.raises(TruncatedOutput):
+        call(monkeypatch, {"a": ('{"c1": "x", "c2": "y', None), "b": ("{}", "stop")})
+    assert runs[0]["status"] == "truncated"
+
+def test_every_model_invalid_fails_without_splitting(monkeypatch, runs):
+    fake = FakeChat({"a": ("no", "stop"), "b": ("still no", "stop")})
+    monkeypatch.setattr(llm_router, "client", fake)
+    monkeypatch.setattr(agents, "translator_models", lambda difficulty: ("a", ["b"]))
+    cues = [{"cue_id": f"c{i}", "en_text": "hello"} for i in range(8)]
+    with pytest.raises(RuntimeError, match="All models failed"):
+        agents.translate_adaptive(None, "job", 5, [], cues)
+    assert fake.calls == ["a", "b"]
+
+@pytest.mark.parametrize("content, expected", [
+    ('{"a": "b"', True), ('{"a": "b}', True), ('```json\n[{"a": 1}', True), ('{"a": "}"}', False),
+    ('{"a": "b"} trailing prose', False), ("I cannot help with that.", False), ('{"a": "say \\"hi"}', False),
+])
+def test_json_unterminated(content, expected):
+    assert json_unterminated(content) is expected
+
+def status_error(code):
+    request = httpx.Request("POST", "http://x/chat/completions")
+    return httpx.HTTPStatusError(str(code), request=request, response=httpx.Response(code, request=request))
+
+@pytest.mark.parametrize("err, counted", [
+    (status_error(400), False), (status_error(422), False), (status_error(401), False),
+    (status_error(429), True), (status_error(502), True), (status_error(408), True),
+    (httpx.ReadTimeout("slow"), True), (httpx.ConnectError("refused"), True),
+    (httpx.LocalProtocolError("bad header"), False), (RuntimeError("empty response"), False),
+])
+def test_only_provider_faults_trip_the_breaker(monkeypatch, runs, err, counted):
+    failed = []
+    monkeypatch.setattr(llm_router.breaker, "record_failure", failed.append)
+
+    class Failing:
+        def chat(self, model, *a, **kw):
+            if model == "a":
+                raise err
+            return {"choices": [{"message": {"content": "{}"}, "finish_reason": "stop"}], "usage": {}}
+
+    monkeypatch.setattr(llm_router, "client", Failing())
+    call_with_fallbacks(None, None, None, "translator", "a", ["b"], [{"role": "user", "content": "x"}])
+    assert failed == (["a"] if counted else [])
@@ -0,0 +1,41 @@
+import pytest
+from app.glossary import GlossaryMatcher, tokens
+
+@pytest.mark.parametrize("singular,plural", [
+    ("bus", "buses"), ("box", "boxes"), ("policy", "policies"), ("house", "houses"), ("movie", "movies"),
+    ("class", "classes"), ("cache", "caches"), ("key", "keys"), ("status", "statuses"), ("API", "APIs"), ("API", "API's"),
+    ("alias", "aliases"), ("canvas", "canvases"), ("database", "databases"), ("idea", "ideas"), ("case", "cases"),
+])
+def test_plurals_fold_to_the_singular(singular, plural):
+    assert tokens(singular) == tokens(plural)
+
+def test_mandatory_singular_term_found_in_plural_cue():
+    m = GlossaryMatcher([{"en_term": "alias", "fa_term": "نام مستعار", "mandatory": True}])
+    assert [t["en_term"] for t in m.terms_in(["Both aliases point here."])] == ["alias"]
+
+def test_different_words_stay_apart():
+    assert tokens("bus") != tokens("box")
+    assert tokens("class") != tokens("glass")
+
+def test_multi_word_terms_match_in_any_case_and_number():
+    m = GlossaryMatcher([
+        {"en_term": "load balancer", "fa_term": "متعادل‌کننده بار"},
+        {"en_term": "bus", "fa_term": "گذرگاه"},
+        {"en_term": "API", "fa_term": "API"},
+    ])
+    found = m.terms_in(["Two Load Balancers sit in front of the APIs.", "All buses are full."])
+    assert [t["en_term"] for t in found] == ["load balancer", "bus", "API"]
+    assert m.terms_in(["nothing relevant here"]) == []
+
+def test_missing_mandatory_ignores_case_for_latin_targets():
+    m = GlossaryMatcher([{"en_term": "Kubernetes", "fa_term": "Kubernetes", "mandatory": True}])
+    assert m.missing_mandatory("We deploy on Kubernetes.", "Wir deployen auf kubernetes.") == []
+    assert m.missing_mandatory("We deploy on Kubernetes.", "Wir deployen auf einem Cluster.") == ["Kubernetes"]
+
+def test_missing_mandatory_folds_persian_variants_and_skips_optional():
+    m = GlossaryMatcher([
+        {"en_term": "server", "fa_term": "سرور", "mandatory": True},
+        {"en_term": "cache", "fa_term": "حافظه نهان", "mandatory": False},
+    ])
+    assert m.missing_mandatory("The server cache.", "سرور را ببين") == []
+    assert m.missing_mandatory("The server cache.", "ماشین") == ["server"]
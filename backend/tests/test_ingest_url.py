@@ -0,0 +1,83 @@
+import socket
+import httpx
+import pytest
+from app import storage
+
+ADDRS = {"public.test": "93.184.216.34", "cdn.public.test": "93.184.216.35", "intranet.test": "10.0.0.5",
+         "meta.test": "169.254.169.254", "local.test": "127.0.0.1", "mapped.test": "::ffff:192.168.1.1"}
+
+@pytest.fixture(autouse=True)
+def dns(monkeypatch, tmp_path):
+    def getaddrinfo(host, port, *args, **kw):
+        if host not in ADDRS:
+            raise socket.gaierror("unknown host")
+        family = socket.AF_INET6 if ":" in ADDRS[host] else socket.AF_INET
+        return [(family, socket.SOCK_STREAM, 6, "", (ADDRS[host], port))]
+
+    monkeypatch.setattr(storage.socket, "getaddrinfo", getaddrinfo)
+    monkeypatch.setattr(storage, "BASE", tmp_path)
+    monkeypatch.setattr(storage.settings, "ingest_url_allowed_hosts", "")
+
+def test_public_host_is_accepted():
+    storage.check_ingest_url("https://public.test/episode.mp3")
+
+@pytest.mark.parametrize("url", ["http://intranet.test/a", "http://meta.test/latest/meta-data", "http://local.test:8000/",
+                                 "http://mapped.test/", "http://127.0.0.1/", "http://[::1]/", "ftp://public.test/a",
+                                 "file:///etc/passwd", "http://nowhere.test/"])
+def test_non_public_or_unsupported_urls_are_rejected(url):
+    with pytest.raises(ValueError):
+        storage.check_ingest_url(url)
+
+def test_allowlist(monkeypatch):
+    monkeypatch.setattr(storage.settings, "ingest_url_allowed_hosts", "*.public.test")
+    storage.check_ingest_url("https://cdn.public.test/a.mp3")
+    with pytest.raises(ValueError, match="INGEST_URL_ALLOWED_HOSTS"):
+        storage.check_ingest_url("https://public.test/a.mp3")
+
+def mock_client(monkeypatch, handler):
+    real = httpx.Client
+    monkeypatch.setattr(storage.httpx, "Client", lambda **kw: real(transport=httpx.MockTransport(handler), **kw))
+
+def test_download_follows_public_redirects(monkeypatch):
+    def handler(request):
+        if request.headers["host"] == "public.test":
+            return httpx.Response(302, headers={"Location": "https://cdn.public.test/files/ep1.mp3"})
+        return httpx.Response(200, content=b"audio")
+
+    mock_client(monkeypatch, handler)
+    path, digest = storage.download_url("job1", "https://public.test/ep1")
+    assert path.endswith("job1__ep1.mp3")
+    assert open(path, "rb").read() == b"audio"
+
+def test_download_rejects_redirect_to_private_address(monkeypatch):
+    seen = []
+
+    def handler(request):
+        seen.append(request.headers["host"])
+        return httpx.Response(302, headers={"Location": "http://meta.test/latest/meta-data"})
+
+    mock_client(monkeypatch, handler)
+    with pytest.raises(ValueError, match="non-public"):
+        storage.download_url("job1", "https://public.test/ep1")
+    assert seen == ["public.test"]
+
+def test_download_stops_after_max_redirects(monkeypatch):
+    monkeypatch.setattr(storage.settings, "ingest_url_max_redirects", 2)
+    mock_client(monkeypatch, lambda request: httpx.Response(302, headers={"Location": "/again"}))
+    with pytest.raises(ValueError, match="redirects"):
+        storage.download_url("job1", "https://public.test/ep1")
+
+def test_connection_is_pinned_to_the_checked_address(monkeypatch):
+    # DNS rebinding: a second lookup would say 127.0.0.1, but the request goes to the address that was checked.
+    answers = iter(["93.184.216.34", "127.0.0.1"])
+    monkeypatch.setattr(storage.socket, "getaddrinfo",
+                        lambda host, port, *a, **kw: [(socket.AF_INET, socket.SOCK_STREAM, 6, "", (next(answers), port))])
+    seen = []
+
+    def handler(request):
+        seen.append((request.url.host, request.url.port, request.headers["host"], request.extensions.get("sni_hostname")))
+        return httpx.Response(200, content=b"audio")
+
+    mock_client(monkeypatch, handler)
+    storage.download_url("job1", "https://rebind.test:8443/ep1.mp3")
+    assert seen == [("93.184.216.34", 8443, "rebind.test:8443", "rebind.test")]
@@ -0,0 +1,136 @@
+import asyncio, time
+from email.utils import format_datetime
+from datetime import datetime, timedelta, timezone
+import httpx
+import pytest
+from app import llm_router
+from app.config import settings
+from app.llm_router import AsyncOpenRouterClient, retry_after_s
+
+def response(headers):
+    return httpx.Response(429, headers=headers, request=httpx.Request("POST", "http://x/chat/completions"))
+
+def test_retry_after_seconds_and_http_date():
+    assert retry_after_s(response({"retry-after": "3"})) == 3.0
+    when = datetime.now(timezone.utc) + timedelta(seconds=30)
+    assert 25 < retry_after_s(response({"retry-after": format_datetime(when, usegmt=True)})) <= 30
+
+def test_retry_after_falls_back_to_ratelimit_reset():
+    epoch_ms = (time.time() + 10) * 1000
+    assert 8 < retry_after_s(response({"x-ratelimit-reset": str(epoch_ms)})) <= 10
+    assert retry_after_s(response({"x-ratelimit-reset": "4"})) == 4.0
+    assert retry_after_s(response({})) is None
+    assert retry_after_s(response({"retry-after": "soon"})) is None
+
+def client_with(handler, key="test-key") -> AsyncOpenRouterClient:
+    c = AsyncOpenRouterClient()
+    c.key = key
+    c._init()
+    c._http = httpx.AsyncClient(base_url="http://fake", transport=httpx.MockTransport(handler), headers={"Authorization": f"Bearer {key}"})
+    return c
+
+@pytest.fixture
+def no_sleep(monkeypatch):
+    slept = []
+
+    async def sleep(s):
+        slept.append(s)
+
+    monkeypatch.setattr(llm_router.asyncio, "sleep", sleep)
+    monkeypatch.setattr(settings, "llm_max_attempts", 3)
+    return slept
+
+def test_missing_key_fails_fast(no_sleep):
+    calls = []
+    c = client_with(lambda req: calls.append(req) or httpx.Response(200, json={}), key="")
+    with pytest.raises(RuntimeError, match="OPENROUTER_API_KEY"):
+        asyncio.run(c._post("/chat/completions", "m", {}))
+    assert calls == [] and no_sleep == []
+
+def test_local_protocol_error_is_not_retried(no_sleep):
+    calls = []
+
+    def handler(req):
+        calls.append(req)
+        raise httpx.LocalProtocolError("Illegal header value")
+
+    with pytest.raises(httpx.LocalProtocolError):
+        asyncio.run(client_with(handler)._post("/chat/completions", "m", {}))
+    assert len(calls) == 1 and no_sleep == []
+
+def test_retries_honour_retry_after_without_sleeping_after_the_last_attempt(no_sleep):
+    calls = []
+
+    def handler(req):
+        calls.append(req)
+        return httpx.Response(503, headers={"retry-after": "2"}, text="busy")
+
+    with pytest.raises(httpx.HTTPStatusError):
+        asyncio.run(client_with(handler)._post("/chat/completions", "m", {}))
+    assert len(calls) == 3
+    assert no_sleep == [2.0, 2.0]
+
+def test_success_after_a_429(no_sleep):
+    replies = [httpx.Response(429, headers={"retry-after": "1"}), httpx.Response(200, json={"ok": True})]
+    c = client_with(lambda req: replies.pop(0))
+    assert asyncio.run(c._post("/chat/completions", "m", {})) == {"ok": True}
+    assert no_sleep and no_sleep[-1] == pytest.approx(1.0, abs=0.1)
+
+class FakeEmbedClient:
+    def __init__(self, fail=False):
+        self.fail = fail
+
+    def embed(self, model, inputs, dimensions=None):
+        if self.fail:
+            raise RuntimeError("502 from provider")
+        return [[0.0] * 3 for _ in inputs], {"prompt_tokens": 12, "cost": 0.0000024}
+
+@pytest.fixture
+def recorded(monkeypatch):
+    rows = []
+    monkeypatch.setattr(llm_router.recorder, "record", rows.append)
+    monkeypatch.setattr(llm_router, "observe_llm", lambda *a: None)
+    return rows
+
+def test_embedding_calls_are_recorded_with_cost(monkeypatch, recorded):
+    from app.telemetry import _current, Span
+    monkeypatch.setattr(llm_router, "client", FakeEmbedClient())
+    token = _current.set(Span("job-1", "tm_gate:fa", "stage"))
+    try:
+        embs = llm_router.embed_recorded("openai/text-embedding-3-large", ["a", "b"], dimensions=3)
+    finally:
+        _current.reset(token)
+    assert len(embs) == 2
+    [run] = recorded
+    assert (run["job_id"], run["agent_name"], run["status"]) == ("job-1", "embedding", "success")
+    assert (run["prompt_tokens"], run["cost_usd"]) == (12, 0.0000024)
+    assert run["meta"] == {"texts": 2, "stage": "tm_gate:fa"}
+
+def test_failed_embedding_call_is_recorded(monkeypatch, recorded):
+    monkeypatch.setattr(llm_router, "client", FakeEmbedClient(fail=True))
+    with pytest.raises(RuntimeError):
+        llm_router.embed_recorded("openai/text-embedding-3-large", ["a"])
+    [run] = recorded
+    assert (run["job_id"], run["status"], run["cost_usd"]) == (None, "error", None)
+    assert "502" in run["error_message"]
+
+def test_embed_returns_usage():
+    def handler(request):
+        return httpx.Response(200, json={"data": [{"embedding": [1.0, 0.0]}], "usage": {"prompt_tokens": 3, "cost": 1e-7}})
+
+    c = client_with(handler)
+    embs, usage = asyncio.run(c.embed("m", ["hi"]))
+    assert embs == [[1.0, 0.0]]
+    assert usage["cost"] == 1e-7
+
+def test_hedge_delay_is_tracked_per_agent(monkeypatch):
+    monkeypatch.setattr(llm_router, "_latencies", {})
+    monkeypatch.setattr(settings, "llm_hedge_min_samples", 5)
+    monkeypatch.setattr(settings, "llm_hedge_percentile", 0.9)
+    monkeypatch.setattr(settings, "llm_hedge_default_delay_s", 30.0)
+    for i in range(10):
+        llm_router.record_latency("m", "tm_judge", 1.0 + i / 10)
+        llm_router.record_latency("m", "translator", 20.0 + i)
+    assert llm_router.hedge_delay("m", "tm_judge") == 1.9
+    assert llm_router.hedge_delay("m", "translator") == 29.0
+    assert llm_router.hedge_delay("m", "qa_polisher") == 30.0
@@ -0,0 +1,52 @@
+import pytest
+from app import agents
+from app.config import settings
+from app.llm_router import TruncatedOutput
+from app.pipeline import qa_shards
+
+def test_qa_shards_own_each_cue_once_with_context_neighbours(cues):
+    shards = qa_shards(cues, size=4, overlap=2)
+    assert [sh["core_ids"] for sh in shards] == [["c1", "c2", "c3", "c4"], ["c5", "c6", "c7", "c8"], ["c9", "c10"]]
+    middle = shards[1]["cues"]
+    assert [c["cue_id"] for c in middle] == ["c3", "c4", "c5", "c6", "c7", "c8", "c9", "c10"]
+    assert [c["cue_id"] for c in middle if c.get("context_only")] == ["c3", "c4", "c9", "c10"]
+    assert set(shards[1]["translations"]) == {c["cue_id"] for c in middle}
+
+def test_qa_shards_degenerate_sizes(cues):
+    assert qa_shards([], 40, 3) == []
+    assert len(qa_shards(cues, 0, -1)) == len(cues)
+
+def test_qa_output_budget_scales_with_shard_and_ignores_context():
+    uuid = "0b4c1f7e-5d2a-4c1e-9a57-3f1b2c4d5e6f"
+    shard = [{"cue_id": f"{uuid}{i}", "en_text": "We moved the index to the new server last week."} for i in range(40)]
+    budget = agents.qa_output_budget(shard)
+    assert budget > 2600  # the old fixed cap truncated full shards
+    assert budget <= settings.qa_max_output_tokens
+    with_context = shard + [{"cue_id": "x", "en_text": "context " * 50, "context_only": True}]
+    assert agents.qa_output_budget(with_context) == budget
+    assert agents.qa_output_budget(shard[:10]) < budget
+
+def test_qa_adaptive_splits_truncated_shards(monkeypatch):
+    calls = []
+
+    def fake_polisher(db, job_id, difficulty, glossary, cues, translations, lang="fa"):
+        core = [c["cue_id"] for c in cues if not c.get("context_only")]
+        calls.append(core)
+        if len(core) > 3:
+            raise TruncatedOutput("too long")
+        return {"polished": {i: translations[i] + "!" for i in core}, "qa_scores": {i: 90 for i in core}, "issues": {}}
+
+    monkeypatch.setattr(agents, "qa_polisher", fake_polisher)
+    cues = [{"cue_id": f"c{i}", "en_text": "x"} for i in range(10)]
+    out = agents.qa_adaptive(None, "job", 5, [], cues, {c["cue_id"]: c["cue_id"] for c in cues})
+    assert sorted(out["polished"]) == sorted(c["cue_id"] for c in cues)
+    assert out["polished"]["c7"] == "c7!"
+    assert [len(core) for core in calls] == [10, 5, 2, 3, 5, 2, 3]
+
+def test_qa_adaptive_gives_up_on_a_single_cue(monkeypatch):
+    def always_truncated(*a, **kw):
+        raise TruncatedOutput("too long")
+
+    monkeypatch.setattr(agents, "qa_polisher", always_truncated)
+    with pytest.raises(TruncatedOutput):
+        agents.qa_adaptive(None, "job", 5, [], [{"cue_id": "c1", "en_text": "x"}], {"c1": "y"})
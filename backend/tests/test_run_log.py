@@ -0,0 +1,103 @@
+import pytest
+from sqlalchemy.exc import IntegrityError, OperationalError
+from app import run_log
+
+class FakeInsert:
+    def __init__(self, db):
+        self.db = db
+
+    def values(self, rows):
+        self.rows = rows if isinstance(rows, list) else [rows]
+        return self
+
+    def on_conflict_do_nothing(self):
+        return self
+
+class FakeDB:
+    # Fails the next `outages` statements with `error`, then stores rows.
+    def __init__(self):
+        self.stored, self.outages, self.error = [], 0, None
+
+    def __call__(self):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+    def execute(self, stmt):
+        if self.outages:
+            self.outages -= 1
+            raise self.error
+        self.stored += [r["run_id"] for r in stmt.rows]
+
+    def commit(self):
+        pass
+
+@pytest.fixture
+def db(monkeypatch):
+    db = FakeDB()
+    metrics = db.metrics = {}
+    monkeypatch.setattr(run_log, "SessionLocal", db)
+    monkeypatch.setattr(run_log, "pg_insert", lambda model: FakeInsert(db))
+    monkeypatch.setattr(run_log, "incr", lambda v: [metrics.__setitem__(k, metrics.get(k, 0) + n) for k, n in v.items()])
+    monkeypatch.setattr(run_log.settings, "llm_run_flush_s", 0.0)  # no backoff wait in tests
+    monkeypatch.setattr(run_log.settings, "llm_run_retries", 3)
+    return db
+
+def recorder_with(rows):
+    rec = run_log.RunRecorder()
+    for r in rows:
+        rec._q.put_nowait({"run_id": r})
+    return rec
+
+def lost(reason):
+    return run_log.series("subtitle_llm_runs_dropped_total", reason=reason)
+
+def test_transient_db_error_is_retried_not_dropped(db):
+    db.outages, db.error = 2, OperationalError("INSERT", {}, Exception("server closed the connection"))
+    rec = recorder_with(["a", "b"])
+    for _ in range(3):
+        rec.flush()
+    assert db.stored == ["a", "b"]
+    assert rec.dropped == 0 and not db.metrics
+
+def test_rows_are_dropped_and_counted_once_retries_run_out(db):
+    db.outages, db.error = 100, OperationalError("INSERT", {}, Exception("database is down"))
+    rec = recorder_with(["a", "b"])
+    for _ in range(10):
+        rec.flush()
+    assert db.stored == [] and not rec._retry
+    assert rec.dropped == 2 and db.metrics == {lost("db_unavailable"): 2}
+
+def test_shutdown_makes_a_last_attempt_then_counts_the_rest(db):
+    db.outages, db.error = 1, OperationalError("INSERT", {}, Exception("timeout"))
+    rec = recorder_with(["a"])
+    rec.flush()
+    rec.close()
+    assert db.stored == ["a"] and rec.dropped == 0
+    db.outages = 2
+    rec._q.put_nowait({"run_id": "b"})
+    rec.close()
+    assert db.metrics == {lost("shutdown"): 1}
+
+def test_integrity_error_falls_back_to_row_by_row(db):
+    db.outages, db.error = 2, IntegrityError("INSERT", {}, Exception("fk violation"))
+    rec = recorder_with(["a", "b", "c"])
+    rec.flush()
+    assert db.stored == ["b", "c"] and db.metrics == {lost("rejected"): 1}
+    assert not rec._retry
+
+def test_held_rows_are_bounded_by_the_queue_size(db, monkeypatch):
+    monkeypatch.setattr(run_log.settings, "llm_run_queue_max", 3)
+    db.outages, db.error = 100, OperationalError("INSERT", {}, Exception("down"))
+    rec = recorder_with(["a", "b"])
+    rec.flush()
+    rec._q.put_nowait({"run_id": "c"})
+    rec._q.put_nowait({"run_id": "d"})
+    rec._retry[0] = (float("inf"),) + rec._retry[0][1:]  # first batch still backing off
+    rec.flush()
+    assert sum(len(b) for _, _, b in rec._retry) == 2
+    assert db.metrics == {lost("db_unavailable"): 2}
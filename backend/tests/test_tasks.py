@@ -0,0 +1,87 @@
+from types import SimpleNamespace
+import pytest
+from app import tasks
+from app.worker import celery_app
+
+class FakeSession:
+    def __init__(self, job):
+        self.job = job
+
+    def get(self, model, job_id):
+        return self.job if job_id == self.job.job_id else None
+
+    def close(self):
+        pass
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *a):
+        return False
+
+@pytest.fixture
+def job(monkeypatch):
+    job = SimpleNamespace(job_id="j1", status="LANGUAGES", error=None, difficulty_score=5)
+
+    def set_status(db, j, status, error=None):
+        j.status, j.error = status, error
+
+    monkeypatch.setattr(tasks, "SessionLocal", lambda: FakeSession(job))
+    monkeypatch.setattr(tasks, "set_status", set_status)
+    monkeypatch.setattr(tasks, "mark_failed", lambda db, j, error: set_status(db, j, "FAILED", error))
+    monkeypatch.setattr(celery_app.conf, "task_always_eager", True)
+    return job
+
+def test_unit_that_exhausts_retries_fails_the_job(job, monkeypatch):
+    calls = []
+
+    def boom(db, job_id, difficulty, unit):
+        calls.append(unit)
+        raise ValueError("provider down")
+
+    monkeypatch.setattr(tasks, "translate_unit", boom)
+    res = tasks.translate_unit_task.apply(args=("j1", {"lang": "fa", "cues": []}))
+    assert res.failed()
+    assert len(calls) == tasks.RETRY["max_retries"] + 1
+    assert job.status == "FAILED"
+    assert "translate_unit failed: ValueError: provider down" in job.error
+
+def test_stage_failure_fails_the_job(job, monkeypatch):
+    def boom(db, j, stage, lang=None):
+        raise RuntimeError("ASR exploded")
+
+    monkeypatch.setattr(tasks, "run_stage", boom)
+    monkeypatch.setitem(tasks.pipeline_stage.__dict__, "max_retries", 0)
+    assert tasks.pipeline_stage.apply(args=("j1", "ASR")).failed()
+    assert job.status == "FAILED" and "ASR exploded" in job.error
+
+def test_failed_job_is_not_overwritten_by_queued_work(job, monkeypatch):
+    job.status = "FAILED"
+    monkeypatch.setattr(tasks, "run_stage", lambda *a: pytest.fail("stage ran for a failed job"))
+    monkeypatch.setattr(tasks, "translate_unit", lambda *a: pytest.fail("unit ran for a failed job"))
+    assert tasks.pipeline_stage.apply(args=("j1", "SEGMENT")).get() == "skipped"
+    assert tasks.translate_unit_task.apply(args=("j1", {"lang": "fa"})).get() == 0
+    assert tasks.finish_job.apply(args=("j1",)).get() == "skipped"
+    assert job.status == "FAILED"
+
+def test_finish_job_marks_done(job):
+    assert tasks.finish_job.apply(args=("j1",)).get() == "ok"
+    assert job.status == "DONE"
+
+def test_on_failure_without_job_id_is_ignored(job):
+    tasks.finish_job.on_failure(RuntimeError("x"), "tid", (), {}, None)
+    assert job.status == "LANGUAGES"
+
+def test_fanout_language_stage_leaves_job_status_alone(job, monkeypatch):
+    events = []
+    monkeypatch.setattr(tasks, "enter_stage", lambda db, j, stage, lang: events.append((stage, lang)))
+    monkeypatch.setitem(tasks.FANOUT, "TRANSLATE", (lambda db, j, lang: [], "translate_unit", lambda db, j, lang: {}))
+    monkeypatch.setattr(tasks, "mark_done", lambda db, job_id, key, arts: None)
+    assert tasks.pipeline_stage.apply(args=("j1", "TRANSLATE:fa")).get() == "ok"
+    assert events == [("TRANSLATE", "fa")]
+    assert job.status == "LANGUAGES"
+
+def test_start_languages_sets_the_shared_status(job):
+    job.status = "STRATEGY"
+    assert tasks.start_languages.apply(args=("j1",)).get() == "ok"
+    assert job.status == tasks.LANG_STATUS
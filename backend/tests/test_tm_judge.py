@@ -0,0 +1,48 @@
+import json
+import pytest
+from app import tm
+from app.llm_router import TruncatedOutput
+
+class NoSession:
+    def __enter__(self):
+        return None
+
+    def __exit__(self, *a):
+        return False
+
+@pytest.fixture
+def judge(monkeypatch):
+    # Answers like the model would, but "runs out of tokens" for more than `limit` pairs.
+    state = {"limit": 4, "calls": []}
+
+    def fake_call(db, job_id, cue_id, agent_name, primary_model, fallback_models, messages, temperature, max_tokens, meta, validate):
+        items = json.loads(messages[-1]["content"].partition("Pairs JSON:\n")[2])
+        state["calls"].append(len(items))
+        assert max_tokens >= 100 + 80 * len(items)
+        if len(items) > state["limit"]:
+            raise TruncatedOutput("hit max_tokens")
+        return json.dumps({i["id"]: {"reuse": i["english"].startswith("same"), "reason": "ok"} for i in items})
+
+    monkeypatch.setattr(tm, "call_with_fallbacks", fake_call)
+    monkeypatch.setattr(tm, "SessionLocal", NoSession)
+    return state
+
+def pairs(n):
+    return [{"id": f"cue{i}", "en_text": ("same " if i % 2 else "other ") + str(i), "fa_text": "x", "tm_entry_id": f"t{i}"} for i in range(n)]
+
+def test_truncated_batches_are_split_not_dropped(judge):
+    out = tm._judge_adaptive("job", "fa", pairs(10))
+    assert sorted(out) == sorted(f"cue{i}" for i in range(10))
+    assert out["cue3"]["reuse"] is True and out["cue4"]["reuse"] is False
+    assert judge["calls"] == [10, 5, 2, 3, 5, 2, 3]
+
+def test_single_pair_that_still_truncates_raises(judge):
+    judge["limit"] = 0
+    with pytest.raises(TruncatedOutput):
+        tm._judge_adaptive("job", "fa", pairs(1))
+
+def test_invalid_json_counts_as_truncation(monkeypatch):
+    monkeypatch.setattr(tm, "call_with_fallbacks", lambda *a, **kw: '{"p1": {"reuse": tr')
+    monkeypatch.setattr(tm, "SessionLocal", NoSession)
+    with pytest.raises(TruncatedOutput):
+        tm._judge_batch("job", "fa", pairs(1))
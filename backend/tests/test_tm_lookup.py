@@ -0,0 +1,51 @@
+from types import SimpleNamespace
+import pytest
+from app import tm
+
+class FakeDB:
+    def __init__(self, pgvector="0.8.0"):
+        self.sql = []
+        self.pgvector = pgvector
+
+    def connection(self):
+        return self
+
+    def execute(self, stmt, params=None):
+        self.sql.append(str(stmt))
+        return SimpleNamespace(all=lambda: [], scalars=lambda: [], scalar=lambda: self.pgvector)
+
+@pytest.fixture(autouse=True)
+def fresh_version_check(monkeypatch):
+    monkeypatch.setattr(tm, "_iterative_scan", None)
+
+@pytest.mark.parametrize("column, expected", [("vector(3072)", "vector(3072)"), ("halfvec(3072)", "halfvec(3072)"),
+                                              (None, "halfvec(3072)")])
+def test_lookup_casts_to_the_actual_column_type(monkeypatch, column, expected):
+    # An unmigrated vector(3072) column must keep working when TM_VECTOR_TYPE is halfvec.
+    monkeypatch.setattr(tm.settings, "tm_vector_type", "halfvec")
+    monkeypatch.setattr(tm.settings, "embedding_dimensions", 3072)
+    monkeypatch.setattr(tm, "column_type", lambda conn, table, col: column)
+    db = FakeDB()
+    assert tm.tm_topk_batch(db, [[0.1, 0.2]], k=3, lang="fa") == [[]]
+    [query] = [q for q in db.sql if "LATERAL" in q]
+    assert f"CAST(q.emb AS {expected})" in query
+    assert query.count("CAST(q.emb AS") == 2
+
+@pytest.mark.parametrize("pgvector, iterative", [("0.8.0", True), ("0.10.1", True), ("0.7.4", False)])
+def test_minority_language_lookup_scans_past_other_languages(monkeypatch, pgvector, iterative):
+    # With one index over all languages, target_lang is filtered after the HNSW scan: a language holding 1% of the
+    # TM would see ~1 of the ef_search nearest rows. Iterative scans keep going until k rows pass the filter.
+    monkeypatch.setattr(tm, "column_type", lambda conn, table, col: "halfvec(3072)")
+    db = FakeDB(pgvector)
+    tm.tm_topk_batch(db, [[0.1, 0.2]], k=8, lang="ar")
+    sets = [q for q in db.sql if q.startswith("SET LOCAL")]
+    assert ("SET LOCAL hnsw.iterative_scan = relaxed_order" in sets) is iterative
+    lookup = next(i for i, q in enumerate(db.sql) if "LATERAL" in q)
+    assert all(db.sql.index(q) < lookup for q in sets)
+
+def test_iterative_scan_can_be_disabled(monkeypatch):
+    monkeypatch.setattr(tm.settings, "tm_hnsw_iterative_scan", "off")
+    monkeypatch.setattr(tm, "column_type", lambda conn, table, col: "halfvec(3072)")
+    db = FakeDB()
+    tm.tm_topk_batch(db, [[0.1]], k=8, lang="ar")
+    assert not any("iterative_scan" in q for q in db.sql)
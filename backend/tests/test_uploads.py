@@ -0,0 +1,91 @@
+import pytest
+from fastapi.testclient import TestClient
+from app import main, storage
+
+@pytest.fixture
+def client(monkeypatch, tmp_path):
+    monkeypatch.setattr(storage, "BASE", tmp_path)
+    return TestClient(main.app)
+
+def new_upload(client, size=10):
+    return client.post("/uploads", json={"filename": "ep.wav", "size": size}).json()["upload_id"]
+
+def put(client, uid, body, content_range=None, **headers):
+    if content_range:
+        headers["Content-Range"] = content_range
+    return client.put(f"/uploads/{uid}", content=body, headers=headers)
+
+def test_chunks_append_in_order(client):
+    uid = new_upload(client)
+    assert put(client, uid, b"01234", "bytes 0-4/10").json()["offset"] == 5
+    assert put(client, uid, b"56789", "bytes 5-9/10").json()["offset"] == 10
+    assert client.get(f"/uploads/{uid}").json()["offset"] == 10
+
+def test_wrong_start_returns_resume_offset(client):
+    uid = new_upload(client)
+    put(client, uid, b"01234", "bytes 0-4/10")
+    r = put(client, uid, b"01234", "bytes 0-4/10")
+    assert r.status_code == 409
+    assert r.json()["detail"] == {"offset": 5}
+
+@pytest.mark.parametrize("content_range, status", [
+    ("bytes 0-4/12", 400),    # total differs from the declared size
+    ("bytes 5-0/10", 400),    # end before start
+    ("bytes 0-10/10", 416),   # past the end of the upload
+    ("bytes=0-4/10", 400),    # malformed
+])
+def test_bad_content_range_is_rejected_before_writing(client, content_range, status):
+    uid = new_upload(client)
+    assert put(client, uid, b"01234", content_range).status_code == status
+    assert client.get(f"/uploads/{uid}").json()["offset"] == 0
+
+@pytest.mark.parametrize("body", [b"0123", b"012345"])
+def test_body_must_match_content_range(client, body):
+    uid = new_upload(client)
+    assert put(client, uid, body, "bytes 0-4/10").status_code == 400
+    assert client.get(f"/uploads/{uid}").json()["offset"] == 0
+
+def test_upload_offset_is_capped_at_declared_size(client):
+    uid = new_upload(client, size=4)
+    assert put(client, uid, b"0123456", **{"Upload-Offset": "0"}).status_code == 400
+    assert client.get(f"/uploads/{uid}").json()["offset"] == 0
+    assert put(client, uid, b"0123", **{"Upload-Offset": "0"}).json()["offset"] == 4
+
+def test_oversized_chunked_body_is_dropped(client):
+    # No Content-Length: the cap is enforced while streaming and the partial write is truncated away.
+    uid = new_upload(client)
+    assert put(client, uid, iter([b"012", b"345"]), "bytes 0-4/10").status_code == 400
+    assert client.get(f"/uploads/{uid}").json()["offset"] == 0
+    assert put(client, uid, iter([b"012", b"34"]), "bytes 0-4/10").json()["offset"] == 5
+
+def test_concurrent_chunk_is_refused_while_one_is_being_written(client):
+    uid = new_upload(client)
+    held = storage.partial_open_locked(uid)
+    try:
+        r = put(client, uid, b"01234", "bytes 0-4/10")
+        assert r.status_code == 409 and r.json()["detail"]["busy"]
+        assert client.post(f"/uploads/{uid}/complete").status_code == 409
+    finally:
+        held.close()
+    assert put(client, uid, b"01234", "bytes 0-4/10").json()["offset"] == 5
+
+def test_offset_is_rechecked_under_the_lock(client, monkeypatch):
+    # A PUT that read the offset before another one appended must not append the same range again.
+    uid = new_upload(client)
+    put(client, uid, b"01234", "bytes 0-4/10")
+    stale = {**storage.partial_info(uid), "offset": 0}
+    monkeypatch.setattr(main, "partial_info", lambda upload_id: stale)
+    r = put(client, uid, b"01234", "bytes 0-4/10")
+    assert r.status_code == 409 and r.json()["detail"] == {"offset": 5}
+    assert storage.partial_info(uid)["offset"] == 5
+
+def test_abandoned_uploads_expire(client, monkeypatch):
+    import os, time
+    old = new_upload(client)
+    put(client, old, b"01", "bytes 0-1/10")
+    for p in storage.partial_paths(old):
+        os.utime(p, (time.time() - 3 * 86400,) * 2)
+    monkeypatch.setattr(storage.settings, "upload_partial_ttl_h", 24.0)
+    fresh = new_upload(client)
+    assert client.get(f"/uploads/{old}").status_code == 404
+    assert client.get(f"/uploads/{fresh}").status_code == 200
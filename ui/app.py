@@ -1,11 +1,61 @@
-import os, time, requests
+import json, os, time, requests
 import streamlit as st
 
 API_BASE = os.getenv("PUBLIC_API_URL", "http://localhost:8000").rstrip("/")
+CHUNK = int(os.getenv("UPLOAD_CHUNK_MB", "16")) * 1024 * 1024
+
+def upload_resumable(f, langs: str) -> requests.Response:
+    # Ranged PUTs against /uploads; on a dropped chunk, ask the API for its offset and carry on from there.
+    size = f.size
+    up = requests.post(f"{API_BASE}/uploads", json={"filename": f.name, "size": size, "target_langs": langs}, timeout=30).json()
+    uid, offset = up["upload_id"], 0
+    bar = st.progress(0.0, text="Uploading…")
+    failures = 0
+    while offset < size:
+        f.seek(offset)
+        chunk = f.read(CHUNK)
+        end = offset + len(chunk) - 1
+        try:
+            r = requests.put(f"{API_BASE}/uploads/{uid}", data=chunk,
+                             headers={"Content-Range": f"bytes {offset}-{end}/{size}"}, timeout=300)
+            r.raise_for_status()
+            offset, failures = r.json()["offset"], 0
+        except requests.RequestException:
+            failures += 1
+            if failures > 5:
+                raise
+            time.sleep(min(2 ** failures, 30))
+            offset = requests.get(f"{API_BASE}/uploads/{uid}", timeout=30).json()["offset"]
+        bar.progress(offset / size if size else 1.0, text=f"Uploading… {offset // (1024 * 1024)} / {size // (1024 * 1024)} MB")
+    return requests.post(f"{API_BASE}/uploads/{uid}/complete", timeout=60)
+
+def watch(jid: str, ph):
+    # Server-sent events: one long-lived request per watched job instead of polling every few seconds.
+    state = {}
+    with requests.get(f"{API_BASE}/jobs/{jid}/events", stream=True, timeout=(10, 60)) as r:
+        r.raise_for_status()
+        for line in r.iter_lines(decode_unicode=True):
+            if not line or not line.startswith("data: "):
+                continue
+            ev = json.loads(line[len("data: "):])
+            if ev["type"] == "snapshot":
+                state = ev["job"]
+            elif ev["type"] == "status":
+                state["status"] = ev["status"]
+                state["error"] = ev.get("error")
+            elif ev["type"] == "progress":
+                state["progress"] = ev["progress"]
+            elif ev["type"] == "end":
+                # The API sends this once the job is DONE or FAILED, then closes the stream.
+                state["status"] = ev["status"]
+                ph.json(state)
+                return state
+            ph.json(state)
+    return state
 
 st.set_page_config(page_title="Subtitle AI MVP", layout="wide")
-st.title("Subtitle AI MVP — EN Transcription + FA Subtitles")
-st.caption("Upload an episode → get English & Persian SRT + QA report + TM updates.")
+st.title("Subtitle AI MVP — EN Transcription + Translated Subtitles")
+st.caption("Upload an episode → get English SRT plus one SRT, QA report and TM update per target language.")
 
 with st.sidebar:
     st.subheader("API")
@@ -17,8 +67,14 @@ tab1, tab2 = st.tabs(["Upload & Run", "Track Jobs"])
 with tab1:
     st.subheader("Upload")
     f = st.file_uploader("Audio/Video file", type=None)
-    if f and st.button("Start"):
-        r = requests.post(f"{API_BASE}/jobs", files={"file": (f.name, f.getvalue())}, timeout=600)
+    src = st.text_input("…or a server path / URL (file already on shared storage)").strip()
+    langs = st.text_input("Target languages (comma-separated)", value="fa").strip()
+    if (f or src) and st.button("Start"):
+        if f:
+            r = upload_resumable(f, langs)
+        else:
+            key = "url" if src.startswith(("http://", "https://")) else "path"
+            r = requests.post(f"{API_BASE}/jobs/ingest", json={key: src, "target_langs": langs}, timeout=60)
         if r.status_code != 200:
             st.error(r.text)
         else:
@@ -28,38 +84,42 @@ with tab1:
 
     st.markdown("---")
     jid = st.text_input("Job ID", value=st.session_state.get("job_id",""))
-    auto = st.checkbox("Auto-refresh", value=True)
+    auto = st.checkbox("Live updates", value=True)
     if jid:
         ph = st.empty()
-        while auto:
-            s = requests.get(f"{API_BASE}/jobs/{jid}", timeout=30).json()
-            ph.json(s)
-            if s.get("status") == "DONE":
-                st.success("DONE ✅ Download below.")
-                break
-            time.sleep(5)
+        if auto:
+            try:
+                final = watch(jid, ph)
+                if final.get("status") == "DONE":
+                    st.success("DONE ✅ Download below.")
+                elif final.get("status") == "FAILED":
+                    st.error(f"FAILED: {final.get('error') or 'see GET /jobs/<id>'}")
+            except requests.RequestException as e:
+                st.warning(f"Live updates interrupted ({e}); untick and re-tick to reconnect.")
+        else:
+            ph.json(requests.get(f"{API_BASE}/jobs/{jid}", timeout=30).json())
 
-        c1,c2,c3,c4 = st.columns(4)
-        def download(kind, label):
+        def download(kind, label, lang=""):
             url = f"{API_BASE}/jobs/{jid}/download/{kind}"
-            rr = requests.get(url, timeout=60)
+            rr = requests.get(url, params={"lang": lang} if lang else None, timeout=60)
             if rr.status_code == 200:
-                st.download_button(label, rr.content, file_name=f"{jid}_{kind}")
+                st.download_button(label, rr.content, file_name=f"{jid}_{lang + '_' if lang else ''}{kind}", key=f"dl_{kind}_{lang}")
             else:
                 st.caption(f"{label}: not ready")
-        with c1: download("en_srt","English SRT")
-        with c2: download("fa_srt","Persian SRT")
-        with c3: download("qa_report","QA report")
-        with c4: download("librarian","Librarian report")
+        download("en_srt", "English SRT")
+        job_langs = requests.get(f"{API_BASE}/jobs/{jid}", timeout=30).json().get("target_langs") or ["fa"]
+        for lang in job_langs:
+            c1, c2, c3 = st.columns(3)
+            with c1: download("srt", f"{lang.upper()} SRT", lang)
+            with c2: download("qa_report", f"{lang.upper()} QA report", lang)
+            with c3: download("librarian", f"{lang.upper()} librarian report", lang)
 
 with tab2:
     st.subheader("Track multiple jobs")
     ids = st.text_area("One job_id per line")
     if st.button("Check"):
-        out = []
-        for jid in [x.strip() for x in ids.splitlines() if x.strip()]:
-            try:
-                out.append(requests.get(f"{API_BASE}/jobs/{jid}", timeout=30).json())
-            except Exception as e:
-                out.append({"job_id": jid, "status": "error", "error": str(e)})
-        st.json(out)
+        job_ids = [x.strip() for x in ids.splitlines() if x.strip()]
+        if job_ids:
+            # One request (and two queries) for the whole list.
+            r = requests.get(f"{API_BASE}/jobs", params={"ids": ",".join(job_ids)}, timeout=30)
+            st.json(r.json() if r.status_code == 200 else {"error": r.text})